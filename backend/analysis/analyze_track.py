@@ -4,20 +4,44 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import math
+import os
+import shutil
+import tempfile
+import uuid
 from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
+from functools import cached_property
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import librosa
 import numpy as np
+import scipy.fft
+import soundfile as sf
+import soxr
+from scipy.ndimage import uniform_filter1d
+
+try:
+    from . import decode, profile_format, timings
+except ImportError:  # executed as a script
+    import decode  # type: ignore
+    import profile_format  # type: ignore
+    import timings  # type: ignore
 
 BASE_DIR = Path(__file__).resolve().parent
 DEFAULT_DATA_DIR = BASE_DIR.parent / "data"
+# Internal caches, indexes and metrics; kept apart from the publicly served data dir
+DEFAULT_STATE_DIR = Path(os.environ.get("ANALYSIS_STATE_DIR") or BASE_DIR.parent / "var")
 
 
+# Bump whenever analysis output changes so cached profiles are not reused
+ANALYSIS_VERSION = "local-1.1"
+
 # Analysis constants
 HOP_LENGTH = 512
 SEGMENT_MIN_DURATION = 0.08  # seconds
@@ -25,6 +49,17 @@ DEFAULT_TIME_SIGNATURE = 4
 TATUMS_PER_BEAT = 3
 SILENCE_DB = -60.0
 MIN_SECTION_DURATION = 2.0
+SECTION_MIN_CELLS_PER_SECTION = 4  # below this many beats per section, pool on a fixed grid
+SECTION_GRID_SECONDS = 0.5
+SECTION_SMOOTHING_CELLS = 4 * DEFAULT_TIME_SIGNATURE
+MFCC_COEFFICIENTS = 20
+# Inputs at least this long are decoded block-wise (see stream_features)
+STREAM_MIN_SECONDS = 10 * 60.0
+STREAM_BLOCK_FRAMES = 2048  # ~24 s per block at 44.1 kHz
+STREAM_CONTEXT_FRAMES = 128  # audio read either side of a block for the CQT's long filters
+STREAM_N_FFT = 2048  # librosa's default window for rms / mel features
+CHROMA_BINS_PER_OCTAVE = 36  # librosa.feature.chroma_cqt's CQT resolution
+STFT_CHROMA_BINS = 12  # chroma_stft estimates tuning against its 12 chroma bins
 
 CANON_CONTEXT_BEATS = 5
 CANON_SIMILARITY_THRESHOLD = 0.50
@@ -32,21 +67,203 @@ CANON_MIN_PHASE_ALIGNMENT = 0.70
 CANON_MIN_PAIRS = 6
 CANON_TOP_CANDIDATES = 8
 
+# Peak bytes the canon similarity backend may hold in row tiles at once
+CANON_SSM_MEMORY_BUDGET = 64 * 1024 * 1024
+LOOP_CANDIDATE_BLOCK_ROWS = 512
 
-@dataclass
-class Quantum:
-    start: float
-    duration: float
-    confidence: float
+# Eternal jukebox loop graph
+LOOP_MIN_SPAN = 8
+LOOP_THRESHOLDS = (0.76, 0.65, 0.55)  # tight -> medium -> loose
+LOOP_MAX_CANDIDATES_PER_BEAT = 16
+LOOP_TIMBRE_WEIGHT = 0.7
+# Preview profiles (see progressive.py) skip canon and keep a sparser loop graph
+PREVIEW_LOOP_MAX_CANDIDATES_PER_BEAT = 4
 
-    def as_dict(self) -> Dict[str, float]:
+# Threads for the independent post-beat stages; "auto" follows the CPU quota
+STAGE_WORKERS_ENV = "ANALYSIS_STAGE_WORKERS"
+
+# Bump a stage's version when its output changes; later stages key on it too
+STAGE_VERSIONS = {
+    "features": 1,
+    "beats": 1,
+    "sections": 2,
+    "segments": 1,
+    "canon": 1,
+    "loops": 1,
+}
+
+
+
+@dataclass(frozen=True)
+class AnalysisPreset:
+    """A named speed / resolution trade-off for the framewise features.
+
+    ``sample_rate`` of ``None`` keeps the file's native rate; ``streaming``
+    of ``None`` streams inputs of at least ``STREAM_MIN_SECONDS``.
+    """
+
+    name: str
+    sample_rate: Optional[int]
+    hop_length: int
+    chroma: str  # "cqt" | "stft"
+    streaming: Optional[bool] = None
+
+    def parameters(self) -> Dict[str, object]:
         return {
-            "start": float(self.start),
-            "duration": float(self.duration),
-            "confidence": float(self.confidence),
+            "preset": self.name,
+            "sample_rate": self.sample_rate,
+            "hop_length": self.hop_length,
+            "chroma": self.chroma,
+            "streaming": self.streaming,
         }
 
 
+ANALYSIS_PRESETS = {
+    # 22.05 kHz and a 512-sample hop (twice standard's frame period for 44.1 kHz
+    # input), STFT chroma instead of the CQT
+    "fast": AnalysisPreset("fast", 22050, 512, "stft"),
+    "standard": AnalysisPreset("standard", None, HOP_LENGTH, "cqt"),
+    # standard features, always decoded whole so long inputs match exactly
+    "hq": AnalysisPreset("hq", None, HOP_LENGTH, "cqt", streaming=False),
+}
+DEFAULT_PRESET = "standard"
+RESAMPLE_TYPE = "soxr_hq"
+
+
+def get_preset(name: Optional[str] = None) -> AnalysisPreset:
+    """Look up a preset by name (``None`` -> ``DEFAULT_PRESET``)."""
+    preset = ANALYSIS_PRESETS.get(name or DEFAULT_PRESET)
+    if preset is None:
+        raise ValueError(f"Unknown analysis preset {name!r}; expected one of {', '.join(ANALYSIS_PRESETS)}")
+    return preset
+
+
+def analysis_version(preset: Optional[str] = None) -> str:
+    """The ``analysis.version`` written by ``preset``, e.g. ``local-1.1+fast``."""
+    return f"{ANALYSIS_VERSION}+{get_preset(preset).name}"
+
+
+def analysis_parameters(preset: Optional[str] = None) -> Dict[str, object]:
+    """Settings that determine a profile's content; part of every cache key."""
+    settings = get_preset(preset)
+    return {
+        "version": ANALYSIS_VERSION,
+        **settings.parameters(),
+        "mfcc_coefficients": MFCC_COEFFICIENTS,
+        "segment_min_duration": SEGMENT_MIN_DURATION,
+        "time_signature": DEFAULT_TIME_SIGNATURE,
+        "tatums_per_beat": TATUMS_PER_BEAT,
+        "min_section_duration": MIN_SECTION_DURATION,
+        "canon_context_beats": CANON_CONTEXT_BEATS,
+        "canon_similarity_threshold": CANON_SIMILARITY_THRESHOLD,
+        "canon_min_phase_alignment": CANON_MIN_PHASE_ALIGNMENT,
+        "canon_min_pairs": CANON_MIN_PAIRS,
+        "canon_top_candidates": CANON_TOP_CANDIDATES,
+        "loop_min_span": LOOP_MIN_SPAN,
+        "loop_thresholds": list(LOOP_THRESHOLDS),
+        "loop_max_candidates_per_beat": LOOP_MAX_CANDIDATES_PER_BEAT,
+        "loop_timbre_weight": LOOP_TIMBRE_WEIGHT,
+        "stages": STAGE_VERSIONS,
+    }
+
+
+class Quantum:
+    """One section, bar, beat or tatum: a view into a row of ``Quanta``."""
+
+    __slots__ = ("_quanta", "_index")
+
+    def __init__(self, quanta: "Quanta", index: int) -> None:
+        self._quanta = quanta
+        self._index = index
+
+    @property
+    def start(self) -> float:
+        return float(self._quanta.start[self._index])
+
+    @start.setter
+    def start(self, value: float) -> None:
+        self._quanta.start[self._index] = value
+
+    @property
+    def duration(self) -> float:
+        return float(self._quanta.duration[self._index])
+
+    @duration.setter
+    def duration(self, value: float) -> None:
+        self._quanta.duration[self._index] = value
+
+    @property
+    def confidence(self) -> float:
+        return float(self._quanta.confidence[self._index])
+
+    @confidence.setter
+    def confidence(self, value: float) -> None:
+        self._quanta.confidence[self._index] = value
+
+    def as_dict(self) -> Dict[str, float]:
+        return {"start": self.start, "duration": self.duration, "confidence": self.confidence}
+
+    def __repr__(self) -> str:
+        return f"Quantum(start={self.start!r}, duration={self.duration!r}, confidence={self.confidence!r})"
+
+
+class Quanta:
+    """Sections, bars, beats or tatums as parallel float64 columns.
+
+    Stages compute on the ``start``/``duration``/``confidence`` arrays directly;
+    indexing and iteration yield ``Quantum`` views for code that wants one
+    object per beat. ``confidence`` may be a scalar shared by every row.
+    """
+
+    __slots__ = ("start", "duration", "confidence")
+
+    def __init__(self, start, duration, confidence) -> None:
+        self.start = np.array(start, dtype=np.float64).reshape(-1)
+        self.duration = np.array(duration, dtype=np.float64).reshape(-1)
+        self.confidence = np.array(np.broadcast_to(confidence, self.start.shape), dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def __getitem__(self, index: int) -> Quantum:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return Quantum(self, index % len(self))
+
+    def __iter__(self) -> Iterator[Quantum]:
+        return (Quantum(self, idx) for idx in range(len(self)))
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.start + self.duration
+
+    def as_dicts(self) -> List[Dict[str, float]]:
+        """The Echo Nest ``{start, duration, confidence}`` rows of the profile."""
+        return [
+            {"start": start, "duration": duration, "confidence": confidence}
+            for start, duration, confidence in zip(
+                self.start.tolist(), self.duration.tolist(), self.confidence.tolist()
+            )
+        ]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {"start": self.start, "duration": self.duration, "confidence": self.confidence}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "Quanta":
+        return cls(arrays["start"], arrays["duration"], arrays["confidence"])
+
+
+def _quanta_column(quanta: Sequence, name: str) -> np.ndarray:
+    """Column ``name`` of ``Quanta``, a sequence of ``Quantum`` or profile dicts."""
+    if isinstance(quanta, Quanta):
+        return getattr(quanta, name)
+    return np.array(
+        [q.get(name, 0.0) if isinstance(q, dict) else getattr(q, name) for q in quanta],
+        dtype=np.float64,
+    )
+
+
 def normalize(values: np.ndarray) -> np.ndarray:
     """Scale values into [0, 1] with safe fallback."""
     if values.size == 0:
@@ -58,106 +275,550 @@ def normalize(values: np.ndarray) -> np.ndarray:
     return (values - vmin) / (vmax - vmin)
 
 
-def compute_beats(y: np.ndarray, sr: int) -> Tuple[List[Quantum], np.ndarray, float]:
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=HOP_LENGTH)
+def _frame_ranges(
+    frame_starts: np.ndarray,
+    frame_ends: np.ndarray,
+    n_frames: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Clamp [start, end) frame ranges so each covers at least one valid frame."""
+    starts = np.clip(np.asarray(frame_starts, dtype=np.int64), 0, max(n_frames - 1, 0))
+    ends = np.maximum(starts + 1, np.minimum(np.asarray(frame_ends, dtype=np.int64), n_frames))
+    return starts, ends
+
+
+def _segment_reduce(
+    ufunc: np.ufunc,
+    values: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+) -> np.ndarray:
+    """Apply ``ufunc.reduceat`` over [start, end) ranges along the last (frame) axis."""
+    values = np.asarray(values, dtype=np.float64)
+    pad = [(0, 0)] * (values.ndim - 1) + [(0, 1)]
+    padded = np.pad(values, pad)
+    bounds = np.column_stack((starts, ends)).ravel()
+    return ufunc.reduceat(padded, bounds, axis=-1)[..., ::2]
+
+
+def _segment_mean_std(
+    values: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-range mean and population std along the frame axis."""
+    counts = (ends - starts).astype(np.float64)
+    mean = _segment_reduce(np.add, values, starts, ends) / counts
+    squares = _segment_reduce(np.add, np.square(values, dtype=np.float64), starts, ends) / counts
+    return mean, np.sqrt(np.maximum(squares - mean * mean, 0.0))
+
+
+def _segment_percentile(
+    values: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    q: float,
+) -> np.ndarray:
+    """Per-range percentile of a 1-D signal (numpy's default linear method)."""
+    counts = ends - starts
+    segment_ids = np.repeat(np.arange(counts.size), counts)
+    frame_idx = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(segment_ids.size)
+    gathered = np.asarray(values, dtype=np.float64)[frame_idx]
+    ordered = gathered[np.lexsort((gathered, segment_ids))]
+
+    offsets = np.cumsum(counts) - counts
+    position = (q / 100.0) * (counts - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    weight = position - lower
+    low_vals = ordered[offsets + lower]
+    high_vals = ordered[offsets + upper]
+    diff = high_vals - low_vals
+    # same two-sided lerp as numpy for bit-for-bit agreement
+    return np.where(weight >= 0.5, high_vals - diff * (1 - weight), low_vals + diff * weight)
+
+
+class FeatureBank:
+    """Framewise features for one track, computed lazily and shared by every stage.
+
+    All features use the same hop length, so each one (CQT chroma in particular)
+    is extracted at most once per track no matter how many stages consume it.
+    ``chroma`` picks the chroma extractor: ``"cqt"`` or the cheaper ``"stft"``.
+    A bank restored with ``from_arrays`` or built by ``stream_features`` has no
+    waveform; every feature a stage reads is already populated.
+    """
+
+    PERSISTED = ("duration", "loudness", "chroma", "onset_envelope", "rms", "_mfcc_full")
+
+    def __init__(
+        self,
+        y: Optional[np.ndarray],
+        sr: int,
+        hop_length: int = HOP_LENGTH,
+        chroma: str = "cqt",
+    ) -> None:
+        self.y = y
+        self.sr = sr
+        self.hop_length = hop_length
+        self.chroma_mode = chroma
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "FeatureBank":
+        bank = cls(None, int(arrays["sr"]), int(arrays["hop_length"]))
+        for name in cls.PERSISTED:
+            bank.__dict__[name] = arrays[name]
+        bank.__dict__["duration"] = float(arrays["duration"])
+        bank.__dict__["loudness"] = float(arrays["loudness"])
+        return bank
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {name: np.asarray(getattr(self, name)) for name in self.PERSISTED}
+        arrays["sr"] = np.asarray(self.sr)
+        arrays["hop_length"] = np.asarray(self.hop_length)
+        return arrays
+
+    @cached_property
+    def duration(self) -> float:
+        return float(librosa.get_duration(y=self.y, sr=self.sr))
+
+    @cached_property
+    def loudness(self) -> float:
+        """Mean sample level in dB (the profile's global loudness)."""
+        return float(np.mean(librosa.amplitude_to_db(np.abs(self.y), ref=1.0)))
+
+    @cached_property
+    def chroma(self) -> np.ndarray:
+        if self.chroma_mode == "stft":
+            return librosa.feature.chroma_stft(y=self.y, sr=self.sr, hop_length=self.hop_length)
+        return librosa.feature.chroma_cqt(y=self.y, sr=self.sr, hop_length=self.hop_length)
+
+    @cached_property
+    def onset_envelope(self) -> np.ndarray:
+        return librosa.onset.onset_strength(y=self.y, sr=self.sr, hop_length=self.hop_length)
+
+    @cached_property
+    def rms(self) -> np.ndarray:
+        return librosa.feature.rms(y=self.y, hop_length=self.hop_length)[0]
+
+    @cached_property
+    def _mfcc_full(self) -> np.ndarray:
+        return librosa.feature.mfcc(
+            y=self.y, sr=self.sr, n_mfcc=MFCC_COEFFICIENTS, hop_length=self.hop_length
+        )
+
+    def mfcc(self, n_mfcc: int = 13) -> np.ndarray:
+        """Leading ``n_mfcc`` coefficients (identical to a direct ``n_mfcc`` extraction)."""
+        if n_mfcc > MFCC_COEFFICIENTS:
+            raise ValueError(f"n_mfcc must be <= {MFCC_COEFFICIENTS}")
+        return self._mfcc_full[:n_mfcc]
+
+    @cached_property
+    def mfcc_delta(self) -> np.ndarray:
+        return librosa.feature.delta(self._mfcc_full)
+
+
+def load_features(
+    audio_path: Path,
+    streaming: Optional[bool] = None,
+    preset: Optional[str] = None,
+) -> FeatureBank:
+    """Decode ``audio_path`` (mono, at the preset's sample rate) into a fresh FeatureBank.
+
+    Inputs of at least ``STREAM_MIN_SECONDS`` (or any input with
+    ``streaming=True``) go through ``stream_features`` when soundfile can
+    read them, so the waveform is never held in memory as a whole.
+    ``streaming`` defaults to the preset's own setting. Otherwise the samples
+    come memory-mapped from the shared PCM cache (see decode.py).
+    """
+    settings = get_preset(preset)
+    if streaming is None:
+        streaming = settings.streaming
+    if streaming is not False:
+        try:
+            info = sf.info(str(audio_path))
+        except (RuntimeError, sf.LibsndfileError):
+            info = None  # not readable block-wise (e.g. m4a); decode in one go
+        if info is not None and (streaming or info.duration >= STREAM_MIN_SECONDS):
+            return stream_features(
+                audio_path,
+                hop_length=settings.hop_length,
+                chroma=settings.chroma,
+                sample_rate=settings.sample_rate,
+            )
+    try:
+        audio = decode.decode(audio_path, sample_rate=settings.sample_rate)
+    except decode.DecodeError:
+        y, sr = librosa.load(audio_path, sr=settings.sample_rate, mono=True, res_type=RESAMPLE_TYPE)
+        return FeatureBank(y, sr, settings.hop_length, settings.chroma)
+    return FeatureBank(audio.as_float(), audio.sr, settings.hop_length, settings.chroma)
+
+
+def _resample_file(audio_path: Path, sample_rate: int, output_path: Path, block_size: int = 1 << 18) -> Path:
+    """Write a mono float WAV copy of ``audio_path`` at ``sample_rate``, one block at a time."""
+    with sf.SoundFile(str(audio_path)) as source, sf.SoundFile(
+        str(output_path), "w", samplerate=sample_rate, channels=1, subtype="FLOAT"
+    ) as sink:
+        stream = soxr.ResampleStream(source.samplerate, sample_rate, 1, dtype="float32", quality="HQ")
+        for block in source.blocks(blocksize=block_size, dtype="float32", always_2d=True):
+            sink.write(stream.resample_chunk(block.mean(axis=1)))
+        sink.write(stream.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+    return output_path
+
+
+def _read_mono(source: sf.SoundFile, start: int, stop: int) -> np.ndarray:
+    """Samples [start, stop) as mono float32, zero-filled outside the file."""
+    out = np.zeros(stop - start, dtype=np.float32)
+    lo, hi = max(start, 0), min(stop, source.frames)
+    if hi > lo:
+        source.seek(lo)
+        block = source.read(hi - lo, dtype="float32", always_2d=True)
+        out[lo - start:lo - start + len(block)] = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+    return out
+
+
+def _stream_blocks(
+    source: sf.SoundFile,
+    block_frames: int,
+    hop_length: int,
+) -> Iterator[Tuple[int, np.ndarray, np.ndarray, np.ndarray]]:
+    """``(n_frames, chunk, core, windowed)`` per block of ``block_frames`` centred frames.
+
+    ``chunk`` carries ``STREAM_CONTEXT_FRAMES`` of audio either side of the
+    block, ``core`` only the block's own samples, and ``windowed`` half an FFT
+    window either side so ``center=False`` framing reproduces librosa's
+    centred frames.
+    """
+    context = STREAM_CONTEXT_FRAMES * hop_length
+    half_window = STREAM_N_FFT // 2
+    n_frames = 1 + source.frames // hop_length
+    for first in range(0, n_frames, block_frames):
+        count = min(block_frames, n_frames - first)
+        start = first * hop_length
+        chunk = _read_mono(source, start - context, start + (count - 1) * hop_length + context)
+        core = chunk[context:context + max(0, min(count * hop_length, source.frames - start))]
+        windowed = chunk[context - half_window:context + (count - 1) * hop_length + half_window]
+        yield count, chunk, core, windowed
+
+
+def stream_features(
+    audio_path: Path,
+    block_frames: int = STREAM_BLOCK_FRAMES,
+    hop_length: int = HOP_LENGTH,
+    chroma: str = "cqt",
+    sample_rate: Optional[int] = None,
+) -> FeatureBank:
+    """Build a FeatureBank by decoding ``audio_path`` ``block_frames`` frames at a time.
+
+    Only the compact feature matrices are kept, so peak memory does not grow
+    with track length. Two passes are made over the file: the first gathers
+    what librosa takes from the whole signal (the sample and mel peaks behind
+    the 80 dB floors, and the CQT tuning estimate), the second extracts the
+    framewise features. Each block is read with ``STREAM_CONTEXT_FRAMES`` of
+    audio either side (zeros past the file edges, like librosa's centred
+    framing), so features match a whole-file extraction away from the edges.
+    When ``sample_rate`` differs from the file's, the audio is first resampled
+    block-wise into a temporary file, which is then streamed.
+    """
+    if sample_rate is not None and sf.info(str(audio_path)).samplerate != sample_rate:
+        with tempfile.TemporaryDirectory(prefix="stream-") as scratch:
+            resampled = _resample_file(audio_path, sample_rate, Path(scratch) / "resampled.wav")
+            return stream_features(resampled, block_frames, hop_length, chroma)
+
+    # chroma_stft estimates tuning on the power spectrum, chroma_cqt on the magnitude
+    tuning_power, bins_per_octave = (2, STFT_CHROMA_BINS) if chroma == "stft" else (1, CHROMA_BINS_PER_OCTAVE)
+    tuning_bins = np.linspace(-0.5, 0.5, int(np.ceil(1.0 / 0.01)) + 1)
+    tuning_counts = np.zeros(tuning_bins.size - 1, dtype=np.int64)
+    sample_peak = 0.0
+    mel_peak = -np.inf
+
+    with sf.SoundFile(str(audio_path)) as source:
+        sr, n_samples = source.samplerate, source.frames
+        print(f"[Analysis] Streaming {n_samples / sr:.0f}s of audio in blocks of {block_frames} frames", flush=True)
+
+        for _, _, core, windowed in _stream_blocks(source, block_frames, hop_length):
+            if core.size:
+                sample_peak = max(sample_peak, float(np.max(np.abs(core))))
+            magnitude = np.abs(librosa.stft(windowed, n_fft=STREAM_N_FFT, hop_length=hop_length, center=False))
+            mel = librosa.feature.melspectrogram(S=magnitude ** 2, sr=sr)
+            mel_peak = max(mel_peak, float(librosa.power_to_db(mel, top_db=None).max()))
+            # librosa.estimate_tuning, with its median threshold taken per block
+            pitch, mag = librosa.piptrack(
+                S=magnitude ** tuning_power, sr=sr, n_fft=STREAM_N_FFT, hop_length=hop_length
+            )
+            voiced = pitch > 0
+            if voiced.any():
+                selected = pitch[(mag >= np.median(mag[voiced])) & voiced]
+                residual = np.mod(bins_per_octave * librosa.hz_to_octs(selected), 1.0)
+                residual[residual >= 0.5] -= 1.0
+                tuning_counts += np.histogram(residual, tuning_bins)[0]
+        tuning = float(tuning_bins[np.argmax(tuning_counts)]) if tuning_counts.any() else 0.0
+
+        loudness_floor = 20.0 * np.log10(max(sample_peak, 1e-5)) - 80.0
+        loudness_sum = 0.0
+        chroma_blocks, mfcc, rms, flux = [], [], [], []
+        previous_mel: Optional[np.ndarray] = None
+        for count, chunk, core, windowed in _stream_blocks(source, block_frames, hop_length):
+            db = 20.0 * np.log10(np.maximum(np.abs(core, dtype=np.float64), 1e-5))
+            loudness_sum += float(np.maximum(db, loudness_floor).sum())
+
+            if chroma == "stft":
+                chroma_blocks.append(
+                    librosa.feature.chroma_stft(
+                        y=windowed, sr=sr, n_fft=STREAM_N_FFT, hop_length=hop_length, center=False, tuning=tuning
+                    )
+                )
+            else:
+                # CQT filters reach well past one frame: analyse the whole chunk, then trim
+                block_chroma = librosa.feature.chroma_cqt(y=chunk, sr=sr, hop_length=hop_length, tuning=tuning)
+                chroma_blocks.append(block_chroma[:, STREAM_CONTEXT_FRAMES:STREAM_CONTEXT_FRAMES + count])
+
+            rms.append(
+                librosa.feature.rms(y=windowed, frame_length=STREAM_N_FFT, hop_length=hop_length, center=False)[0]
+            )
+            mel = librosa.feature.melspectrogram(
+                y=windowed, sr=sr, n_fft=STREAM_N_FFT, hop_length=hop_length, center=False
+            )
+            mel = librosa.power_to_db(mel, top_db=None)
+            mel = np.maximum(mel, mel_peak - 80.0)
+            mfcc.append(scipy.fft.dct(mel, axis=0, type=2, norm="ortho")[:MFCC_COEFFICIENTS])
+            # onset strength: mean positive change between consecutive mel frames
+            joined = mel if previous_mel is None else np.hstack((previous_mel, mel))
+            flux.append(np.mean(np.maximum(0.0, np.diff(joined, axis=1)), axis=0))
+            previous_mel = mel[:, -1:]
+
+    n_frames = 1 + n_samples // hop_length
+    # same lag / centring shift librosa.onset.onset_strength applies
+    shift = 1 + STREAM_N_FFT // (2 * hop_length)
+    bank = FeatureBank(None, sr, hop_length, chroma)
+    bank.__dict__["duration"] = n_samples / float(sr)
+    bank.__dict__["loudness"] = loudness_sum / max(n_samples, 1)
+    bank.__dict__["chroma"] = np.hstack(chroma_blocks)
+    bank.__dict__["rms"] = np.concatenate(rms)
+    bank.__dict__["_mfcc_full"] = np.hstack(mfcc)
+    bank.__dict__["onset_envelope"] = np.concatenate(
+        (np.zeros(shift, dtype=np.float32), np.concatenate(flux).astype(np.float32))
+    )[:n_frames]
+    return bank
+
+
+def _file_digest(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as source:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StageStore:
+    """Per-track ``.npz`` files holding each analysis stage's output.
+
+    Every file carries a key hashed from the stage version, the parameters the
+    stage reads and the keys of its inputs, so changing e.g. a canon constant
+    invalidates canon (and anything downstream of it) while decode, beats and
+    segments are reloaded as-is. ``directory=None`` disables persistence.
+    ``run`` times each stage on ``profiler`` when one is given.
+    """
+
+    def __init__(self, directory: Optional[Path], profiler: Optional[timings.StageProfiler] = None) -> None:
+        self.directory = Path(directory) if directory is not None else None
+        self.profiler = profiler
+
+    @staticmethod
+    def key(stage: str, params: Dict[str, object], *inputs: str) -> str:
+        payload = {
+            "stage": stage,
+            "version": STAGE_VERSIONS[stage],
+            "params": params,
+            "inputs": list(inputs),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def path(self, stage: str) -> Path:
+        return self.directory / f"{stage}.npz"
+
+    def load(self, stage: str, key: str) -> Optional[Dict[str, np.ndarray]]:
+        if self.directory is None or not self.path(stage).is_file():
+            return None
+        try:
+            with np.load(self.path(stage), allow_pickle=False) as stored:
+                if str(stored["__key__"]) != key:
+                    return None
+                return {name: stored[name] for name in stored.files if name != "__key__"}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, stage: str, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        if self.directory is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / f".{stage}.{uuid.uuid4().hex}.tmp"
+        with tmp_path.open("wb") as sink:
+            np.savez_compressed(sink, __key__=np.asarray(key), **arrays)
+        os.replace(tmp_path, self.path(stage))
+
+    @staticmethod
+    def discard(output_path: Path) -> None:
+        """Delete the stages stored for the profile at ``output_path`` once it is replaced or evicted."""
+        shutil.rmtree(Path(output_path).with_suffix(".stages"), ignore_errors=True)
+
+    def run(
+        self,
+        stage: str,
+        key: str,
+        compute: Callable[[], object],
+        encode: Callable[[object], Dict[str, np.ndarray]],
+        decode: Callable[[Dict[str, np.ndarray]], object],
+    ):
+        """Return the stored output for ``key`` or compute, persist and return it."""
+        timer = self.profiler.stage(stage) if self.profiler is not None else nullcontext()
+        with timer as timing:
+            arrays = self.load(stage, key)
+            if arrays is not None:
+                print(f"[Analysis] Reusing stored {stage} stage", flush=True)
+                if timing is not None:
+                    timing.cached = True
+                return decode(arrays)
+            result = compute()
+            self.save(stage, key, encode(result))
+            return result
+
+
+_SEGMENT_SCALARS = ("start", "duration", "confidence", "loudness_start", "loudness_max", "loudness_max_time")
+
+
+def _segments_to_arrays(segments: List[Dict[str, object]]) -> Dict[str, np.ndarray]:
+    arrays = {
+        name: np.array([seg[name] for seg in segments], dtype=np.float64)
+        for name in _SEGMENT_SCALARS
+    }
+    for name in ("pitches", "timbre"):
+        arrays[name] = np.array([seg[name] for seg in segments], dtype=np.float64).reshape(len(segments), -1)
+    return arrays
+
+
+def _segments_from_arrays(arrays: Dict[str, np.ndarray]) -> List[Dict[str, object]]:
+    columns = [arrays[name].tolist() for name in _SEGMENT_SCALARS]
+    columns += [arrays["pitches"].tolist(), arrays["timbre"].tolist()]
+    return [
+        dict(zip(_SEGMENT_SCALARS + ("pitches", "timbre"), row))
+        for row in zip(*columns)
+    ]
+
+
+def _json_to_arrays(document: object) -> Dict[str, np.ndarray]:
+    """Nested stage outputs (canon map, loop graph) are stored as one JSON string."""
+    return {"json": np.asarray(json.dumps(document))}
+
+
+def _json_from_arrays(arrays: Dict[str, np.ndarray]) -> object:
+    return json.loads(str(arrays["json"]))
+
+
+def compute_beats(features: FeatureBank) -> Tuple[Quanta, np.ndarray, float]:
+    sr = features.sr
+    onset_env = features.onset_envelope
     tempo, beat_frames = librosa.beat.beat_track(
-        onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH
+        onset_envelope=onset_env, sr=sr, hop_length=features.hop_length
     )
     tempo = float(np.atleast_1d(tempo)[0])
-    beat_times = librosa.frames_to_time(beat_frames, sr=sr, hop_length=HOP_LENGTH)
+    beat_times = librosa.frames_to_time(beat_frames, sr=sr, hop_length=features.hop_length)
     strengths = onset_env[beat_frames] if beat_frames.size else np.array([])
-    confidences = normalize(strengths) if strengths.size else np.array([])
-
-    duration = librosa.get_duration(y=y, sr=sr)
-    beats = []
-    for idx, start in enumerate(beat_times):
-        end = (
-            beat_times[idx + 1]
-            if idx + 1 < len(beat_times)
-            else duration
-        )
-        beats.append(
-            Quantum(
-                start=start,
-                duration=max(end - start, 1e-5),
-                confidence=float(confidences[idx] if idx < len(confidences) else 0.7),
-            )
-        )
+    confidences = np.full(len(beat_times), 0.7)
+    if strengths.size:
+        confidences[: strengths.size] = normalize(strengths)
+
+    # each beat lasts until the next one, the last until the end of the track
+    ends = np.append(beat_times[1:], features.duration)[: len(beat_times)]
+    beats = Quanta(beat_times, np.maximum(ends - beat_times, 1e-5), confidences)
     return beats, beat_times, tempo
 
 
 def derive_bars(
-    beats: List[Quantum],
+    beats: Quanta,
     beat_times: np.ndarray,
     duration: float,
     time_signature: int = DEFAULT_TIME_SIGNATURE,
-) -> List[Quantum]:
-    bars: List[Quantum] = []
-    for i in range(0, len(beats), time_signature):
-        start = beats[i].start
-        if i + time_signature < len(beats):
-            end = beats[i + time_signature].start
-        else:
-            end = duration
-        conf_slice = [b.confidence for b in beats[i : i + time_signature]]
-        confidence = float(np.mean(conf_slice)) if conf_slice else 0.7
-        bars.append(
-            Quantum(
-                start=start,
-                duration=max(end - start, 1e-5),
-                confidence=confidence,
-            )
-        )
-    return bars
+) -> Quanta:
+    starts = beats.start[::time_signature]
+    ends = np.append(beats.start[time_signature::time_signature], duration)[: len(starts)]
+    # mean beat confidence per bar; the last bar may be incomplete
+    full_bars = len(beats) // time_signature
+    confidence = np.empty(len(starts))
+    confidence[:full_bars] = beats.confidence[: full_bars * time_signature].reshape(full_bars, time_signature).mean(axis=1)
+    if len(starts) > full_bars:
+        confidence[full_bars:] = beats.confidence[full_bars * time_signature :].mean()
+    return Quanta(starts, np.maximum(ends - starts, 1e-5), confidence)
 
 
 def derive_tatums(
-    beats: List[Quantum],
+    beats: Quanta,
     duration: float,
     tatums_per_beat: int = TATUMS_PER_BEAT,
-) -> List[Quantum]:
-    tatums: List[Quantum] = []
-    for beat in beats:
-        step = beat.duration / tatums_per_beat
-        for sub in range(tatums_per_beat):
-            start = beat.start + sub * step
-            end = start + step if sub < tatums_per_beat - 1 else beat.start + beat.duration
-            tatums.append(
-                Quantum(
-                    start=start,
-                    duration=max(end - start, 1e-5),
-                    confidence=beat.confidence,
-                )
-            )
+) -> Quanta:
+    step = beats.duration / tatums_per_beat
+    starts = beats.start[:, None] + np.arange(tatums_per_beat)[None, :] * step[:, None]
+    ends = starts + step[:, None]
+    ends[:, -1] = beats.start + beats.duration
+    tatums = Quanta(
+        starts.ravel(),
+        np.maximum(ends - starts, 1e-5).ravel(),
+        np.repeat(beats.confidence, tatums_per_beat),
+    )
     # ensure final tatum hits track end
-    if tatums:
-        tatums[-1].duration = max(duration - tatums[-1].start, 1e-5)
+    if len(tatums):
+        tatums.duration[-1] = max(duration - tatums.start[-1], 1e-5)
     return tatums
 
 
+def _section_cells(
+    features: FeatureBank,
+    beats: Sequence[Quantum],
+    min_cells: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Start frames and start times of the cells sections are clustered on.
+
+    One cell per beat of the shared grid (plus the lead-in before the first
+    beat); a fixed ``SECTION_GRID_SECONDS`` grid when there are too few beats.
+    """
+    n_frames = features.chroma.shape[1]
+    if len(beats) >= min_cells:
+        times = np.append(0.0, _quanta_column(beats, "start"))
+    else:
+        times = np.arange(0.0, max(features.duration, SECTION_GRID_SECONDS), SECTION_GRID_SECONDS)
+    frames = librosa.time_to_frames(times, sr=features.sr, hop_length=features.hop_length)
+    frames, first = np.unique(np.clip(frames, 0, n_frames - 1), return_index=True)
+    return frames, times[first]
+
+
 def estimate_sections(
-    y: np.ndarray,
-    sr: int,
+    features: FeatureBank,
     duration: float,
     desired_sections: int,
-    bars: List[Quantum],
-) -> List[Quantum]:
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=HOP_LENGTH)
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, hop_length=HOP_LENGTH)
-    features = np.vstack(
-        (librosa.util.normalize(chroma), librosa.util.normalize(mfcc))
+    bars: Quanta,
+    beats: Sequence[Quantum] = (),
+) -> Quanta:
+    # Cluster beat-synchronous means rather than raw frames: a few hundred
+    # columns instead of tens of thousands, with boundaries on beats
+    n_frames = features.chroma.shape[1]
+    cell_frames, cell_times = _section_cells(features, beats, SECTION_MIN_CELLS_PER_SECTION * desired_sections)
+    starts, ends = _frame_ranges(cell_frames, np.append(cell_frames[1:], n_frames), n_frames)
+    counts = (ends - starts).astype(np.float64)
+    pooled = np.vstack(
+        (
+            _segment_reduce(np.add, librosa.util.normalize(features.chroma), starts, ends) / counts,
+            _segment_reduce(np.add, librosa.util.normalize(features.mfcc(13)), starts, ends) / counts,
+        )
     )
 
-    n_frames = features.shape[1]
-    k = max(2, min(desired_sections, n_frames))
-    labels = librosa.segment.agglomerative(features.T, k=k)
-    boundaries = [0]
-    for idx in range(1, len(labels)):
-        if labels[idx] != labels[idx - 1]:
-            boundaries.append(idx)
-    boundaries.append(n_frames - 1)
-    boundaries = sorted(set(boundaries))
-    raw_times = librosa.frames_to_time(boundaries, sr=sr, hop_length=HOP_LENGTH)
+    # standardise each feature so chroma and MFCC weigh alike, then smooth
+    # over a few bars so clusters follow sections rather than single beats
+    pooled = (pooled - pooled.mean(axis=1, keepdims=True)) / (pooled.std(axis=1, keepdims=True) + 1e-8)
+    pooled = uniform_filter1d(pooled, SECTION_SMOOTHING_CELLS, axis=1, mode="nearest")
+
+    n_cells = pooled.shape[1]
+    k = max(2, min(desired_sections, n_cells))
+    # agglomerative() returns the first cell of each of the k segments
+    boundaries = librosa.segment.agglomerative(pooled, k=k) if n_cells > k else np.arange(n_cells)
+    raw_times = sorted(set([0.0] + cell_times[boundaries].tolist())) + [duration]
     times: List[float] = [0.0]
     for idx in range(1, len(raw_times)):
         current = float(raw_times[idx])
@@ -168,133 +829,119 @@ def estimate_sections(
         times.append(current)
     if times[-1] < duration:
         times.append(duration)
-    sections: List[Quantum] = []
+    starts: List[float] = []
+    durations: List[float] = []
     for idx, start in enumerate(times[:-1]):
-        end = times[idx + 1]
-        duration = max(float(end - start), 1e-5)
-        new_section = Quantum(
-            start=float(start),
-            duration=duration,
-            confidence=1.0,
-        )
-        if sections and new_section.duration < MIN_SECTION_DURATION:
+        length = max(float(times[idx + 1] - start), 1e-5)
+        if starts and length < MIN_SECTION_DURATION:
             # merge into previous section
-            prev = sections[-1]
-            prev_end = prev.start + prev.duration
-            prev.duration = max(prev_end, new_section.start + new_section.duration) - prev.start
+            durations[-1] = max(starts[-1] + durations[-1], start + length) - starts[-1]
         else:
-            sections.append(new_section)
+            starts.append(float(start))
+            durations.append(length)
     # pad last section to end if needed
-    if sections:
-        last = sections[-1]
-        last.duration = max(duration - last.start, 1e-5)
-    if len(sections) >= max(2, desired_sections // 2):
-        return sections
+    if starts:
+        durations[-1] = max(duration - starts[-1], 1e-5)
+    if len(starts) >= max(2, desired_sections // 2):
+        return Quanta(starts, durations, 1.0)
 
     # Fallback: derive sections from bar groups
-    if not bars:
-        return [Quantum(0.0, duration, 1.0)]
+    if not len(bars):
+        return Quanta([0.0], [duration], 1.0)
 
     target_sections = max(2, min(desired_sections, len(bars)))
     bars_per_section = max(1, len(bars) // target_sections)
-    fallback_sections: List[Quantum] = []
-    idx = 0
-    while idx < len(bars):
-        bar = bars[idx]
-        start = float(bar.start if idx > 0 else 0.0)
-        end_idx = min(len(bars) - 1, idx + bars_per_section - 1)
-        end_bar = bars[end_idx]
-        end = float(end_bar.start + end_bar.duration)
-        fallback_sections.append(
-            Quantum(
-                start=start,
-                duration=max(end - start, 1e-5),
-                confidence=0.8,
-            )
-        )
-        idx += bars_per_section
-
-    if fallback_sections:
-        fallback_sections[-1].duration = max(
-            duration - fallback_sections[-1].start, 1e-5
-        )
-    return fallback_sections or [Quantum(0.0, duration, 1.0)]
+    first = np.arange(0, len(bars), bars_per_section)
+    last = np.minimum(len(bars) - 1, first + bars_per_section - 1)
+    fallback_starts = bars.start[first].copy()
+    fallback_starts[0] = 0.0
+    fallback_durations = np.maximum(bars.start[last] + bars.duration[last] - fallback_starts, 1e-5)
+    fallback_durations[-1] = max(duration - fallback_starts[-1], 1e-5)
+    return Quanta(fallback_starts, fallback_durations, 0.8)
 
 
 def compute_segments(
-    y: np.ndarray,
-    sr: int,
+    features: FeatureBank,
     duration: float,
 ) -> List[Dict[str, object]]:
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=HOP_LENGTH)
+    sr = features.sr
+    hop_length = features.hop_length
+    onset_env = features.onset_envelope
     onset_frames = librosa.onset.onset_detect(
         onset_envelope=onset_env,
         sr=sr,
-        hop_length=HOP_LENGTH,
+        hop_length=hop_length,
         backtrack=True,
     )
 
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, hop_length=HOP_LENGTH)
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=HOP_LENGTH)
-    rms = librosa.feature.rms(y=y, hop_length=HOP_LENGTH)[0]
+    mfcc = features.mfcc(13)
+    chroma = features.chroma
+    rms = features.rms
 
     boundaries: List[int] = [0]
     boundaries.extend(sorted(set(int(b) for b in onset_frames)))
-    end_frame = int(math.ceil(duration * sr / HOP_LENGTH))
+    end_frame = int(math.ceil(duration * sr / hop_length))
     boundaries.append(end_frame)
     boundaries = sorted(boundaries)
 
-    onset_strength_norm = normalize(onset_env)
-    segments: List[Dict[str, object]] = []
-    for start_frame, end_frame in zip(boundaries[:-1], boundaries[1:]):
-        if end_frame <= start_frame:
-            end_frame = start_frame + 1
-        start_time = librosa.frames_to_time(start_frame, sr=sr, hop_length=HOP_LENGTH)
-        end_time = librosa.frames_to_time(end_frame, sr=sr, hop_length=HOP_LENGTH)
-        duration_sec = max(end_time - start_time, SEGMENT_MIN_DURATION)
-
-        frame_slice = slice(start_frame, end_frame)
-        seg_mfcc = mfcc[:, frame_slice]
-        seg_chroma = chroma[:, frame_slice]
-        seg_rms = rms[frame_slice]
-        seg_onset_strength = onset_strength_norm[frame_slice]
-
-        if seg_mfcc.size == 0:
-            seg_mfcc = mfcc[:, start_frame : start_frame + 1]
-        if seg_chroma.size == 0:
-            seg_chroma = chroma[:, start_frame : start_frame + 1]
-        if seg_rms.size == 0:
-            seg_rms = np.array([0.0])
-        if seg_onset_strength.size == 0:
-            seg_onset_strength = np.array([0.5])
-
-        timbre = np.mean(seg_mfcc[1:13, :], axis=1)
-        pitches = np.mean(seg_chroma, axis=1)
-        pitches = pitches / np.sum(pitches) if np.sum(pitches) > 0 else pitches
-
-        loudness = librosa.amplitude_to_db(seg_rms, ref=1.0)
-        loud_start = float(loudness[0]) if loudness.size else SILENCE_DB
-        max_idx = int(np.argmax(loudness)) if loudness.size else 0
-        loud_max = float(loudness[max_idx]) if loudness.size else SILENCE_DB
-        loud_max_time = (
-            librosa.frames_to_time(start_frame + max_idx, sr=sr, hop_length=HOP_LENGTH)
-            - start_time
-        )
+    bounds = np.asarray(boundaries, dtype=np.int64)
+    seg_start_frames = bounds[:-1]
+    seg_end_frames = np.maximum(bounds[1:], seg_start_frames + 1)
+    start_times = librosa.frames_to_time(seg_start_frames, sr=sr, hop_length=hop_length)
+    end_times = librosa.frames_to_time(seg_end_frames, sr=sr, hop_length=hop_length)
+    durations = np.maximum(end_times - start_times, SEGMENT_MIN_DURATION)
+
+    starts, ends = _frame_ranges(seg_start_frames, seg_end_frames, mfcc.shape[1])
+    timbre, _ = _segment_mean_std(mfcc[1:13], starts, ends)
+
+    starts, ends = _frame_ranges(seg_start_frames, seg_end_frames, chroma.shape[1])
+    pitches, _ = _segment_mean_std(chroma, starts, ends)
+    pitch_sums = np.sum(pitches, axis=0)
+    pitches = np.divide(pitches, pitch_sums, out=pitches, where=pitch_sums > 0)
+
+    # amplitude_to_db clips at (segment max - top_db), so convert framewise
+    # without the clip and apply it per segment below
+    starts, ends = _frame_ranges(seg_start_frames, seg_end_frames, rms.shape[0])
+    top_db = 80.0
+    loudness = librosa.amplitude_to_db(rms, ref=1.0, top_db=None).astype(np.float64)
+    loud_max = _segment_reduce(np.maximum, loudness, starts, ends)
+    loud_start = np.maximum(loudness[starts], loud_max - top_db)
+    counts = ends - starts
+    offsets = np.cumsum(counts) - counts
+    local = np.arange(int(counts.sum())) - np.repeat(offsets, counts)
+    frame_idx = np.repeat(starts, counts) + local
+    is_max = loudness[frame_idx] == np.repeat(loud_max, counts)
+    max_idx = np.minimum.reduceat(np.where(is_max, local, np.iinfo(np.int64).max), offsets)
+    loud_max_times = (
+        librosa.frames_to_time(seg_start_frames + max_idx, sr=sr, hop_length=hop_length)
+        - start_times
+    )
 
-        confidence = float(np.mean(seg_onset_strength))
+    starts, ends = _frame_ranges(seg_start_frames, seg_end_frames, onset_env.shape[0])
+    confidences, _ = _segment_mean_std(normalize(onset_env), starts, ends)
 
-        segments.append(
-            {
-                "start": float(start_time),
-                "duration": float(duration_sec),
-                "confidence": confidence,
-                "loudness_start": loud_start,
-                "loudness_max": loud_max,
-                "loudness_max_time": float(max(loud_max_time, 0.0)),
-                "pitches": [float(v) for v in pitches.tolist()],
-                "timbre": [float(v) for v in timbre.tolist()],
-            }
+    segments: List[Dict[str, object]] = [
+        {
+            "start": start,
+            "duration": seg_duration,
+            "confidence": confidence,
+            "loudness_start": l_start,
+            "loudness_max": l_max,
+            "loudness_max_time": max(l_max_time, 0.0),
+            "pitches": seg_pitches,
+            "timbre": seg_timbre,
+        }
+        for start, seg_duration, confidence, l_start, l_max, l_max_time, seg_pitches, seg_timbre in zip(
+            start_times.tolist(),
+            durations.tolist(),
+            confidences.tolist(),
+            loud_start.tolist(),
+            loud_max.tolist(),
+            loud_max_times.tolist(),
+            pitches.T.tolist(),
+            timbre.T.tolist(),
         )
+    ]
 
     # force final segment to land exactly on track end
     if segments:
@@ -330,20 +977,6 @@ def estimate_key(chroma: np.ndarray) -> Tuple[int, int]:
     return minor_key, 0
 
 
-def _safe_slice_2d(matrix: np.ndarray, start: int, end: int) -> np.ndarray:
-    n_frames = matrix.shape[1]
-    start = max(0, min(start, n_frames - 1))
-    end = max(start + 1, min(end, n_frames))
-    return matrix[:, start:end]
-
-
-def _safe_slice_1d(vector: np.ndarray, start: int, end: int) -> np.ndarray:
-    n_frames = vector.shape[0]
-    start = max(0, min(start, n_frames - 1))
-    end = max(start + 1, min(end, n_frames))
-    return vector[start:end]
-
-
 @dataclass
 class BeatContext:
     index: int
@@ -354,114 +987,200 @@ class BeatContext:
 
 
 def _stack_beat_features(
-    y: np.ndarray,
-    sr: int,
+    features: FeatureBank,
     beat_times: Sequence[float],
     duration: float,
     beats_per_bar: int,
-    hop_length: int,
     context_window: int,
 ) -> Tuple[np.ndarray, List[BeatContext]]:
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=hop_length)
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=20, hop_length=hop_length)
-    mfcc_delta = librosa.feature.delta(mfcc)
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
-    rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
-
-    beat_boundaries = np.append(np.asarray(beat_times), float(duration))
-    beat_frames = librosa.time_to_frames(beat_boundaries, sr=sr, hop_length=hop_length)
-
-    contexts: List[BeatContext] = []
-    base_vectors: List[np.ndarray] = []
-    for idx, start in enumerate(beat_times):
-        end = float(beat_boundaries[idx + 1])
-        phase = idx % beats_per_bar
-
-        frame_start = int(beat_frames[idx])
-        frame_end = int(beat_frames[idx + 1])
-
-        chroma_slice = _safe_slice_2d(chroma, frame_start, frame_end)
-        mfcc_slice = _safe_slice_2d(mfcc, frame_start, frame_end)
-        mfcc_delta_slice = _safe_slice_2d(mfcc_delta, frame_start, frame_end)
-        onset_slice = _safe_slice_1d(onset_env, frame_start, frame_end)
-        rms_slice = _safe_slice_1d(rms, frame_start, frame_end)
-
-        chroma_mean = np.mean(chroma_slice, axis=1)
-        chroma_std = np.std(chroma_slice, axis=1)
-        mfcc_mean = np.mean(mfcc_slice, axis=1)
-        mfcc_std = np.std(mfcc_slice, axis=1)
-        mfcc_delta_mean = np.mean(mfcc_delta_slice, axis=1)
-
-        onset_stats = np.array(
-            [
-                float(np.mean(onset_slice)),
-                float(np.max(onset_slice)),
-                float(np.percentile(onset_slice, 90)),
-            ]
-        )
-        rms_stats = np.array(
-            [
-                float(np.mean(rms_slice)),
-                float(np.max(rms_slice)),
-                float(np.std(rms_slice)),
-            ]
-        )
-        beat_duration = np.array([float(end - start)])
-
-        base_vec = np.concatenate(
-            (
-                chroma_mean,
-                chroma_std,
-                mfcc_mean,
-                mfcc_std,
-                mfcc_delta_mean,
-                onset_stats,
-                rms_stats,
-                beat_duration,
-            )
-        )
-        base_vectors.append(base_vec)
-        contexts.append(
-            BeatContext(
-                index=idx,
-                start=float(start),
-                duration=float(end - start),
-                phase=phase,
-                normalized_vector=np.zeros_like(base_vec),
-            )
+    chroma = features.chroma
+    mfcc = features.mfcc(MFCC_COEFFICIENTS)
+    mfcc_delta = features.mfcc_delta
+    onset_env = features.onset_envelope
+    rms = features.rms
+
+    beat_times = np.asarray(beat_times, dtype=np.float64)
+    beat_boundaries = np.append(beat_times, float(duration))
+    beat_frames = librosa.time_to_frames(
+        beat_boundaries, sr=features.sr, hop_length=features.hop_length
+    )
+    frame_starts = beat_frames[:-1]
+    frame_ends = beat_frames[1:]
+
+    starts, ends = _frame_ranges(frame_starts, frame_ends, chroma.shape[1])
+    chroma_mean, chroma_std = _segment_mean_std(chroma, starts, ends)
+
+    starts, ends = _frame_ranges(frame_starts, frame_ends, mfcc.shape[1])
+    mfcc_mean, mfcc_std = _segment_mean_std(mfcc, starts, ends)
+
+    starts, ends = _frame_ranges(frame_starts, frame_ends, mfcc_delta.shape[1])
+    mfcc_delta_mean, _ = _segment_mean_std(mfcc_delta, starts, ends)
+
+    starts, ends = _frame_ranges(frame_starts, frame_ends, onset_env.shape[0])
+    onset_mean, _ = _segment_mean_std(onset_env, starts, ends)
+    onset_max = _segment_reduce(np.maximum, onset_env, starts, ends)
+    onset_p90 = _segment_percentile(onset_env, starts, ends, 90)
+
+    starts, ends = _frame_ranges(frame_starts, frame_ends, rms.shape[0])
+    rms_mean, rms_std = _segment_mean_std(rms, starts, ends)
+    rms_max = _segment_reduce(np.maximum, rms, starts, ends)
+
+    beat_durations = beat_boundaries[1:] - beat_times
+
+    base_matrix = np.column_stack(
+        (
+            chroma_mean.T,
+            chroma_std.T,
+            mfcc_mean.T,
+            mfcc_std.T,
+            mfcc_delta_mean.T,
+            onset_mean,
+            onset_max,
+            onset_p90,
+            rms_mean,
+            rms_max,
+            rms_std,
+            beat_durations,
         )
-
-    base_matrix = np.vstack(base_vectors)
+    )
     mean = np.mean(base_matrix, axis=0)
     std = np.std(base_matrix, axis=0)
     std[std == 0] = 1.0
     normalized = (base_matrix - mean) / std
 
-    feature_dim = normalized.shape[1]
-    zero_vec = np.zeros(feature_dim, dtype=np.float32)
-    stacked_rows: List[np.ndarray] = []
-    for idx, context in enumerate(contexts):
-        context.normalized_vector = normalized[idx]
-        window_vectors = []
-        for offset in range(context_window):
-            source = idx - (context_window - 1 - offset)
-            if source < 0:
-                window_vectors.append(zero_vec)
-            else:
-                window_vectors.append(normalized[source])
-        stacked_rows.append(np.concatenate(window_vectors))
-
-    stacked_matrix = np.vstack(stacked_rows)
+    # each row stacks the previous context_window beats (zero-padded) oldest first
+    n_beats, feature_dim = normalized.shape
+    padded = np.vstack((np.zeros((context_window - 1, feature_dim)), normalized))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, context_window, axis=0)
+    stacked_matrix = windows.transpose(0, 2, 1).reshape(n_beats, context_window * feature_dim)
+
+    contexts = [
+        BeatContext(
+            index=idx,
+            start=float(beat_times[idx]),
+            duration=float(beat_durations[idx]),
+            phase=idx % beats_per_bar,
+            normalized_vector=normalized[idx],
+        )
+        for idx in range(n_beats)
+    ]
     return stacked_matrix, contexts
 
 
-def _cosine_ssm(matrix: np.ndarray) -> np.ndarray:
-    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
-    norms[norms == 0] = 1.0
-    normalized = matrix / norms
-    ssm = np.clip(normalized @ normalized.T, -1.0, 1.0)
-    np.fill_diagonal(ssm, 1.0)
-    return ssm.astype(np.float32)
+def _skew_rows(block: np.ndarray, row_start: int, padded: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Re-index a block of SSM rows by diagonal: ``out[i, k] == ssm[row_start + i, row_start + i + k]``.
+
+    Entries that would fall past the last column are NaN. The result is a strided
+    view over a padded copy of the block, so no per-diagonal gathering is needed.
+    ``padded`` is a reusable ``(n_rows, 2 * n_cols)`` float64 buffer whose right
+    half is already NaN.
+    """
+    n_rows, n_cols = block.shape
+    if padded is None:
+        padded = np.full((n_rows, 2 * n_cols), np.nan, dtype=np.float64)
+    padded[:, :n_cols] = block
+    itemsize = padded.itemsize
+    return np.lib.stride_tricks.as_strided(
+        padded.reshape(-1)[row_start:],
+        shape=(n_rows, n_cols),
+        strides=((2 * n_cols + 1) * itemsize, itemsize),
+        writeable=False,
+    )
+
+
+class BlockedSimilarity:
+    """
+    Cosine self-similarity over beat context vectors, served in row tiles.
+
+    Canon alignment only reads diagonals, per-row rankings and scattered pairs,
+    so the dense N x N matrix is never built. Rows are produced in tiles sized
+    to keep peak working memory near ``memory_budget`` bytes; values match the
+    dense matrix (float64 cosine clipped to [-1, 1], unit diagonal, float32).
+    """
+
+    # Peak working bytes per tile cell, reached in diagonal_statistics while a
+    # tile is produced: its reused padded skew (16), float64 work (8) and
+    # threshold mask (1) buffers, plus the float64 product and its float32 copy
+    # (8 + 4). Loop candidates need less: the float32 tile and int64 argsort (12).
+    _BYTES_PER_CELL = 16 + 8 + 1 + 8 + 4
+
+    def __init__(self, matrix: np.ndarray, memory_budget: int = CANON_SSM_MEMORY_BUDGET) -> None:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self._normalized = matrix / norms
+        self.n_beats = int(matrix.shape[0])
+        per_row = max(1, self.n_beats) * self._BYTES_PER_CELL
+        self.block_rows = int(max(1, min(self.n_beats, memory_budget // per_row)))
+
+    def __len__(self) -> int:
+        return self.n_beats
+
+    def rows(self, start: int, stop: int) -> np.ndarray:
+        """Similarity rows ``start:stop`` as a float32 tile."""
+        stop = min(stop, self.n_beats)
+        tile = self._normalized[start:stop] @ self._normalized.T
+        np.clip(tile, -1.0, 1.0, out=tile)
+        local = np.arange(stop - start)
+        tile[local, local + start] = 1.0
+        return tile.astype(np.float32)
+
+    def row(self, idx: int) -> np.ndarray:
+        return self.rows(idx, idx + 1)[0]
+
+    def row_blocks(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield ``(start, tile)`` pairs covering every row within the memory budget."""
+        for start in range(0, self.n_beats, self.block_rows):
+            yield start, self.rows(start, start + self.block_rows)
+
+    def pairs(self, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        """Similarity for each (src[i], dst[i]) pair without touching full rows."""
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        values = np.einsum("ij,ij->i", self._normalized[src], self._normalized[dst])
+        values = np.clip(values, -1.0, 1.0)
+        values[src == dst] = 1.0
+        return values.astype(np.float32)
+
+    def diagonal(self, offset: int) -> np.ndarray:
+        """Equivalent of ``np.diag(ssm, k=offset)`` for ``offset >= 0``."""
+        if offset >= self.n_beats:
+            return np.zeros(0, dtype=np.float32)
+        idx = np.arange(self.n_beats - offset)
+        return self.pairs(idx, idx + offset)
+
+    def top_indices(self, idx: int, k: int) -> np.ndarray:
+        """Column indices of row ``idx`` ordered by descending similarity, first ``k``."""
+        return np.argsort(self.row(idx))[::-1][:k]
+
+    def diagonal_statistics(
+        self,
+        similarity_threshold: float,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return per-offset (sum, sum of squares, count >= threshold) over the upper diagonals."""
+        sums = np.zeros(self.n_beats, dtype=np.float64)
+        squares = np.zeros(self.n_beats, dtype=np.float64)
+        high = np.zeros(self.n_beats, dtype=np.int64)
+        # allocated once and reused by every tile, so the budget bounds the peak
+        padded = np.full((self.block_rows, 2 * self.n_beats), np.nan, dtype=np.float64)
+        work = np.empty((self.block_rows, self.n_beats), dtype=np.float64)
+        above = np.empty((self.block_rows, self.n_beats), dtype=bool)
+        for start in range(0, self.n_beats, self.block_rows):
+            tile = self.rows(start, start + self.block_rows)
+            n_rows = tile.shape[0]
+            skewed = _skew_rows(tile, start, padded[:n_rows])
+            del tile  # not kept alive while the next tile is built
+            np.greater_equal(skewed, similarity_threshold, out=above[:n_rows])
+            high += np.count_nonzero(above[:n_rows], axis=0)
+            values = work[:n_rows]
+            np.copyto(values, skewed)
+            # the NaN tail past the last column adds nothing (np.nan_to_num would allocate masks)
+            np.isnan(values, out=above[:n_rows])
+            np.copyto(values, 0.0, where=above[:n_rows])
+            sums += values.sum(axis=0)
+            np.multiply(values, values, out=values)
+            squares += values.sum(axis=0)
+        return sums, squares, high
 
 
 @dataclass
@@ -492,13 +1211,13 @@ class CanonCandidate:
 
 
 def _collect_canon_candidates(
-    ssm: np.ndarray,
+    similarity: BlockedSimilarity,
     offset_scores: Sequence[OffsetScore],
     similarity_threshold: float,
     min_pairs: int,
 ) -> List[CanonCandidate]:
     """Extract promising contiguous runs for candidate offsets."""
-    n_beats = ssm.shape[0]
+    n_beats = len(similarity)
     if n_beats == 0:
         return []
 
@@ -519,15 +1238,14 @@ def _collect_canon_candidates(
         if offset <= 0 or offset >= n_beats:
             continue
         if offset not in diag_cache:
-            diag_cache[offset] = np.diag(ssm, k=offset)
+            diag_cache[offset] = similarity.diagonal(offset)
         diag = diag_cache[offset]
         if diag.size < min_pairs:
             continue
         for thr in threshold_values:
             threshold = float(max(0.2, thr))
             runs = _detect_runs(
-                ssm=ssm,
-                offset=offset,
+                diag=diag,
                 threshold=threshold,
                 min_length=min_pairs,
             )
@@ -579,42 +1297,42 @@ def _collect_canon_candidates(
 
 
 def _evaluate_offsets(
-    ssm: np.ndarray,
+    similarity: BlockedSimilarity,
     contexts: Sequence[BeatContext],
     beats_per_bar: int,
     min_pairs: int,
     min_phase_alignment: float,
     similarity_threshold: float,
 ) -> List[OffsetScore]:
-    n_beats = ssm.shape[0]
+    n_beats = len(similarity)
     scores: List[OffsetScore] = []
-    for offset in range(1, n_beats):
-        diag = np.diag(ssm, k=offset)
-        if diag.size < min_pairs:
-            continue
-        phase_matches = 0
-        high_sim = 0
-        for idx, value in enumerate(diag):
-            src = idx
-            dst = idx + offset
-            if dst >= len(contexts):
-                break
-            if contexts[src].phase == contexts[dst].phase:
-                phase_matches += 1
-            if value >= similarity_threshold:
-                high_sim += 1
-        phase_alignment = phase_matches / diag.size
-        if phase_alignment < min_phase_alignment:
-            continue
-        high_ratio = high_sim / diag.size
+    if n_beats <= 1:
+        return scores
+
+    offsets = np.arange(1, n_beats)
+    lengths = n_beats - offsets
+    # beat phase is index % beats_per_bar, so every pair on a diagonal shares
+    # phase exactly when the offset is a whole number of bars
+    phase_alignment = (offsets % beats_per_bar == 0).astype(np.float64)
+    keep = (lengths >= min_pairs) & (phase_alignment >= min_phase_alignment)
+    if not np.any(keep):
+        return scores
+
+    sums, squares, high = similarity.diagonal_statistics(similarity_threshold)
+    means = sums[offsets] / lengths
+    variances = np.maximum(squares[offsets] / lengths - means * means, 0.0)
+    stds = np.sqrt(variances)
+    high_ratio = high[offsets] / lengths
+
+    for idx in np.flatnonzero(keep):
         scores.append(
             OffsetScore(
-                offset=offset,
-                mean=float(np.mean(diag)),
-                std=float(np.std(diag)),
-                length=int(diag.size),
-                phase_alignment=float(phase_alignment),
-                high_similarity_ratio=float(high_ratio),
+                offset=int(offsets[idx]),
+                mean=float(means[idx]),
+                std=float(stds[idx]),
+                length=int(lengths[idx]),
+                phase_alignment=float(phase_alignment[idx]),
+                high_similarity_ratio=float(high_ratio[idx]),
             )
         )
     scores.sort(key=lambda s: (s.mean - 0.4 * s.std, s.high_similarity_ratio), reverse=True)
@@ -622,12 +1340,10 @@ def _evaluate_offsets(
 
 
 def _detect_runs(
-    ssm: np.ndarray,
-    offset: int,
+    diag: np.ndarray,
     threshold: float,
     min_length: int,
 ) -> List[Tuple[int, int]]:
-    diag = np.diag(ssm, k=offset)
     runs: List[Tuple[int, int]] = []
     start: Optional[int] = None
     for idx, value in enumerate(diag):
@@ -645,14 +1361,15 @@ def _detect_runs(
 
 def _apply_canon_candidates(
     candidates: Sequence[CanonCandidate],
-    ssm: np.ndarray,
+    similarity: BlockedSimilarity,
     contexts: Sequence[BeatContext],
     min_phase_alignment: float,
     similarity_threshold: float,
     min_pairs: int,
 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Dict[str, object]]]:
     """Assign high-quality segments while keeping offsets contiguous."""
-    n_beats = ssm.shape[0]
+    n_beats = len(similarity)
+    phases = np.array([ctx.phase for ctx in contexts], dtype=np.int64)
     assignments = np.full(n_beats, -1, dtype=np.int32)
     pair_similarity = np.zeros(n_beats, dtype=np.float32)
     coverage = np.zeros(n_beats, dtype=bool)
@@ -666,22 +1383,18 @@ def _apply_canon_candidates(
         length = end - start
         if length < min_pairs:
             continue
-        idx_range = range(start, end)
-        unassigned = [idx for idx in idx_range if not coverage[idx]]
+        idx_range = np.arange(start, end)
+        unassigned = int(np.count_nonzero(~coverage[start:end]))
         if not unassigned:
             continue
-        coverage_ratio = len(unassigned) / float(length)
+        coverage_ratio = unassigned / float(length)
         # avoid tiny contributions from heavily assigned segments
         if coverage_ratio < 0.6:
             continue
-        sims: List[float] = []
-        phases = 0
-        for idx in idx_range:
-            dst = (idx + cand.offset) % n_beats
-            sims.append(float(ssm[idx, dst]))
-            if contexts[idx].phase == contexts[dst].phase:
-                phases += 1
-        phase_ratio = phases / float(length)
+        dst_range = (idx_range + cand.offset) % n_beats
+        pair_values = similarity.pairs(idx_range, dst_range)
+        sims = pair_values.astype(np.float64)
+        phase_ratio = np.count_nonzero(phases[idx_range] == phases[dst_range]) / float(length)
         if phase_ratio < min_phase_alignment:
             continue
         mean_sim = float(np.mean(sims))
@@ -690,11 +1403,9 @@ def _apply_canon_candidates(
         max_sim = float(np.max(sims))
         if mean_sim < similarity_threshold * 0.75 and max_sim < similarity_threshold:
             continue
-        for idx in idx_range:
-            dst = (idx + cand.offset) % n_beats
-            assignments[idx] = dst
-            pair_similarity[idx] = float(ssm[idx, dst])
-            coverage[idx] = True
+        assignments[idx_range] = dst_range
+        pair_similarity[idx_range] = pair_values
+        coverage[idx_range] = True
         segments.append(
             {
                 "start": int(start),
@@ -719,7 +1430,7 @@ def _fill_unassigned_ranges(
     assignments: np.ndarray,
     pair_similarity: np.ndarray,
     coverage: np.ndarray,
-    ssm: np.ndarray,
+    similarity: BlockedSimilarity,
     contexts: Sequence[BeatContext],
     offset_scores: Sequence[OffsetScore],
     similarity_threshold: float,
@@ -727,11 +1438,12 @@ def _fill_unassigned_ranges(
     min_pairs: int,
 ) -> List[Dict[str, object]]:
     """Fill remaining gaps by choosing the best offset per contiguous region."""
-    n_beats = ssm.shape[0]
+    n_beats = len(similarity)
     extra_segments: List[Dict[str, object]] = []
 
     if not n_beats:
         return extra_segments
+    phases = np.array([ctx.phase for ctx in contexts], dtype=np.int64)
 
     default_offset = offset_scores[0].offset if offset_scores else 1
     default_offset = max(1, min(default_offset, n_beats - 1))
@@ -761,8 +1473,7 @@ def _fill_unassigned_ranges(
             if 0 < score.offset < n_beats
         )
         # consider strong matches for the first beat in the range
-        row = ssm[start]
-        top_indices = np.argsort(row)[::-1][: min(10, n_beats)]
+        top_indices = similarity.top_indices(start, min(10, n_beats))
         for idx_candidate in top_indices:
             if idx_candidate == start:
                 continue
@@ -771,15 +1482,12 @@ def _fill_unassigned_ranges(
                 continue
             candidate_offsets.add(offset)
 
+        idx_range = np.arange(start, end)
         best_choice: Optional[Tuple[int, float, float, float, float, float]] = None
         for offset in candidate_offsets:
-            sims: List[float] = []
-            phase_matches = 0
-            for idx in range(start, end):
-                dst = (idx + offset) % n_beats
-                sims.append(float(ssm[idx, dst]))
-                if contexts[idx].phase == contexts[dst].phase:
-                    phase_matches += 1
+            dst_range = (idx_range + offset) % n_beats
+            sims = similarity.pairs(idx_range, dst_range).astype(np.float64)
+            phase_matches = np.count_nonzero(phases[idx_range] == phases[dst_range])
             phase_ratio = phase_matches / float(length)
             mean_sim = float(np.mean(sims))
             min_sim = float(np.min(sims))
@@ -808,11 +1516,9 @@ def _fill_unassigned_ranges(
 
         if best_choice is None:
             offset = default_offset
-            sims = [float(ssm[idx, (idx + offset) % n_beats]) for idx in range(start, end)]
-            phase_matches = sum(
-                1 for idx in range(start, end)
-                if contexts[idx].phase == contexts[(idx + offset) % n_beats].phase
-            )
+            dst_range = (idx_range + offset) % n_beats
+            sims = similarity.pairs(idx_range, dst_range).astype(np.float64)
+            phase_matches = np.count_nonzero(phases[idx_range] == phases[dst_range])
             phase_ratio = phase_matches / float(length)
             mean_sim = float(np.mean(sims))
             min_sim = float(np.min(sims))
@@ -820,11 +1526,10 @@ def _fill_unassigned_ranges(
         else:
             offset, _, mean_sim, min_sim, max_sim, phase_ratio = best_choice
 
-        for idx in range(start, end):
-            dst = (idx + offset) % n_beats
-            assignments[idx] = dst
-            pair_similarity[idx] = float(ssm[idx, dst])
-            coverage[idx] = True
+        dst_range = (idx_range + offset) % n_beats
+        assignments[idx_range] = dst_range
+        pair_similarity[idx_range] = similarity.pairs(idx_range, dst_range)
+        coverage[idx_range] = True
         extra_segments.append(
             {
                 "start": int(start),
@@ -845,49 +1550,49 @@ def _fill_unassigned_ranges(
 
 
 def _compute_loop_candidates(
-    ssm: np.ndarray,
+    similarity: BlockedSimilarity,
     contexts: Sequence[BeatContext],
     min_similarity: float,
     max_neighbors: int = 8,
 ) -> List[Dict[str, float]]:
     """Generate high-similarity edges to seed the jukebox jump graph."""
-    n_beats = ssm.shape[0]
+    n_beats = len(similarity)
     loop_edges: List[Dict[str, float]] = []
     if n_beats == 0:
         return loop_edges
 
     min_similarity = float(max(-1.0, min_similarity))
-    for src in range(n_beats):
-        row = ssm[src]
-        indices = np.argsort(row)[::-1]
-        added = 0
-        for dst in indices:
-            if dst == src:
-                continue
-            if abs(dst - src) <= 1:
-                continue
-            if contexts[src].phase != contexts[dst].phase:
-                continue
-            sim = float(row[dst])
-            if sim < min_similarity:
-                break
-            loop_edges.append(
-                {
-                    "source": int(src),
-                    "target": int(dst),
-                    "similarity": sim,
-                }
-            )
-            added += 1
-            if added >= max_neighbors:
-                break
+    for block_start, tile in similarity.row_blocks():
+        rankings = np.argsort(tile, axis=1)[:, ::-1]
+        for local, (row, indices) in enumerate(zip(tile, rankings)):
+            src = block_start + local
+            added = 0
+            for dst in indices:
+                if dst == src:
+                    continue
+                if abs(dst - src) <= 1:
+                    continue
+                if contexts[src].phase != contexts[dst].phase:
+                    continue
+                sim = float(row[dst])
+                if sim < min_similarity:
+                    break
+                loop_edges.append(
+                    {
+                        "source": int(src),
+                        "target": int(dst),
+                        "similarity": sim,
+                    }
+                )
+                added += 1
+                if added >= max_neighbors:
+                    break
     return loop_edges
 
 
 def compute_canon_alignment(
-    y: np.ndarray,
-    sr: int,
-    beats: List[Quantum],
+    features: FeatureBank,
+    beats: Quanta,
     duration: float,
     beats_per_bar: int = DEFAULT_TIME_SIGNATURE,
     context_window: int = CANON_CONTEXT_BEATS,
@@ -895,23 +1600,22 @@ def compute_canon_alignment(
     min_phase_alignment: float = CANON_MIN_PHASE_ALIGNMENT,
     min_pairs: int = CANON_MIN_PAIRS,
     top_candidates: int = CANON_TOP_CANDIDATES,
+    memory_budget: int = CANON_SSM_MEMORY_BUDGET,
 ) -> Optional[Dict[str, object]]:
     if len(beats) <= 1:
         return None
 
-    beat_times = [float(b.start) for b in beats]
+    beat_times = _quanta_column(beats, "start")
     stacked, contexts = _stack_beat_features(
-        y=y,
-        sr=sr,
+        features=features,
         beat_times=beat_times,
         duration=duration,
         beats_per_bar=beats_per_bar,
-        hop_length=HOP_LENGTH,
         context_window=context_window,
     )
-    ssm = _cosine_ssm(stacked)
+    similarity = BlockedSimilarity(stacked, memory_budget=memory_budget)
     offsets = _evaluate_offsets(
-        ssm=ssm,
+        similarity=similarity,
         contexts=contexts,
         beats_per_bar=beats_per_bar,
         min_pairs=min_pairs,
@@ -920,7 +1624,7 @@ def compute_canon_alignment(
     )
     n_beats = len(beats)
     loop_candidates = _compute_loop_candidates(
-        ssm=ssm,
+        similarity=similarity,
         contexts=contexts,
         min_similarity=similarity_threshold * 0.8,
     )
@@ -933,10 +1637,7 @@ def compute_canon_alignment(
             [(idx + fallback_offset) % n_beats for idx in range(n_beats)],
             dtype=np.int32,
         )
-        pair_similarity = np.array(
-            [float(ssm[idx, assignments[idx]]) for idx in range(n_beats)],
-            dtype=np.float32,
-        )
+        pair_similarity = similarity.pairs(np.arange(n_beats), assignments)
         transitions = [
             {
                 "source": int(idx),
@@ -972,14 +1673,14 @@ def compute_canon_alignment(
     default_offset = top[0].offset
 
     candidates = _collect_canon_candidates(
-        ssm=ssm,
+        similarity=similarity,
         offset_scores=top,
         similarity_threshold=similarity_threshold,
         min_pairs=min_pairs,
     )
     assignments, pair_similarity, coverage, primary_segments = _apply_canon_candidates(
         candidates=candidates,
-        ssm=ssm,
+        similarity=similarity,
         contexts=contexts,
         min_phase_alignment=min_phase_alignment,
         similarity_threshold=similarity_threshold,
@@ -989,7 +1690,7 @@ def compute_canon_alignment(
         assignments=assignments,
         pair_similarity=pair_similarity,
         coverage=coverage,
-        ssm=ssm,
+        similarity=similarity,
         contexts=contexts,
         offset_scores=top,
         similarity_threshold=similarity_threshold,
@@ -1002,12 +1703,12 @@ def compute_canon_alignment(
     n_beats = len(beats)
     if n_beats:
         fallback_offset = default_offset if default_offset > 0 else 1
-        for idx in range(n_beats):
-            if assignments[idx] < 0:
-                dst = (idx + fallback_offset) % n_beats
-                assignments[idx] = dst
-                pair_similarity[idx] = float(ssm[idx, dst])
-                coverage[idx] = True
+        missing = np.flatnonzero(assignments < 0)
+        if missing.size:
+            dst = (missing + fallback_offset) % n_beats
+            assignments[missing] = dst
+            pair_similarity[missing] = similarity.pairs(missing, dst)
+            coverage[missing] = True
     coverage_ratio = float(np.mean(coverage.astype(np.float32))) if n_beats else 0.0
 
     transition_candidates: Dict[int, List[Tuple[int, float]]] = defaultdict(list)
@@ -1031,10 +1732,8 @@ def compute_canon_alignment(
             )
 
     # Provide legacy run data for the primary offset
-    diag = np.diag(ssm, k=default_offset) if default_offset > 0 else np.array([])
     runs = _detect_runs(
-        ssm=ssm,
-        offset=default_offset,
+        diag=similarity.diagonal(default_offset),
         threshold=similarity_threshold,
         min_length=min_pairs,
     ) if default_offset > 0 else []
@@ -1136,58 +1835,139 @@ def compute_segment_similarity(seg1: Dict, seg2: Dict, timbre_weight: float = 0.
     return float(combined)
 
 
+def _beat_segment_overlaps(
+    beats: Quanta,
+    segments: List[Dict],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return parallel (beat_index, segment_index) arrays for every overlapping pair.
+
+    Pairs are grouped by beat in ascending order. Candidate ranges come from a
+    ``searchsorted`` over segment starts, so the cost is proportional to the
+    number of overlaps rather than beats x segments.
+    """
+    if not len(beats) or not segments:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    seg_starts = np.array([float(seg["start"]) for seg in segments], dtype=np.float64)
+    seg_ends = seg_starts + np.array(
+        [float(seg["duration"]) for seg in segments], dtype=np.float64
+    )
+    order = np.argsort(seg_starts, kind="stable")
+    sorted_starts = seg_starts[order]
+    sorted_ends = seg_ends[order]
+    # durations are clamped to SEGMENT_MIN_DURATION, so ends need not be monotonic
+    running_end = np.maximum.accumulate(sorted_ends)
+
+    beat_starts = _quanta_column(beats, "start")
+    beat_ends = beat_starts + _quanta_column(beats, "duration")
+    lo = np.searchsorted(running_end, beat_starts, side="right")
+    hi = np.searchsorted(sorted_starts, beat_ends, side="left")
+    counts = np.maximum(hi - lo, 0)
+
+    beat_idx = np.repeat(np.arange(len(beats)), counts)
+    offsets = np.arange(beat_idx.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    sorted_idx = np.repeat(lo, counts) + offsets
+    keep = sorted_ends[sorted_idx] > beat_starts[beat_idx]
+    return beat_idx[keep], order[sorted_idx[keep]]
+
+
+def _unit_rows(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Row-normalize ``matrix``; zero rows stay zero. Also returns the nonzero mask."""
+    norms = np.linalg.norm(matrix, axis=1)
+    valid = norms > 0
+    unit = np.zeros_like(matrix)
+    unit[valid] = matrix[valid] / norms[valid, None]
+    return unit, valid.astype(np.float64)
+
+
 def compute_beat_to_beat_similarity(
-    beats: List[Quantum],
+    beats: Quanta,
     segments: List[Dict],
+    timbre_weight: float = 0.7,
 ) -> np.ndarray:
     """
     Compute similarity matrix between beats based on their overlapping segments.
     Returns NxN matrix where N is number of beats.
+
+    Entry (i, j) is the mean of ``compute_segment_similarity`` over every pair of
+    segments overlapping beats i and j. That score is bilinear in per-segment unit
+    vectors, so the mean collapses to products of beat-pooled features: a couple
+    of (N x 12) @ (12 x N) GEMMs instead of a Python loop over segment pairs.
     """
     n_beats = len(beats)
     similarity_matrix = np.zeros((n_beats, n_beats), dtype=np.float32)
+    if n_beats == 0:
+        return similarity_matrix
+
+    beat_idx, seg_idx = _beat_segment_overlaps(beats, segments)
+    if beat_idx.size:
+        used = np.unique(seg_idx)
+        remap = np.full(len(segments), -1, dtype=np.int64)
+        remap[used] = np.arange(used.size)
+        used_segments = [segments[int(i)] for i in used]
+
+        timbre_rows = [seg.get("timbre", []) for seg in used_segments]
+        pitch_rows = [seg.get("pitches", []) for seg in used_segments]
+        # empty timbre zeroes a pair; empty pitches fall back to a neutral 0.5
+        has_timbre = np.array([len(row) > 0 for row in timbre_rows], dtype=np.float64)
+        has_pitch = np.array([len(row) > 0 for row in pitch_rows], dtype=np.float64)
+        timbre_dim = max((len(row) for row in timbre_rows), default=0)
+        pitch_dim = max((len(row) for row in pitch_rows), default=0)
+        timbre = np.array(
+            [row if len(row) else [0.0] * timbre_dim for row in timbre_rows],
+            dtype=np.float64,
+        ).reshape(len(used_segments), timbre_dim)
+        pitches = np.array(
+            [row if len(row) else [0.0] * pitch_dim for row in pitch_rows],
+            dtype=np.float64,
+        ).reshape(len(used_segments), pitch_dim)
+
+        # cosine_similarity maps cos -> (cos + 1) / 2 and returns 0 for zero
+        # vectors, i.e. (u_i . u_j + v_i * v_j) / 2 with v the nonzero mask
+        timbre_unit, timbre_valid = _unit_rows(timbre)
+        pitch_unit, pitch_valid = _unit_rows(pitches)
+        gate = has_timbre
+        pitch_gate = gate * has_pitch
+        per_segment = np.hstack(
+            (
+                timbre_unit * gate[:, None],
+                (timbre_valid * gate)[:, None],
+                pitch_unit * pitch_gate[:, None],
+                (pitch_valid * pitch_gate)[:, None],
+                gate[:, None],
+                pitch_gate[:, None],
+            )
+        )
 
-    # Map segments to beats
-    beat_segments = []
-    for beat in beats:
-        beat_start = beat.start
-        beat_end = beat.start + beat.duration
-        overlapping = []
-        for seg in segments:
-            seg_start = seg["start"]
-            seg_end = seg["start"] + seg["duration"]
-            # Check if segment overlaps with beat
-            if seg_start < beat_end and seg_end > beat_start:
-                overlapping.append(seg)
-        beat_segments.append(overlapping)
-
-    # Compute pairwise similarities
-    for i in range(n_beats):
-        for j in range(n_beats):
-            if i == j:
-                similarity_matrix[i, j] = 1.0
-                continue
-
-            # Compare segments in each beat
-            segs_i = beat_segments[i]
-            segs_j = beat_segments[j]
-
-            if not segs_i or not segs_j:
-                similarity_matrix[i, j] = 0.0
-                continue
-
-            # Average similarity across segment pairs
-            similarities = []
-            for seg_i in segs_i:
-                for seg_j in segs_j:
-                    sim = compute_segment_similarity(seg_i, seg_j)
-                    similarities.append(sim)
+        # average the per-segment vectors over each beat's overlapping segments
+        counts = np.bincount(beat_idx, minlength=n_beats).astype(np.float64)
+        covered = counts > 0
+        row_starts = np.flatnonzero(np.r_[True, beat_idx[1:] != beat_idx[:-1]])
+        pooled = np.zeros((n_beats, per_segment.shape[1]), dtype=np.float64)
+        pooled[covered] = (
+            np.add.reduceat(per_segment[remap[seg_idx]], row_starts, axis=0)
+            / counts[covered, None]
+        )
 
-            if similarities:
-                similarity_matrix[i, j] = np.mean(similarities)
-            else:
-                similarity_matrix[i, j] = 0.0
+        t_end = timbre_dim + 1
+        p_end = t_end + pitch_dim + 1
+        timbre_part = pooled[:, :t_end]
+        pitch_part = pooled[:, t_end:p_end]
+        gate_mean = pooled[:, p_end]
+        pitch_gate_mean = pooled[:, p_end + 1]
+
+        pitch_weight = 1.0 - timbre_weight
+        combined = (0.5 * timbre_weight) * (timbre_part @ timbre_part.T)
+        combined += (0.5 * pitch_weight) * (
+            pitch_part @ pitch_part.T
+            + np.outer(gate_mean, gate_mean)
+            - np.outer(pitch_gate_mean, pitch_gate_mean)
+        )
+        similarity_matrix[:] = combined
 
+    np.fill_diagonal(similarity_matrix, 1.0)
     return similarity_matrix
 
 
@@ -1206,9 +1986,9 @@ def circular_distance(src: int, dst: int, n_beats: int) -> int:
 
 
 def generate_loop_candidates(
-    beats: List[Quantum],
+    beats: Quanta,
     similarity_matrix: np.ndarray,
-    sections: List[Dict] = None,
+    sections: Optional[Quanta] = None,
     min_span: int = 8,
     max_span: int = None,
     thresholds: List[float] = None,
@@ -1219,7 +1999,7 @@ def generate_loop_candidates(
     Treats timeline as circular (wraps end → start).
 
     Args:
-        beats: List of beat quantums
+        beats: Beat quanta
         similarity_matrix: NxN similarity matrix
         sections: Optional list of section boundaries for section bias
         min_span: Minimum distance between beats (in beats)
@@ -1237,69 +2017,123 @@ def generate_loop_candidates(
     if max_span is None:
         max_span = n_beats // 2  # Don't allow jumps larger than half the song
 
-    # Build section map if provided
-    beat_sections = None
-    if sections:
-        beat_sections = []
-        for beat in beats:
-            beat_section = None
-            for idx, section in enumerate(sections):
-                # Handle both Quantum objects and dicts
-                sec_start = section.start if hasattr(section, 'start') else section.get("start", 0)
-                sec_dur = section.duration if hasattr(section, 'duration') else section.get("duration", 0)
-                if sec_start <= beat.start < sec_start + sec_dur:
-                    beat_section = idx
-                    break
-            beat_sections.append(beat_section)
-
-    loop_candidates = {}
-
-    for source_idx in range(n_beats):
-        candidates = []
-
-        # Try all possible targets in circular manner
-        for target_idx in range(n_beats):
-            if source_idx == target_idx:
-                continue
-
-            # Compute circular span
-            span = circular_distance(source_idx, target_idx, n_beats)
-            abs_span = abs(span)
-
-            # Check span constraints
-            if abs_span < min_span or abs_span > max_span:
-                continue
-
-            similarity = similarity_matrix[source_idx, target_idx]
-
-            # Check if meets any threshold tier
-            if similarity < thresholds[-1]:  # Must at least meet lowest threshold
-                continue
-
-            # Determine direction
-            direction = "forward" if span > 0 else "backward"
-
-            # Check section match for bias
-            section_match = False
-            if beat_sections and beat_sections[source_idx] is not None:
-                section_match = (beat_sections[source_idx] == beat_sections[target_idx])
-
-            candidates.append({
-                "target": target_idx,
-                "similarity": float(similarity),
-                "span": int(span),
-                "abs_span": int(abs_span),
-                "direction": direction,
-                "section_match": section_match,
+    loop_candidates: Dict[int, List[Dict]] = {idx: [] for idx in range(n_beats)}
+    keep = min(int(max_candidates_per_beat), n_beats - 1)
+    if keep <= 0:
+        return loop_candidates
+
+    # Section index per beat (-1 = outside every section), via one searchsorted
+    beat_sections = np.full(n_beats, -1, dtype=np.int64)
+    if sections is not None and len(sections):
+        # Quanta, Quantum views and profile dicts alike
+        sec_starts = _quanta_column(sections, "start")
+        sec_ends = sec_starts + _quanta_column(sections, "duration")
+        order = np.argsort(sec_starts, kind="stable")
+        beat_starts = _quanta_column(beats, "start")
+        pos = np.searchsorted(sec_starts[order], beat_starts, side="right") - 1
+        inside = pos >= 0
+        inside[inside] = beat_starts[inside] < sec_ends[order[pos[inside]]]
+        beat_sections[inside] = order[pos[inside]]
+
+    targets = np.arange(n_beats)
+    min_threshold = thresholds[-1]  # Must at least meet lowest threshold
+    # rows are processed in blocks so temporaries stay O(block x N)
+    for block_start in range(0, n_beats, LOOP_CANDIDATE_BLOCK_ROWS):
+        sources = np.arange(block_start, min(block_start + LOOP_CANDIDATE_BLOCK_ROWS, n_beats))
+        similarity = similarity_matrix[sources]
+
+        # Circular span: positive for forward jumps, negative for backward jumps
+        forward = (targets[None, :] - sources[:, None]) % n_beats
+        backward = (sources[:, None] - targets[None, :]) % n_beats
+        span = np.where(forward <= backward, forward, -backward)
+        abs_span = np.abs(span)
+
+        valid = (abs_span >= min_span) & (abs_span <= max_span)
+        valid &= similarity >= min_threshold
+        valid[np.arange(sources.size), sources] = False
+
+        # Top-k per row. argpartition finds the k-th best value; ties at that
+        # value are resolved towards lower targets, matching a stable sort.
+        scores = np.where(valid, similarity.astype(np.float64), -np.inf)
+        kth = -np.partition(-scores, keep - 1, axis=1)[:, keep - 1]
+        above = scores > kth[:, None]
+        at_kth = (scores == kth[:, None]) & valid
+        room = keep - np.sum(above, axis=1)
+        selected = (above | (at_kth & (np.cumsum(at_kth, axis=1) <= room[:, None]))) & valid
+
+        rows, cols = np.nonzero(selected)
+        ranking = np.lexsort((cols, -scores[rows, cols], rows))
+        rows, cols = rows[ranking], cols[ranking]
+        src_sections = beat_sections[sources]
+        section_match = (src_sections[rows] >= 0) & (src_sections[rows] == beat_sections[cols])
+        spans = span[rows, cols]
+        for row, target, sim, jump, match in zip(
+            rows.tolist(),
+            cols.tolist(),
+            similarity[rows, cols].tolist(),
+            spans.tolist(),
+            section_match.tolist(),
+        ):
+            loop_candidates[int(sources[row])].append({
+                "target": target,
+                "similarity": sim,
+                "span": jump,
+                "abs_span": abs(jump),
+                "direction": "forward" if jump > 0 else "backward",
+                "section_match": match,
             })
 
-        # Sort by similarity (best first) and limit
-        candidates.sort(key=lambda x: x["similarity"], reverse=True)
-        loop_candidates[source_idx] = candidates[:max_candidates_per_beat]
-
     return loop_candidates
 
 
+def available_cpus() -> int:
+    """CPUs this process may actually use: cgroup quota, then affinity, then cpu_count."""
+    limits = [os.cpu_count() or 1]
+    if hasattr(os, "sched_getaffinity"):
+        limits.append(len(os.sched_getaffinity(0)))
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        if quota != "max":
+            limits.append(int(quota) / int(period))
+    except (OSError, ValueError):
+        try:
+            quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+            period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+            if quota > 0 and period > 0:
+                limits.append(quota / period)
+        except (OSError, ValueError):
+            pass
+    return max(1, int(math.ceil(min(limits))))
+
+
+def default_stage_workers() -> int:
+    value = os.environ.get(STAGE_WORKERS_ENV, "1").strip().lower()
+    if value == "auto":
+        return available_cpus()
+    try:
+        return max(1, int(value))
+    except ValueError:
+        return 1
+
+
+class _InlineExecutor:
+    """Executor stand-in that runs each call immediately in the caller's thread."""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+        return future
+
+    def __enter__(self) -> "_InlineExecutor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+
 def build_profile(
     audio_path: Path,
     track_id: str,
@@ -1307,76 +2141,198 @@ def build_profile(
     artist: str,
     audio_url: str,
     output_path: Path,
+    features: Optional[FeatureBank] = None,
+    persist_stages: bool = True,
+    stage_workers: Optional[int] = None,
+    preset: Optional[str] = None,
+    preview: bool = False,
+    revision: Optional[int] = None,
 ) -> Dict[str, object]:
-    y, sr = librosa.load(audio_path, sr=None, mono=True)
-    duration = librosa.get_duration(y=y, sr=sr)
-
-    beats, beat_times, tempo = compute_beats(y, sr)
-    if not beats:
-        # fallback: create a simple evenly spaced grid
-        grid = np.linspace(0, duration, num=max(int(duration * 2), 2), endpoint=False)
-        beats = [
-            Quantum(
-                start=float(t),
-                duration=float(min(duration - t, duration / len(grid))),
-                confidence=0.5,
-            )
-            for t in grid
-        ]
-        beat_times = np.array([b.start for b in beats])
-        tempo = 60.0 / beats[0].duration if beats and beats[0].duration > 0 else 120.0
+    """Analyse ``audio_path`` and write the profile JSON to ``output_path``.
+
+    Stage outputs are persisted under ``<output>.stages/`` so a re-run only
+    recomputes the stages whose version, parameters or inputs changed.
+
+    Once beats are known, sections, segments and canon run concurrently on
+    ``stage_workers`` threads (default: ``$ANALYSIS_STAGE_WORKERS``, 1 when unset),
+    and the loop graph starts as soon as sections and segments are done. The
+    output does not depend on the worker count.
+
+    ``preset`` names an entry of ``ANALYSIS_PRESETS`` (default ``standard``);
+    it decides how ``features`` are extracted when they are not passed in.
+
+    ``preview=True`` builds a playable first draft: no canon alignment and at
+    most ``PREVIEW_LOOP_MAX_CANDIDATES_PER_BEAT`` loop edges per beat. When
+    ``revision`` is given it is written to ``analysis.revision`` along with
+    ``analysis.preview``.
+
+    Every stage is timed (see timings.py); the result lands in
+    ``analysis.timings``, one JSON log line and the metrics database.
+    """
+    settings = get_preset(preset)
+    profiler = timings.StageProfiler()
+    store = StageStore(output_path.with_suffix(".stages") if persist_stages else None, profiler)
+
+    feature_key = store.key(
+        "features",
+        {
+            **settings.parameters(),
+            "mfcc_coefficients": MFCC_COEFFICIENTS,
+            "stream_min_seconds": STREAM_MIN_SECONDS,
+        },
+        _file_digest(audio_path),
+    )
+    stored_features = store.load("features", feature_key)
+    if stored_features is not None:
+        print("[Analysis] Reusing stored features stage", flush=True)
+        with profiler.stage("features") as timing:
+            features = FeatureBank.from_arrays(stored_features)
+            timing.cached = True
+    else:
+        if features is None:
+            # streamed inputs extract their features here as well
+            with profiler.stage("decode"):
+                features = load_features(audio_path, preset=settings.name)
+        with profiler.stage("features"):
+            feature_arrays = features.to_arrays()
+        store.save("features", feature_key, feature_arrays)
+    sr = features.sr
+    duration = features.duration
+
+    def beat_stage():
+        beats, _, tempo = compute_beats(features)
+        if not len(beats):
+            # fallback: create a simple evenly spaced grid
+            grid = np.linspace(0, duration, num=max(int(duration * 2), 2), endpoint=False)
+            beats = Quanta(grid, np.minimum(duration - grid, duration / len(grid)), 0.5)
+            tempo = 60.0 / beats[0].duration if beats[0].duration > 0 else 120.0
+        return beats, tempo
+
+    beats_key = store.key("beats", {}, feature_key)
+    beats, tempo = store.run(
+        "beats",
+        beats_key,
+        beat_stage,
+        encode=lambda result: {**result[0].to_arrays(), "tempo": np.asarray(result[1])},
+        decode=lambda arrays: (Quanta.from_arrays(arrays), float(arrays["tempo"])),
+    )
+    beat_times = beats.start
 
     bars = derive_bars(beats, beat_times, duration)
     tatums = derive_tatums(beats, duration)
 
     desired_sections = max(2, min(12, len(beats) // 8 or 2))
-    sections = estimate_sections(y, sr, duration, desired_sections, bars)
-    segments = compute_segments(y, sr, duration)
+    sections_key = store.key(
+        "sections",
+        {
+            "time_signature": DEFAULT_TIME_SIGNATURE,
+            "min_section_duration": MIN_SECTION_DURATION,
+            "min_cells_per_section": SECTION_MIN_CELLS_PER_SECTION,
+            "grid_seconds": SECTION_GRID_SECONDS,
+            "smoothing_cells": SECTION_SMOOTHING_CELLS,
+        },
+        feature_key,
+        beats_key,
+    )
+    segments_key = store.key(
+        "segments", {"segment_min_duration": SEGMENT_MIN_DURATION}, feature_key
+    )
+    canon_params = {
+        "beats_per_bar": DEFAULT_TIME_SIGNATURE,
+        "context_window": CANON_CONTEXT_BEATS,
+        "similarity_threshold": CANON_SIMILARITY_THRESHOLD,
+        "min_phase_alignment": CANON_MIN_PHASE_ALIGNMENT,
+        "min_pairs": CANON_MIN_PAIRS,
+        "top_candidates": CANON_TOP_CANDIDATES,
+    }
+    loop_params = {
+        "min_span": LOOP_MIN_SPAN,
+        "thresholds": list(LOOP_THRESHOLDS),
+        "max_candidates_per_beat": PREVIEW_LOOP_MAX_CANDIDATES_PER_BEAT if preview else LOOP_MAX_CANDIDATES_PER_BEAT,
+        "timbre_weight": LOOP_TIMBRE_WEIGHT,
+    }
 
-    chroma_full = librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=HOP_LENGTH)
-    key_index, mode = estimate_key(chroma_full)
-    loudness_global = float(np.mean(librosa.amplitude_to_db(np.abs(y), ref=1.0)))
+    def loop_stage():
+        # Compute segment-based similarity matrix for eternal jukebox
+        print("[Analysis] Computing beat-to-beat similarity matrix (circular, bidirectional)...", flush=True)
+        similarity_matrix = compute_beat_to_beat_similarity(
+            beats, segments, timbre_weight=LOOP_TIMBRE_WEIGHT
+        )
 
-    canon_alignment = compute_canon_alignment(
-        y=y,
-        sr=sr,
-        beats=beats,
-        duration=duration,
-        beats_per_bar=DEFAULT_TIME_SIGNATURE,
-        context_window=CANON_CONTEXT_BEATS,
-        similarity_threshold=CANON_SIMILARITY_THRESHOLD,
-        min_phase_alignment=CANON_MIN_PHASE_ALIGNMENT,
-        min_pairs=CANON_MIN_PAIRS,
-        top_candidates=CANON_TOP_CANDIDATES,
-    )
+        # Generate circular bidirectional loop candidates with multi-tier thresholds
+        print("[Analysis] Generating eternal loop candidates (circular timeline)...", flush=True)
+        candidates = generate_loop_candidates(
+            beats=beats,
+            similarity_matrix=similarity_matrix,
+            sections=sections,
+            min_span=LOOP_MIN_SPAN,
+            max_span=None,  # Auto-computed as n_beats // 2
+            thresholds=list(LOOP_THRESHOLDS),
+            max_candidates_per_beat=loop_params["max_candidates_per_beat"],
+        )
+        # Convert to string keys for JSON serialization
+        return {str(src): cand_list for src, cand_list in candidates.items()}
+
+    workers = default_stage_workers() if stage_workers is None else max(1, stage_workers)
+    if workers > 1:
+        # fill every lazily computed feature up front so threads never race on them
+        features.to_arrays()
+        features.mfcc_delta
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis-stage")
+    else:
+        executor = _InlineExecutor()
+    with executor:
+        sections_future = executor.submit(
+            store.run,
+            "sections",
+            sections_key,
+            lambda: estimate_sections(features, duration, desired_sections, bars, beats),
+            encode=Quanta.to_arrays,
+            decode=Quanta.from_arrays,
+        )
+        segments_future = executor.submit(
+            store.run,
+            "segments",
+            segments_key,
+            lambda: compute_segments(features, duration),
+            encode=_segments_to_arrays,
+            decode=_segments_from_arrays,
+        )
+        canon_future = None if preview else executor.submit(
+            store.run,
+            "canon",
+            store.key("canon", canon_params, feature_key, beats_key),
+            lambda: compute_canon_alignment(
+                features=features,
+                beats=beats,
+                duration=duration,
+                **canon_params,
+            ),
+            encode=_json_to_arrays,
+            decode=_json_from_arrays,
+        )
+        sections = sections_future.result()
+        segments = segments_future.result()
+        loops_future = executor.submit(
+            store.run,
+            "loops",
+            store.key("loops", loop_params, beats_key, segments_key, sections_key),
+            loop_stage,
+            encode=_json_to_arrays,
+            decode=_json_from_arrays,
+        )
+        canon_alignment = canon_future.result() if canon_future is not None else None
+        eternal_loop_candidates_json = loops_future.result()
+
+    key_index, mode = estimate_key(features.chroma)
+    loudness_global = features.loudness
     loop_candidates = (
         canon_alignment.get("loop_candidates", []) if canon_alignment else []
     )
 
-    # Compute segment-based similarity matrix for eternal jukebox
-    print("[Analysis] Computing beat-to-beat similarity matrix (circular, bidirectional)...", flush=True)
-    similarity_matrix = compute_beat_to_beat_similarity(beats, segments)
-
-    # Generate circular bidirectional loop candidates with multi-tier thresholds
-    print("[Analysis] Generating eternal loop candidates (circular timeline)...", flush=True)
-    eternal_loop_candidates = generate_loop_candidates(
-        beats=beats,
-        similarity_matrix=similarity_matrix,
-        sections=sections,
-        min_span=8,
-        max_span=None,  # Auto-computed as n_beats // 2
-        thresholds=[0.76, 0.65, 0.55],  # Tight → medium → loose
-        max_candidates_per_beat=16,
-    )
-
-    # Convert to string keys for JSON serialization
-    eternal_loop_candidates_json = {
-        str(src): cand_list
-        for src, cand_list in eternal_loop_candidates.items()
-    }
-
-    print(f"[Analysis] Generated {sum(len(v) for v in eternal_loop_candidates.values())} eternal jukebox loop candidates", flush=True)
+    print(f"[Analysis] Generated {sum(len(v) for v in eternal_loop_candidates_json.values())} eternal jukebox loop candidates", flush=True)
 
+    revision_info = {} if revision is None else {"revision": int(revision), "preview": bool(preview)}
     profile = {
         "response": {
             "status": {"code": 0, "message": "OK"},
@@ -1397,7 +2353,8 @@ def build_profile(
                     "analysis_sample_rate": sr,
                 },
                 "analysis": {
-                    "version": "local-1.0",
+                    "version": analysis_version(settings.name),
+                    **revision_info,
                     "sample_rate": sr,
                     "counts": {
                         "sections": len(sections),
@@ -1406,24 +2363,112 @@ def build_profile(
                         "tatums": len(tatums),
                         "segments": len(segments),
                     },
-                    "sections": [s.as_dict() for s in sections],
-                    "bars": [b.as_dict() for b in bars],
-                    "beats": [b.as_dict() for b in beats],
-                    "tatums": [t.as_dict() for t in tatums],
+                    "sections": sections.as_dicts(),
+                    "bars": bars.as_dicts(),
+                    "beats": beats.as_dicts(),
+                    "tatums": tatums.as_dicts(),
                     "segments": segments,
                     "canon_alignment": canon_alignment,
                     "loop_candidates": loop_candidates,
                     "eternal_loop_candidates": eternal_loop_candidates_json,
+                    "timings": profiler.as_dict(),
                 },
             },
         }
     }
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("w", encoding="utf-8") as sink:
-        json.dump(profile, sink, indent=2)
+    with profiler.stage("write"):
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        profile_format.write_profile(profile, output_path)
+        profile_format.write_split_profile(profile, output_path)
+        # the legacy JSON goes last: its presence marks a complete profile
+        with profile_format.atomic_output(output_path) as sink:
+            json.dump(profile, sink, indent=2)
+
+    version = analysis_version(settings.name)
+    timings.log(
+        profiler, track_id=track_id, version=version, preset=settings.name, preview=preview, duration=float(duration)
+    )
+    timings.record(profiler, track_id, version, settings.name, duration, preview=preview)
     return profile
 
 
+CROSS_TRACK_THRESHOLD = 0.50
+CROSS_TRACK_TOP_K = 12
+CROSS_TRACK_VERSION = 1
+CROSS_TRACK_CACHE_DIR = DEFAULT_STATE_DIR / "cross"
+AUTOHARMONIZER_MAX_TRACKS = 10
+
+
+def _nearest_segment_indices(beat_starts: np.ndarray, segment_starts: np.ndarray) -> np.ndarray:
+    """Index of the segment whose start is closest to each beat (earliest on ties)."""
+    order = np.argsort(segment_starts, kind="stable")
+    ordered = segment_starts[order]
+    right = np.clip(np.searchsorted(ordered, beat_starts, side="left"), 0, ordered.size - 1)
+    left = np.clip(right - 1, 0, ordered.size - 1)
+    use_left = np.abs(ordered[left] - beat_starts) <= np.abs(ordered[right] - beat_starts)
+    nearest = np.where(use_left, ordered[left], ordered[right])
+    # first segment (in list order) among equal starts, as min() would pick
+    return order[np.searchsorted(ordered, nearest, side="left")]
+
+
+def _beat_timbre_pitch_features(beats: List[Dict], segments: List[Dict]) -> np.ndarray:
+    """Timbre (12) + pitches (12) of each beat's nearest segment, unit-normalised, float32."""
+    features = np.zeros((len(beats), 24), dtype=np.float32)
+    if beats and segments:
+        segment_features = np.array(
+            [
+                list(seg.get("timbre", [0.0] * 12)) + list(seg.get("pitches", [0.0] * 12))
+                for seg in segments
+            ],
+            dtype=np.float32,
+        )
+        nearest = _nearest_segment_indices(
+            np.array([beat["start"] for beat in beats], dtype=np.float64),
+            np.array([seg["start"] for seg in segments], dtype=np.float64),
+        )
+        features = segment_features[nearest]
+    return features / (np.linalg.norm(features, axis=1, keepdims=True) + 1e-8)
+
+
+def _top_k_rows(
+    scores: np.ndarray,
+    k: int,
+    threshold: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(rows, cols) of the best ``k`` entries >= ``threshold`` in each row.
+
+    Ordered by row, then score descending, then column ascending, which is
+    what a stable descending sort of each row's qualifying entries gives.
+    """
+    valid = scores >= threshold
+    n_rows, n_cols = scores.shape
+    if n_cols > k:
+        masked = np.where(valid, scores, -np.inf)
+        kth = -np.partition(-masked, k - 1, axis=1)[:, k - 1]
+        valid &= scores >= kth[:, None]
+    rows, cols = np.nonzero(valid)
+    ranking = np.lexsort((cols, -scores[rows, cols], rows))
+    rows, cols = rows[ranking], cols[ranking]
+    # ties at the k-th value can leave more than k per row
+    first = np.searchsorted(rows, np.arange(n_rows), side="left")
+    keep = np.arange(rows.size) - first[rows] < k
+    return rows[keep], cols[keep]
+
+
+def _cross_candidates(
+    similarity: np.ndarray,
+    source_track: int,
+    target_track: int,
+    source_beats: List[Dict],
+    target_beats: List[Dict],
+    threshold: float = CROSS_TRACK_THRESHOLD,
+    top_k: int = CROSS_TRACK_TOP_K,
+) -> Dict[str, List[Dict]]:
+    rows, cols = _top_k_rows(similarity, top_k, threshold)
+    edges = {"rows": rows, "cols": cols, "similarity": similarity[rows, cols]}
+    return _edges_to_candidates(edges, source_track, target_track, source_beats, target_beats)
+
+
 def compute_cross_track_similarity(
     beats1: List[Dict],
     beats2: List[Dict],
@@ -1434,119 +2479,232 @@ def compute_cross_track_similarity(
     Compute cross-track beat-to-beat similarity between two tracks.
 
     For each beat in track1, find similar beats in track2 (and vice versa).
-    Uses segment timbre and pitch features for comparison.
+    Each beat takes the timbre and pitch features of the segment starting
+    closest to it; candidates are the top 12 beats at cosine >= 0.5.
 
     Returns a dict mapping:
         "track1_to_track2": List of candidate jumps from track1 to track2
         "track2_to_track1": List of candidate jumps from track2 to track1
     """
-    # Build feature vectors for each beat by finding the nearest segment
-    def get_beat_features(beats: List[Dict], segments: List[Dict]) -> np.ndarray:
-        features = []
-        for beat in beats:
-            beat_start = beat["start"]
-            # Find the segment that contains or is closest to this beat
-            best_seg = min(segments, key=lambda s: abs(s["start"] - beat_start))
-            # Concatenate timbre (12) and pitches (12) = 24 features
-            timbre = np.array(best_seg.get("timbre", [0.0] * 12), dtype=np.float32)
-            pitches = np.array(best_seg.get("pitches", [0.0] * 12), dtype=np.float32)
-            feat = np.concatenate([timbre, pitches])
-            features.append(feat)
-        return np.array(features, dtype=np.float32)
-
-    features1 = get_beat_features(beats1, segments1)
-    features2 = get_beat_features(beats2, segments2)
-
-    # Normalize features
-    features1_norm = features1 / (np.linalg.norm(features1, axis=1, keepdims=True) + 1e-8)
-    features2_norm = features2 / (np.linalg.norm(features2, axis=1, keepdims=True) + 1e-8)
+    features1_norm = _beat_timbre_pitch_features(beats1, segments1)
+    features2_norm = _beat_timbre_pitch_features(beats2, segments2)
 
     # Compute cross-similarity matrix: shape (n_beats1, n_beats2)
     cross_sim = features1_norm @ features2_norm.T
 
-    # For each beat in track1, find top candidates in track2
-    track1_to_track2 = {}
-    for i in range(len(beats1)):
-        similarities = cross_sim[i, :]
-        # Get top 12 candidates above threshold
-        threshold = 0.50
-        candidates = []
-        for j in range(len(beats2)):
-            if similarities[j] >= threshold:
-                candidates.append({
-                    "source_track": 1,
-                    "target_track": 2,
-                    "source_index": i,
-                    "target_index": j,
-                    "similarity": float(similarities[j]),
-                    "source_time": beats1[i]["start"],
-                    "target_time": beats2[j]["start"],
-                })
-        # Sort by similarity and keep top 12
-        candidates.sort(key=lambda x: x["similarity"], reverse=True)
-        track1_to_track2[str(i)] = candidates[:12]
-
-    # For each beat in track2, find top candidates in track1
-    track2_to_track1 = {}
-    for j in range(len(beats2)):
-        similarities = cross_sim[:, j]
-        threshold = 0.50
-        candidates = []
-        for i in range(len(beats1)):
-            if similarities[i] >= threshold:
-                candidates.append({
-                    "source_track": 2,
-                    "target_track": 1,
-                    "source_index": j,
-                    "target_index": i,
-                    "similarity": float(similarities[i]),
-                    "source_time": beats2[j]["start"],
-                    "target_time": beats1[i]["start"],
-                })
-        candidates.sort(key=lambda x: x["similarity"], reverse=True)
-        track2_to_track1[str(j)] = candidates[:12]
+    return {
+        "track1_to_track2": _cross_candidates(cross_sim, 1, 2, beats1, beats2),
+        "track2_to_track1": _cross_candidates(cross_sim.T, 2, 1, beats2, beats1),
+    }
 
+
+@dataclass
+class BeatFeatures:
+    """Per-beat cross-track vectors of one track plus a digest of their content."""
+
+    starts: np.ndarray
+    vectors: np.ndarray
+    digest: str
+
+    @classmethod
+    def from_profile(cls, profile: Dict) -> "BeatFeatures":
+        analysis = profile["response"]["track"]["analysis"]
+        beats = analysis["beats"]
+        starts = np.array([beat["start"] for beat in beats], dtype=np.float64)
+        vectors = _beat_timbre_pitch_features(beats, analysis["segments"])
+        digest = hashlib.sha256(starts.tobytes() + vectors.tobytes()).hexdigest()
+        return cls(starts=starts, vectors=vectors, digest=digest)
+
+
+def _blocked_top_k(
+    source: np.ndarray,
+    target: np.ndarray,
+    top_k: int,
+    threshold: float,
+    block_rows: int = LOOP_CANDIDATE_BLOCK_ROWS,
+) -> Dict[str, np.ndarray]:
+    """Top-k edges from every source row to ``target``, one row block at a time."""
+    rows, cols, sims = [], [], []
+    for start in range(0, source.shape[0], block_rows):
+        block = source[start:start + block_rows] @ target.T
+        block_rows_idx, block_cols = _top_k_rows(block, top_k, threshold)
+        rows.append(block_rows_idx + start)
+        cols.append(block_cols)
+        sims.append(block[block_rows_idx, block_cols])
+    if not rows:
+        return {
+            "rows": np.zeros(0, dtype=np.int64),
+            "cols": np.zeros(0, dtype=np.int64),
+            "similarity": np.zeros(0, dtype=np.float32),
+        }
     return {
-        "track1_to_track2": track1_to_track2,
-        "track2_to_track1": track2_to_track1,
+        "rows": np.concatenate(rows),
+        "cols": np.concatenate(cols),
+        "similarity": np.concatenate(sims),
     }
 
 
-def build_autoharmonizer_profile(
-    track1_path: Path,
-    track2_path: Path,
+def cross_track_edges(
+    source: BeatFeatures,
+    target: BeatFeatures,
+    store: Optional[StageStore] = None,
+    threshold: float = CROSS_TRACK_THRESHOLD,
+    top_k: int = CROSS_TRACK_TOP_K,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Top-k edges ``source -> target`` and ``target -> source``.
+
+    The pair is stored under the content digests of both tracks, so a set that
+    gains a track only computes the blocks involving the new one.
+    """
+    swapped = source.digest > target.digest
+    first, second = (target, source) if swapped else (source, target)
+    name = f"{first.digest[:16]}-{second.digest[:16]}"
+    payload = {
+        "version": CROSS_TRACK_VERSION,
+        "params": {"threshold": threshold, "top_k": top_k},
+        "inputs": [first.digest, second.digest],
+    }
+    key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    arrays = store.load(name, key) if store is not None else None
+    if arrays is None:
+        forward = _blocked_top_k(first.vectors, second.vectors, top_k, threshold)
+        backward = _blocked_top_k(second.vectors, first.vectors, top_k, threshold)
+        arrays = {f"forward_{k}": v for k, v in forward.items()}
+        arrays.update({f"backward_{k}": v for k, v in backward.items()})
+        if store is not None:
+            store.save(name, key, arrays)
+    forward = {k: arrays[f"forward_{k}"] for k in ("rows", "cols", "similarity")}
+    backward = {k: arrays[f"backward_{k}"] for k in ("rows", "cols", "similarity")}
+    return (backward, forward) if swapped else (forward, backward)
+
+
+def _edges_to_candidates(
+    edges: Dict[str, np.ndarray],
+    source_track: int,
+    target_track: int,
+    source_beats: List[Dict],
+    target_beats: List[Dict],
+) -> Dict[str, List[Dict]]:
+    """Legacy ``cross_similarity`` layout of one direction of a pair."""
+    candidates: Dict[str, List[Dict]] = {str(i): [] for i in range(len(source_beats))}
+    for i, j, sim in zip(edges["rows"].tolist(), edges["cols"].tolist(), edges["similarity"].tolist()):
+        candidates[str(i)].append({
+            "source_track": source_track,
+            "target_track": target_track,
+            "source_index": i,
+            "target_index": j,
+            "similarity": sim,
+            "source_time": source_beats[i]["start"],
+            "target_time": target_beats[j]["start"],
+        })
+    return candidates
+
+
+def _jump_graph(
+    n_beats: Sequence[int],
+    intra: Sequence[Dict[str, List[Dict]]],
+    cross: Dict[Tuple[int, int], Dict[str, np.ndarray]],
+) -> Dict[str, Dict[str, List[Dict]]]:
+    """Merge every track's own loop edges with all cross edges into one graph.
+
+    Keys are 1-based track numbers, then source beat; each beat's edges are
+    ordered by similarity, best first.
+    """
+    graph: Dict[str, Dict[str, List[Dict]]] = {}
+    for source in range(len(n_beats)):
+        parts = []
+        own = intra[source] or {}
+        own_rows = [int(beat) for beat, edges in own.items() for _ in edges]
+        own_edges = [edge for edges in own.values() for edge in edges]
+        parts.append((
+            np.asarray(own_rows, dtype=np.int64),
+            np.full(len(own_edges), source, dtype=np.int64),
+            np.asarray([edge["target"] for edge in own_edges], dtype=np.int64),
+            np.asarray([edge["similarity"] for edge in own_edges], dtype=np.float64),
+        ))
+        for (src, dst), edges in cross.items():
+            if src == source:
+                parts.append((
+                    edges["rows"].astype(np.int64),
+                    np.full(edges["rows"].size, dst, dtype=np.int64),
+                    edges["cols"].astype(np.int64),
+                    edges["similarity"].astype(np.float64),
+                ))
+        rows, tracks, targets, sims = (np.concatenate(column) for column in zip(*parts))
+        order = np.lexsort((targets, tracks, -sims, rows))
+        beats: Dict[str, List[Dict]] = {str(i): [] for i in range(n_beats[source])}
+        for i, track, j, sim in zip(
+            rows[order].tolist(), tracks[order].tolist(), targets[order].tolist(), sims[order].tolist()
+        ):
+            beats[str(i)].append({"target_track": track + 1, "target_index": j, "similarity": sim})
+        graph[str(source + 1)] = beats
+    return graph
+
+
+def _autoharmonizer_track(track: Dict) -> Dict:
+    analysis = track["analysis"]
+    return {
+        "id": track["id"],
+        "title": track["title"],
+        "audio_url": track.get("audio_url") or track.get("info", {}).get("url", ""),
+        "beats": analysis["beats"],
+        "bars": analysis["bars"],
+        "segments": analysis["segments"],
+        "duration": track["audio_summary"]["duration"],
+        "tempo": track["audio_summary"]["tempo"],
+        "eternal_loop_candidates": analysis.get("eternal_loop_candidates", {}),
+        "canon_alignment": analysis.get("canon_alignment", {}),
+    }
+
+
+def build_set_profile(
+    track_paths: Sequence[Path],
     combined_track_id: str,
     output_path: Path,
+    profiles: Optional[Sequence[Optional[Dict]]] = None,
+    cache_dir: Optional[Path] = CROSS_TRACK_CACHE_DIR,
 ) -> Dict:
     """
-    Build a combined autoharmonizer profile from two existing track profiles.
-
-    Loads both track analyses, computes cross-track similarity, and creates
-    a combined profile with both tracks' data plus cross-track jump candidates.
+    Build a combined autoharmonizer profile for a set of 2 to
+    ``AUTOHARMONIZER_MAX_TRACKS`` tracks.
+
+    Every ordered pair of tracks gets its own top-k cross edges, computed one
+    row block at a time and cached in ``cache_dir`` so adding a track to a set
+    only computes the pairs involving it. The result carries ``tracks`` and a
+    combined ``jump_graph``. ``track1``/``track2`` are indices into ``tracks``
+    and ``cross_similarity`` covers the first two tracks, for older clients.
     """
-    # Load both track profiles
-    with track1_path.open("r", encoding="utf-8") as f:
-        profile1 = json.load(f)
-
-    with track2_path.open("r", encoding="utf-8") as f:
-        profile2 = json.load(f)
-
-    track1 = profile1["response"]["track"]
-    track2 = profile2["response"]["track"]
+    if not 2 <= len(track_paths) <= AUTOHARMONIZER_MAX_TRACKS:
+        raise ValueError(f"A set needs 2 to {AUTOHARMONIZER_MAX_TRACKS} tracks, got {len(track_paths)}")
+    profiles = list(profiles) if profiles is not None else [None] * len(track_paths)
+    for index, path in enumerate(track_paths):
+        if profiles[index] is None:
+            with Path(path).open("r", encoding="utf-8") as f:
+                profiles[index] = json.load(f)
+
+    tracks = [profile["response"]["track"] for profile in profiles]
+    beat_features = [BeatFeatures.from_profile(profile) for profile in profiles]
+    store = StageStore(cache_dir)
 
-    # Extract beats and segments from both tracks
-    beats1 = track1["analysis"]["beats"]
-    beats2 = track2["analysis"]["beats"]
-    segments1 = track1["analysis"]["segments"]
-    segments2 = track2["analysis"]["segments"]
-
-    # Compute cross-track similarity
-    print(f"[Autoharmonizer] Computing cross-track similarity between {len(beats1)} and {len(beats2)} beats...")
-    cross_similarity = compute_cross_track_similarity(beats1, beats2, segments1, segments2)
-
-    # Build combined profile
-    track1_audio_url = track1.get("audio_url") or track1.get("info", {}).get("url", "")
-    track2_audio_url = track2.get("audio_url") or track2.get("info", {}).get("url", "")
+    print(
+        f"[Autoharmonizer] Computing cross-track similarity for {len(tracks)} tracks "
+        f"({', '.join(str(len(f.starts)) for f in beat_features)} beats)..."
+    )
+    cross: Dict[Tuple[int, int], Dict[str, np.ndarray]] = {}
+    for a in range(len(tracks)):
+        for b in range(a + 1, len(tracks)):
+            cross[(a, b)], cross[(b, a)] = cross_track_edges(beat_features[a], beat_features[b], store)
+
+    members = [_autoharmonizer_track(track) for track in tracks]
+    jump_graph = _jump_graph(
+        [len(features.starts) for features in beat_features],
+        [member["eternal_loop_candidates"] for member in members],
+        cross,
+    )
+    first, second = tracks[0], tracks[1]
+    summaries = [track["audio_summary"] for track in tracks]
+    primary_url = members[0]["audio_url"]
 
     combined_profile = {
         "response": {
@@ -1554,57 +2712,41 @@ def build_autoharmonizer_profile(
             "track": {
                 "id": combined_track_id,
                 "status": "complete",
-                "title": f"{track1['title']} + {track2['title']}",
-                "artist": track1.get("artist", "Unknown"),
-                "audio_url": track1_audio_url,
+                "title": " + ".join(track["title"] for track in tracks),
+                "artist": first.get("artist", "Unknown"),
+                "audio_url": primary_url,
                 "info": {
-                    "url": track1_audio_url,
+                    "url": primary_url,
                 },
                 "audio_summary": {
-                    "duration": max(
-                        track1["audio_summary"]["duration"],
-                        track2["audio_summary"]["duration"]
-                    ),
-                    "tempo": (track1["audio_summary"]["tempo"] + track2["audio_summary"]["tempo"]) / 2,
-                    "time_signature": track1["audio_summary"]["time_signature"],
-                    "key": track1["audio_summary"]["key"],
-                    "mode": track1["audio_summary"]["mode"],
-                    "loudness": (track1["audio_summary"]["loudness"] + track2["audio_summary"]["loudness"]) / 2,
-                    "analysis_sample_rate": track1["audio_summary"]["analysis_sample_rate"],
+                    "duration": max(summary["duration"] for summary in summaries),
+                    "tempo": sum(summary["tempo"] for summary in summaries) / len(summaries),
+                    "time_signature": summaries[0]["time_signature"],
+                    "key": summaries[0]["key"],
+                    "mode": summaries[0]["mode"],
+                    "loudness": sum(summary["loudness"] for summary in summaries) / len(summaries),
+                    "analysis_sample_rate": summaries[0]["analysis_sample_rate"],
                 },
                 "analysis": {
-                    "beats": beats1,  # Use track1 beats as primary timeline
-                    "bars": track1["analysis"]["bars"],
-                    "sections": track1["analysis"]["sections"],
-                    "segments": segments1,
-                    "tatums": track1["analysis"]["tatums"],
+                    "beats": first["analysis"]["beats"],  # Use track1 beats as primary timeline
+                    "bars": first["analysis"]["bars"],
+                    "sections": first["analysis"]["sections"],
+                    "segments": first["analysis"]["segments"],
+                    "tatums": first["analysis"]["tatums"],
                     # Add autoharmonizer-specific data
                     "autoharmonizer": {
-                        "track1": {
-                            "id": track1["id"],
-                            "title": track1["title"],
-                            "audio_url": track1_audio_url,
-                            "beats": beats1,
-                            "bars": track1["analysis"]["bars"],
-                            "segments": segments1,
-                            "duration": track1["audio_summary"]["duration"],
-                            "tempo": track1["audio_summary"]["tempo"],
-                            "eternal_loop_candidates": track1["analysis"].get("eternal_loop_candidates", {}),
-                            "canon_alignment": track1["analysis"].get("canon_alignment", {}),
+                        "track1": 0,
+                        "track2": 1,
+                        "cross_similarity": {
+                            "track1_to_track2": _edges_to_candidates(
+                                cross[(0, 1)], 1, 2, members[0]["beats"], members[1]["beats"]
+                            ),
+                            "track2_to_track1": _edges_to_candidates(
+                                cross[(1, 0)], 2, 1, members[1]["beats"], members[0]["beats"]
+                            ),
                         },
-                        "track2": {
-                            "id": track2["id"],
-                            "title": track2["title"],
-                            "audio_url": track2_audio_url,
-                            "beats": beats2,
-                            "bars": track2["analysis"]["bars"],
-                            "segments": segments2,
-                            "duration": track2["audio_summary"]["duration"],
-                            "tempo": track2["audio_summary"]["tempo"],
-                            "eternal_loop_candidates": track2["analysis"].get("eternal_loop_candidates", {}),
-                            "canon_alignment": track2["analysis"].get("canon_alignment", {}),
-                        },
-                        "cross_similarity": cross_similarity,
+                        "tracks": members,
+                        "jump_graph": jump_graph,
                     },
                 },
             },
@@ -1613,13 +2755,30 @@ def build_autoharmonizer_profile(
 
     # Save combined profile
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("w", encoding="utf-8") as sink:
+    with profile_format.atomic_output(output_path) as sink:
         json.dump(combined_profile, sink, indent=2)
 
     print(f"[Autoharmonizer] Created combined profile: {combined_track_id}")
     return combined_profile
 
 
+def build_autoharmonizer_profile(
+    track1_path: Path,
+    track2_path: Path,
+    combined_track_id: str,
+    output_path: Path,
+    profile1: Optional[Dict] = None,
+    profile2: Optional[Dict] = None,
+) -> Dict:
+    """Two-track form of ``build_set_profile``."""
+    return build_set_profile(
+        [track1_path, track2_path],
+        combined_track_id,
+        output_path,
+        profiles=[profile1, profile2],
+    )
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Generate an Infinite Jukebox compatible analysis profile."
@@ -1639,6 +2798,17 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="Destination JSON path. Defaults to data/<track_id>.json",
     )
+    parser.add_argument(
+        "--no-stage-cache",
+        action="store_true",
+        help="Recompute every stage and do not write <output>.stages/.",
+    )
+    parser.add_argument(
+        "--preset",
+        choices=sorted(ANALYSIS_PRESETS),
+        default=DEFAULT_PRESET,
+        help=f"Analysis speed / resolution trade-off (default: {DEFAULT_PRESET}).",
+    )
     return parser.parse_args()
 
 
@@ -1660,6 +2830,8 @@ def main() -> None:
         artist=args.artist,
         audio_url=audio_url,
         output_path=output_path,
+        persist_stages=not args.no_stage_cache,
+        preset=args.preset,
     )
 
     print(f"Wrote analysis to {output_path}")
@@ -0,0 +1,406 @@
+"""
+Analyse a whole library of audio files in parallel.
+
+Usage:
+    python -m backend.analysis.batch backend/uploads --workers 8
+    python -m backend.analysis.batch "music/**/*.flac" --timeout 600 --report report.json
+    python -m backend.analysis.batch --manifest tracks.jsonl --preset fast
+
+Inputs may be directories (searched recursively for audio), glob patterns or
+plain file paths. A manifest is a text file with one audio path per line, or a
+JSON-lines file whose objects carry ``audio`` plus optional ``track_id``,
+``title``, ``artist`` and ``audio_url``. By default a track's id is its file stem,
+which matches how ``/api/process`` names uploads.
+
+Tracks are spread over worker processes that live for the whole run, so each
+worker pays the librosa import and numba JIT warmup once. ``--timeout``
+terminates the worker of a track that runs too long and starts a new one.
+Profiles are written atomically, so an interrupted or killed track never
+leaves a truncated profile behind. A track
+whose profile already exists at the current ``analysis_version(preset)`` is skipped
+(``--force`` re-runs it; unchanged stages are still reloaded from the stage
+store), which makes an interrupted run safe to restart.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+from collections import deque
+from dataclasses import asdict, dataclass
+from multiprocessing import connection
+from multiprocessing.connection import Connection
+from multiprocessing.context import BaseContext
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .analyze_track import ANALYSIS_PRESETS, DEFAULT_DATA_DIR, DEFAULT_PRESET, analysis_version
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".flac", ".ogg", ".m4a", ".aac"}
+_POLL_SECONDS = 0.5  # how often running tracks are checked against the timeout
+
+
+@dataclass
+class BatchJob:
+    audio: str
+    track_id: str
+    title: str
+    artist: str
+    audio_url: str
+    output: str
+
+
+@dataclass
+class BatchResult:
+    track_id: str
+    audio: str
+    status: str  # "ok" | "skipped" | "failed" | "timeout"
+    seconds: float = 0.0
+    error: Optional[str] = None
+    stages: Optional[Dict[str, float]] = None  # wall seconds per analysis stage
+
+
+def _expand_input(value: str) -> List[Path]:
+    path = Path(value)
+    if path.is_dir():
+        return sorted(
+            p for p in path.rglob("*") if p.is_file() and p.suffix.lower() in AUDIO_EXTENSIONS
+        )
+    if path.is_file():
+        return [path]
+    return sorted(
+        Path(match)
+        for match in glob.glob(value, recursive=True)
+        if Path(match).is_file() and Path(match).suffix.lower() in AUDIO_EXTENSIONS
+    )
+
+
+def _read_manifest(manifest: Path) -> List[Dict[str, str]]:
+    entries: List[Dict[str, str]] = []
+    base = manifest.resolve().parent
+    for line in manifest.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        entry = json.loads(line) if line.startswith("{") else {"audio": line}
+        audio = Path(entry["audio"])
+        entry["audio"] = str(audio if audio.is_absolute() else base / audio)
+        entries.append(entry)
+    return entries
+
+
+def collect_jobs(
+    inputs: Iterable[str],
+    manifest: Optional[Path],
+    output_dir: Path,
+    artist: str,
+    audio_url_prefix: str,
+) -> List[BatchJob]:
+    entries: List[Dict[str, str]] = []
+    for value in inputs:
+        entries.extend({"audio": str(path)} for path in _expand_input(value))
+    if manifest is not None:
+        entries.extend(_read_manifest(manifest))
+
+    jobs: Dict[str, BatchJob] = {}
+    for entry in entries:
+        audio = Path(entry["audio"]).resolve()
+        track_id = entry.get("track_id") or audio.stem
+        if track_id in jobs:
+            print(f"[batch] Duplicate track id {track_id}: keeping {jobs[track_id].audio}", flush=True)
+            continue
+        jobs[track_id] = BatchJob(
+            audio=str(audio),
+            track_id=track_id,
+            title=entry.get("title") or audio.stem,
+            artist=entry.get("artist") or artist,
+            audio_url=entry.get("audio_url") or f"{audio_url_prefix}{audio.name}",
+            output=str(output_dir / f"{track_id}.json"),
+        )
+    return list(jobs.values())
+
+
+def is_current(output: Path, preset: str = DEFAULT_PRESET) -> bool:
+    """True when ``output`` holds a complete profile written by this version and preset."""
+    try:
+        with output.open("r", encoding="utf-8") as handle:
+            profile = json.load(handle)
+        return profile["response"]["track"]["analysis"]["version"] == analysis_version(preset)
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+
+
+def _warm_worker() -> None:
+    """Pool initializer: import librosa and compile its numba kernels once per worker."""
+    import numpy as np
+
+    from .analyze_track import FeatureBank, compute_beats
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl-C
+    sr = 22050
+    t = np.arange(sr * 4) / sr
+    y = (np.sin(2 * np.pi * 220.0 * t) * (np.sin(2 * np.pi * 2.0 * t) > 0)).astype(np.float32)
+    compute_beats(FeatureBank(y, sr))
+
+
+def _run_job(job: BatchJob, preset: str = DEFAULT_PRESET) -> BatchResult:
+    from .analyze_track import build_profile
+
+    started = time.perf_counter()
+    stages = None
+    try:
+        profile = build_profile(
+            audio_path=Path(job.audio),
+            track_id=job.track_id,
+            title=job.title,
+            artist=job.artist,
+            audio_url=job.audio_url,
+            output_path=Path(job.output),
+            preset=preset,
+        )
+        status, error = "ok", None
+        timings = profile["response"]["track"]["analysis"]["timings"]["stages"]
+        stages = {stage: timing["wall_s"] for stage, timing in timings.items()}
+    except Exception as exc:  # pragma: no cover - reported per track
+        status, error = "failed", f"{exc.__class__.__name__}: {exc}"
+        traceback.print_exc()
+    return BatchResult(
+        track_id=job.track_id,
+        audio=job.audio,
+        status=status,
+        seconds=time.perf_counter() - started,
+        error=error,
+        stages=stages,
+    )
+
+
+def _worker_main(conn: Connection, preset: str) -> None:
+    """Worker process: warm up, say so with ``None``, then answer each job with its result."""
+    _warm_worker()
+    conn.send(None)
+    while True:
+        job = conn.recv()
+        if job is None:
+            return
+        conn.send(_run_job(job, preset))
+
+
+class _Worker:
+    """One worker process and the job it is running, if any."""
+
+    def __init__(self, context: BaseContext, preset: str) -> None:
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, preset), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.job: Optional[BatchJob] = None
+        self.started = 0.0
+
+    def assign(self, job: BatchJob) -> None:
+        self.job = job
+        self.started = time.perf_counter()
+        self.conn.send(job)
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join()
+        self.conn.close()
+
+    def kill(self) -> None:
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+
+def run_batch(
+    jobs: List[BatchJob],
+    workers: int,
+    timeout: Optional[float] = None,
+    force: bool = False,
+    preset: str = DEFAULT_PRESET,
+) -> List[BatchResult]:
+    """Analyse ``jobs`` on ``workers`` long-lived processes.
+
+    A track that runs past ``timeout`` seconds has its worker terminated (the
+    only way to stop a stage running on any of its threads) and a fresh
+    worker takes its place. A worker that dies (e.g. killed by the OOM
+    killer) fails only the track it was running.
+    """
+    results: List[BatchResult] = []
+    pending: List[BatchJob] = []
+    for job in jobs:
+        if not force and is_current(Path(job.output), preset):
+            results.append(BatchResult(job.track_id, job.audio, "skipped"))
+        else:
+            pending.append(job)
+    if not pending:
+        return results
+
+    # longest files first so one big track does not finish the run alone
+    pending.sort(key=lambda job: Path(job.audio).stat().st_size, reverse=True)
+    total = len(pending)
+    print(f"[batch] Analysing {total} track(s) on {workers} worker(s); {len(results)} already current", flush=True)
+    queue = deque(pending)
+    context = multiprocessing.get_context()
+    pool = [_Worker(context, preset) for _ in range(min(workers, total))]
+    done = 0
+
+    def report(result: BatchResult) -> None:
+        nonlocal done
+        done += 1
+        results.append(result)
+        note = f" ({result.error})" if result.error else ""
+        print(
+            f"[batch] {done}/{total} {result.status:<7} {result.seconds:7.1f}s {result.track_id}{note}",
+            flush=True,
+        )
+
+    def retire(worker: _Worker, result: BatchResult) -> None:
+        # the worker is gone or its state unknown: replace it while work remains
+        report(result)
+        pool.remove(worker)
+        if queue:
+            pool.append(_Worker(context, preset))
+
+    try:
+        while pool:
+            ready = connection.wait([worker.conn for worker in pool], timeout=_POLL_SECONDS)
+            for worker in [w for w in pool if w.conn in ready]:
+                try:
+                    message = worker.conn.recv()
+                except (EOFError, OSError):
+                    worker.kill()
+                    if worker.job is None:
+                        pool.remove(worker)
+                        continue
+                    job = worker.job
+                    retire(worker, BatchResult(
+                        job.track_id,
+                        job.audio,
+                        "failed",
+                        seconds=time.perf_counter() - worker.started,
+                        error=f"worker exited with code {worker.process.exitcode}",
+                    ))
+                    continue
+                if message is not None:
+                    report(message)
+                worker.job = None
+                if queue:
+                    worker.assign(queue.popleft())
+                else:
+                    worker.stop()
+                    pool.remove(worker)
+            if timeout:
+                now = time.perf_counter()
+                for worker in [w for w in pool if w.job is not None and now - w.started > timeout]:
+                    worker.kill()
+                    retire(worker, BatchResult(
+                        worker.job.track_id,
+                        worker.job.audio,
+                        "timeout",
+                        seconds=now - worker.started,
+                        error=f"exceeded {timeout:g}s",
+                    ))
+    except KeyboardInterrupt:
+        print("[batch] Interrupted; finished tracks are kept, re-run to resume", flush=True)
+        for worker in pool:
+            worker.kill()
+        return results
+    for job in queue:  # every worker died before it could start
+        report(BatchResult(job.track_id, job.audio, "failed", error="no worker left"))
+    return results
+
+
+def summarize(
+    results: List[BatchResult], wall_seconds: float, preset: str = DEFAULT_PRESET
+) -> Dict[str, object]:
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    analysed = sorted(
+        (r for r in results if r.status != "skipped"), key=lambda r: r.seconds, reverse=True
+    )
+    return {
+        "analysis_version": analysis_version(preset),
+        "wall_seconds": wall_seconds,
+        "track_seconds": sum(r.seconds for r in analysed),
+        "counts": counts,
+        "tracks": [asdict(r) for r in analysed] + [asdict(r) for r in results if r.status == "skipped"],
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Analyse many audio files in parallel.")
+    parser.add_argument("inputs", nargs="*", help="Audio files, directories or glob patterns.")
+    parser.add_argument("--manifest", type=Path, default=None, help="Text or JSON-lines track list.")
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=DEFAULT_DATA_DIR,
+        help="Where profiles are written as <track_id>.json. Defaults to data/.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=max(1, (os.cpu_count() or 2) - 1),
+        help="Worker processes (default: CPU count - 1).",
+    )
+    parser.add_argument("--timeout", type=float, default=None, help="Per-track limit in seconds.")
+    parser.add_argument("--force", action="store_true", help="Re-analyse tracks that are already current.")
+    parser.add_argument(
+        "--preset",
+        choices=sorted(ANALYSIS_PRESETS),
+        default=DEFAULT_PRESET,
+        help=f"Analysis preset for every track (default: {DEFAULT_PRESET}).",
+    )
+    parser.add_argument("--artist", default="(unknown artist)", help="Artist for tracks without one.")
+    parser.add_argument(
+        "--audio-url-prefix",
+        default="/media/",
+        help="Prefix joined with the audio filename to form each profile's audio_url.",
+    )
+    parser.add_argument("--report", type=Path, default=None, help="Write the JSON summary here.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.inputs and args.manifest is None:
+        raise SystemExit("Provide at least one input path/glob or --manifest.")
+
+    jobs = collect_jobs(
+        args.inputs, args.manifest, args.output_dir.resolve(), args.artist, args.audio_url_prefix
+    )
+    if not jobs:
+        raise SystemExit("No audio files matched.")
+
+    started = time.perf_counter()
+    results = run_batch(
+        jobs, workers=max(1, args.workers), timeout=args.timeout, force=args.force, preset=args.preset
+    )
+    report = summarize(results, time.perf_counter() - started, args.preset)
+
+    counts = ", ".join(f"{count} {status}" for status, count in sorted(report["counts"].items()))
+    print(f"[batch] Done in {report['wall_seconds']:.1f}s ({report['track_seconds']:.1f}s of analysis): {counts}")
+    for entry in report["tracks"][:10]:
+        if entry["status"] != "skipped":
+            print(f"  {entry['seconds']:7.1f}s  {entry['status']:<7}  {entry['track_id']}")
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"[batch] Report written to {args.report}")
+    if report["counts"].get("failed") or report["counts"].get("timeout"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
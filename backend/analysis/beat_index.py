@@ -0,0 +1,471 @@
+"""
+Library-wide index of per-beat embeddings for "which beats sound like this one".
+
+Every final single-track profile in ``data/`` contributes one vector per
+beat; previews are left out until their refinement replaces them. The
+vector is the unit-normalised timbre + pitch embedding that the
+autoharmonizer compares (``BeatFeatures``), so index scores match cross-track
+jump similarities. Vectors are quantized (int8 by default, or float16) and
+stored as plain ``.npy`` files that are memory-mapped at query time. Opening
+the index therefore reads almost nothing, and web workers share the OS page
+cache. The index is internal state and lives in the (unserved) state
+directory::
+
+    var/beat_index/CURRENT          name of the live generation
+    var/beat_index/<generation>/    manifest.json, vectors.npy, starts.npy
+                                    [ivf_centroids.npy, ivf_order.npy, ivf_offsets.npy]
+
+An update writes a new generation and swaps ``CURRENT`` atomically, so
+readers still holding the previous one keep working. Tracks whose profile
+file is unchanged (same size and mtime) are copied from the live generation
+without re-reading their JSON.
+
+Queries are exact by default: a blocked scan over all rows. The optional
+inverted file (IVF) buckets rows under spherical k-means centroids and scans
+only the ``nprobe`` closest buckets. Product quantization is deliberately not
+used: at 24 dimensions an int8 row is already 24 bytes.
+
+Usage:
+    python -m backend.analysis.beat_index build [--ivf] [--dtype float16]
+    python -m backend.analysis.beat_index query TR0123456789 42 --k 10 --mode ivf
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from . import profile_format
+from .analyze_track import DEFAULT_DATA_DIR, DEFAULT_STATE_DIR, BeatFeatures
+
+INDEX_DIR = DEFAULT_STATE_DIR / "beat_index"
+INDEX_VERSION = 1
+INDEX_DTYPES = ("int8", "float16")
+INT8_SCALE = 127.0
+SEARCH_BLOCK_ROWS = 1 << 16
+KEEP_GENERATIONS = 2
+
+IVF_AUTO = -1  # train with default_ivf_lists(n_rows)
+IVF_ITERATIONS = 10
+IVF_SAMPLE_PER_LIST = 256
+IVF_DEFAULT_NPROBE = 8
+
+
+@dataclass
+class BeatMatch:
+    track_id: str
+    beat: int
+    start: float
+    similarity: float
+
+
+def _quantize(vectors: np.ndarray, dtype: str) -> np.ndarray:
+    if dtype == "int8":
+        return np.clip(np.rint(vectors * INT8_SCALE), -127, 127).astype(np.int8)
+    return vectors.astype(np.float16)
+
+
+def _dequantize(rows: np.ndarray) -> np.ndarray:
+    if rows.dtype == np.int8:
+        return rows.astype(np.float32) / INT8_SCALE
+    return rows.astype(np.float32)
+
+
+def default_ivf_lists(n_rows: int) -> int:
+    return int(np.clip(np.sqrt(n_rows), 1, 4096))
+
+
+def _assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (by cosine) for every row, one block at a time."""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+        block = _dequantize(np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS]))
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def _train_centroids(vectors: np.ndarray, n_lists: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the rows."""
+    rng = np.random.default_rng(seed)
+    n_lists = min(n_lists, len(vectors))
+    sample_size = min(len(vectors), n_lists * IVF_SAMPLE_PER_LIST)
+    sample = _dequantize(np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]))
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+    for _ in range(IVF_ITERATIONS):
+        labels = _assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        filled = norms[:, 0] > 0
+        # empty lists keep their previous centroid
+        centroids[filled] = sums[filled] / norms[filled]
+    return centroids.astype(np.float32)
+
+
+def _profile_source(path: Path) -> Path:
+    """The split core document carries beats and segments at a fraction of the size."""
+    core = profile_format.split_paths(path)[0]
+    return core if core.is_file() else path
+
+
+def _indexable_profiles(data_dir: Path) -> Iterator[Tuple[str, Path]]:
+    for path in sorted(Path(data_dir).glob("*.json")):
+        if "+" not in path.stem:  # autoharmonizer sets only repeat their members
+            yield path.stem, path
+
+
+def _read_beat_features(path: Path) -> Optional[BeatFeatures]:
+    try:
+        with _profile_source(path).open("r", encoding="utf-8") as handle:
+            profile = json.load(handle)
+        analysis = profile["response"]["track"]["analysis"]
+        # previews are indexed once refined; their file changes then
+        if "autoharmonizer" in analysis or analysis.get("preview") or not analysis["beats"]:
+            return None
+        return BeatFeatures.from_profile(profile)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+class BeatIndex:
+    """One memory-mapped generation of the index."""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+        self.generation = self.directory.name
+        manifest = json.loads((self.directory / "manifest.json").read_text(encoding="utf-8"))
+        self.dtype = manifest["dtype"]
+        self.tracks: List[Dict[str, object]] = manifest["tracks"]
+        self.vectors = np.load(self.directory / "vectors.npy", mmap_mode="r")
+        self.starts = np.load(self.directory / "starts.npy", mmap_mode="r")
+        self._rows = {track["id"]: (track["offset"], track["count"]) for track in self.tracks}
+        self._offsets = np.array([track["offset"] for track in self.tracks], dtype=np.int64)
+        self.centroids: Optional[np.ndarray] = None
+        if manifest.get("ivf_lists"):
+            self.centroids = np.load(self.directory / "ivf_centroids.npy")
+            self.ivf_order = np.load(self.directory / "ivf_order.npy", mmap_mode="r")
+            self.ivf_offsets = np.load(self.directory / "ivf_offsets.npy")
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    def __contains__(self, track_id: str) -> bool:
+        return track_id in self._rows
+
+    def track_rows(self, track_id: str) -> Tuple[int, int]:
+        """``(first_row, n_beats)`` of ``track_id``; ``KeyError`` when it is not indexed."""
+        return self._rows[track_id]
+
+    def vector(self, track_id: str, beat: int) -> np.ndarray:
+        offset, count = self.track_rows(track_id)
+        if not 0 <= beat < count:
+            raise IndexError(f"beat {beat} is out of range for {track_id} ({count} beats)")
+        return _dequantize(np.asarray(self.vectors[offset + beat]))
+
+    def _matches(self, rows: np.ndarray, scores: np.ndarray, k: int) -> List[BeatMatch]:
+        if rows.size > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[keep], scores[keep]
+        order = np.lexsort((rows, -scores))
+        rows, scores = rows[order], scores[order]
+        owners = np.searchsorted(self._offsets, rows, side="right") - 1
+        return [
+            BeatMatch(
+                track_id=self.tracks[owner]["id"],
+                beat=int(row - self.tracks[owner]["offset"]),
+                start=float(self.starts[row]),
+                similarity=float(score),
+            )
+            for row, owner, score in zip(rows.tolist(), owners.tolist(), scores.tolist())
+        ]
+
+    def _exact(self, query: np.ndarray, k: int, exclude: Optional[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            scores = _dequantize(np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS])) @ query
+            if exclude is not None:
+                lo, hi = np.clip([exclude[0] - start, exclude[0] + exclude[1] - start], 0, scores.size)
+                scores[lo:hi] = -np.inf
+            rows = np.arange(start, start + scores.size, dtype=np.int64)
+            if scores.size > k:
+                keep = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[keep], scores[keep]
+            best_rows = np.concatenate([best_rows, rows])
+            best_scores = np.concatenate([best_scores, scores])
+            if best_scores.size > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        return best_rows, best_scores
+
+    def _ivf(
+        self, query: np.ndarray, nprobe: int, exclude: Optional[Tuple[int, int]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        probe = np.argsort(-(self.centroids @ query), kind="stable")[:nprobe]
+        rows = np.concatenate(
+            [np.asarray(self.ivf_order[self.ivf_offsets[c]:self.ivf_offsets[c + 1]]) for c in probe]
+        ).astype(np.int64)
+        if exclude is not None:
+            rows = rows[(rows < exclude[0]) | (rows >= exclude[0] + exclude[1])]
+        rows.sort()  # sequential reads from the memory map
+        return rows, _dequantize(np.asarray(self.vectors[rows])) @ query
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        mode: str = "exact",
+        nprobe: int = IVF_DEFAULT_NPROBE,
+        exclude_track: Optional[str] = None,
+    ) -> List[BeatMatch]:
+        """The ``k`` most similar beats to ``query`` (a 24-d vector), best first.
+
+        ``mode="ivf"`` falls back to an exact scan when the generation has no IVF.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) + 1e-8)
+        exclude = self._rows.get(exclude_track) if exclude_track else None
+        if mode == "ivf" and self.centroids is not None:
+            rows, scores = self._ivf(query, nprobe, exclude)
+        else:
+            rows, scores = self._exact(query, k, exclude)
+        valid = np.isfinite(scores)
+        return self._matches(rows[valid], scores[valid], k)
+
+    def neighbors(
+        self,
+        track_id: str,
+        beat: int,
+        k: int = 10,
+        mode: str = "exact",
+        nprobe: int = IVF_DEFAULT_NPROBE,
+        same_track: bool = False,
+    ) -> List[BeatMatch]:
+        """Beats across the library that sound like ``beat`` of ``track_id``."""
+        matches = self.search(
+            self.vector(track_id, beat),
+            k=k + (1 if same_track else 0),
+            mode=mode,
+            nprobe=nprobe,
+            exclude_track=None if same_track else track_id,
+        )
+        matches = [m for m in matches if not (m.track_id == track_id and m.beat == beat)]
+        return matches[:k]
+
+
+_open_indexes: Dict[str, BeatIndex] = {}
+_open_lock = threading.Lock()
+
+
+def open_index(index_dir: Path = INDEX_DIR) -> Optional[BeatIndex]:
+    """The live generation under ``index_dir`` (reopened when it changes), or ``None``."""
+    index_dir = Path(index_dir)
+    try:
+        generation = (index_dir / "CURRENT").read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    with _open_lock:
+        cached = _open_indexes.get(str(index_dir))
+        if cached is not None and cached.generation == generation:
+            return cached
+        try:
+            index = BeatIndex(index_dir / generation)
+        except (OSError, ValueError, KeyError):
+            return None
+        _open_indexes[str(index_dir)] = index
+        return index
+
+
+def _prune_generations(index_dir: Path) -> None:
+    """Keep the newest complete generations; half-written ones belong to a running build."""
+    complete = sorted(
+        (path for path in index_dir.iterdir() if (path / "manifest.json").is_file()),
+        key=lambda path: path.name,
+    )
+    for path in complete[:-KEEP_GENERATIONS]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def build_index(
+    data_dir: Path = DEFAULT_DATA_DIR,
+    index_dir: Path = INDEX_DIR,
+    dtype: str = "int8",
+    ivf_lists: Optional[int] = None,
+    full: bool = False,
+) -> Path:
+    """Write a new generation covering every single-track profile in ``data_dir``.
+
+    Unchanged tracks are copied from the live generation unless ``full`` is
+    set. ``ivf_lists=None`` keeps the live generation's IVF centroids (if any)
+    and only assigns rows to them; ``0`` drops the IVF; a positive count (or
+    ``IVF_AUTO``) trains new centroids. Returns the new generation directory.
+    """
+    if dtype not in INDEX_DTYPES:
+        raise ValueError(f"dtype must be one of {INDEX_DTYPES}")
+    index_dir = Path(index_dir)
+    current = open_index(index_dir)
+    previous: Dict[str, Dict[str, object]] = {}
+    if current is not None and current.dtype == dtype and not full:
+        previous = {track["id"]: track for track in current.tracks}
+
+    vectors: List[np.ndarray] = []
+    starts: List[np.ndarray] = []
+    tracks: List[Dict[str, object]] = []
+    offset = reused = 0
+    for track_id, path in _indexable_profiles(data_dir):
+        stat = path.stat()
+        old = previous.get(track_id)
+        if old is not None and old["mtime_ns"] == stat.st_mtime_ns and old["size"] == stat.st_size:
+            rows = slice(old["offset"], old["offset"] + old["count"])
+            track_vectors = np.asarray(current.vectors[rows])
+            track_starts = np.asarray(current.starts[rows])
+            reused += 1
+        else:
+            features = _read_beat_features(path)
+            if features is None:
+                continue
+            track_vectors = _quantize(features.vectors, dtype)
+            track_starts = features.starts.astype(np.float32)
+        vectors.append(track_vectors)
+        starts.append(track_starts)
+        tracks.append({
+            "id": track_id,
+            "offset": offset,
+            "count": len(track_vectors),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+        })
+        offset += len(track_vectors)
+
+    all_vectors = np.concatenate(vectors) if vectors else _quantize(np.zeros((0, 24), dtype=np.float32), dtype)
+    all_starts = np.concatenate(starts) if starts else np.zeros(0, dtype=np.float32)
+
+    centroids: Optional[np.ndarray] = None
+    if ivf_lists is None:
+        if current is not None and current.centroids is not None:
+            centroids = current.centroids
+    elif ivf_lists and len(all_vectors):
+        n_lists = default_ivf_lists(len(all_vectors)) if ivf_lists == IVF_AUTO else ivf_lists
+        centroids = _train_centroids(all_vectors, n_lists)
+
+    generation = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+    target = index_dir / generation
+    target.mkdir(parents=True)
+    np.save(target / "vectors.npy", all_vectors)
+    np.save(target / "starts.npy", all_starts)
+    if centroids is not None:
+        labels = _assign_lists(all_vectors, centroids)
+        order = np.argsort(labels, kind="stable").astype(np.int32)
+        counts = np.bincount(labels, minlength=len(centroids))
+        np.save(target / "ivf_centroids.npy", centroids)
+        np.save(target / "ivf_order.npy", order)
+        np.save(target / "ivf_offsets.npy", np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+    manifest = {
+        "version": INDEX_VERSION,
+        "dtype": dtype,
+        "dim": int(all_vectors.shape[1]),
+        "rows": int(len(all_vectors)),
+        "ivf_lists": 0 if centroids is None else int(len(centroids)),
+        "tracks": tracks,
+    }
+    # the manifest is written last: a generation without one is incomplete
+    (target / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+
+    pointer = index_dir / f".CURRENT.{uuid.uuid4().hex}.tmp"
+    pointer.write_text(generation, encoding="utf-8")
+    os.replace(pointer, index_dir / "CURRENT")
+    _prune_generations(index_dir)
+    print(
+        f"[beat_index] {len(tracks)} track(s), {len(all_vectors)} beats "
+        f"({len(tracks) - reused} read, {reused} reused); ivf lists: {manifest['ivf_lists']}",
+        flush=True,
+    )
+    return target
+
+
+_update_lock = threading.Lock()
+_update_state = {"running": False, "again": False}
+
+
+def schedule_update(data_dir: Path = DEFAULT_DATA_DIR, index_dir: Path = INDEX_DIR) -> None:
+    """Refresh the index on a daemon thread; calls during a refresh queue one more pass."""
+    with _update_lock:
+        if _update_state["running"]:
+            _update_state["again"] = True
+            return
+        _update_state["running"] = True
+
+    def worker() -> None:
+        while True:
+            try:
+                build_index(data_dir, index_dir)
+            except (OSError, ValueError) as exc:
+                print(f"[beat_index] Update failed: {exc}", flush=True)
+            with _update_lock:
+                if not _update_state["again"]:
+                    _update_state["running"] = False
+                    return
+                _update_state["again"] = False
+
+    threading.Thread(target=worker, name="beat-index-update", daemon=True).start()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build or query the library beat index.")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR, help="Where profiles live.")
+    parser.add_argument("--index-dir", type=Path, default=INDEX_DIR, help="Where the index lives.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Index every profile (unchanged tracks are reused).")
+    build.add_argument("--dtype", choices=INDEX_DTYPES, default="int8")
+    build.add_argument("--full", action="store_true", help="Re-read every profile.")
+    ivf = build.add_mutually_exclusive_group()
+    ivf.add_argument("--ivf", action="store_true", help="Train an IVF with sqrt(rows) lists.")
+    ivf.add_argument("--ivf-lists", type=int, default=None, help="Train an IVF with this many lists (0 drops it).")
+
+    query = commands.add_parser("query", help="Beats that sound like BEAT of TRACK_ID.")
+    query.add_argument("track_id")
+    query.add_argument("beat", type=int)
+    query.add_argument("--k", type=int, default=10)
+    query.add_argument("--mode", choices=("exact", "ivf"), default="exact")
+    query.add_argument("--nprobe", type=int, default=IVF_DEFAULT_NPROBE)
+    query.add_argument("--same-track", action="store_true", help="Include beats of the query track.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    index_dir = args.index_dir
+    if args.command == "build":
+        ivf_lists = IVF_AUTO if args.ivf else args.ivf_lists
+        build_index(args.data_dir, index_dir, dtype=args.dtype, ivf_lists=ivf_lists, full=args.full)
+        return
+
+    index = open_index(index_dir)
+    if index is None:
+        raise SystemExit(f"No beat index under {index_dir}; run the build command first.")
+    started = time.perf_counter()
+    try:
+        matches = index.neighbors(
+            args.track_id, args.beat, k=args.k, mode=args.mode, nprobe=args.nprobe, same_track=args.same_track
+        )
+    except (KeyError, IndexError) as exc:
+        raise SystemExit(f"Not in the index: {exc}")
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"{len(matches)} match(es) among {len(index)} beats in {elapsed:.1f} ms ({args.mode})")
+    for match in matches:
+        print(json.dumps(asdict(match)))
+
+
+if __name__ == "__main__":
+    main()
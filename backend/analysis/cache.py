@@ -0,0 +1,99 @@
+"""
+Content-addressed cache of finished analysis profiles.
+
+Audio is hashed (SHA-256) while it is written to disk. The digest is combined
+with ``analysis_parameters()`` so a new analysis version or retuned constants
+never reuse stale profiles. Each key maps to one small JSON entry under
+``var/analysis_cache/`` naming the track id whose profile and media already
+exist, so lookups are O(1) and concurrent writers never contend for a shared
+index. Entries live outside the served data directory and name the upload
+relative to the upload folder, so no server path is ever exposed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+from .analyze_track import BASE_DIR, DEFAULT_DATA_DIR, DEFAULT_STATE_DIR, StageStore, analysis_parameters
+
+CACHE_DIR = DEFAULT_STATE_DIR / "analysis_cache"
+DEFAULT_UPLOAD_DIR = BASE_DIR.parent / "uploads"
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_and_hash(stream: BinaryIO, destination: Path, chunk_size: int = CHUNK_SIZE) -> str:
+    """Copy ``stream`` to ``destination`` and return the SHA-256 hex digest of the bytes."""
+    digest = hashlib.sha256()
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    with destination.open("wb") as sink:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            sink.write(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(path: Path, chunk_size: int = CHUNK_SIZE) -> str:
+    """SHA-256 hex digest of a file that was written by an external downloader."""
+    digest = hashlib.sha256()
+    with path.open("rb") as source:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(audio_digest: str, parameters: Optional[Dict[str, object]] = None) -> str:
+    """Combine an audio digest with the analysis settings into one cache key."""
+    params = analysis_parameters() if parameters is None else parameters
+    payload = json.dumps({"audio": audio_digest, "analysis": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str) -> Path:
+    return CACHE_DIR / f"{key}.json"
+
+
+def lookup(
+    key: str,
+    data_dir: Path = DEFAULT_DATA_DIR,
+    upload_dir: Path = DEFAULT_UPLOAD_DIR,
+) -> Optional[Dict[str, str]]:
+    """Return the cached entry for ``key`` if its profile and audio are still on disk.
+
+    ``entry["audio_file"]`` is the upload's path relative to ``upload_dir``.
+    """
+    path = _entry_path(key)
+    try:
+        with path.open("r", encoding="utf-8") as handle:
+            entry = json.load(handle)
+    except (OSError, json.JSONDecodeError):
+        return None
+    track_id = entry.get("track_id")
+    audio_file = entry.get("audio_file")
+    if not track_id or not audio_file:
+        return None
+    if not (data_dir / f"{track_id}.json").is_file() or not (upload_dir / audio_file).is_file():
+        # stale entry: the profile or media was cleaned up since it was cached
+        path.unlink(missing_ok=True)
+        StageStore.discard(data_dir / f"{track_id}.json")
+        return None
+    return entry
+
+
+def remember(key: str, track_id: str, audio_path: Path, upload_dir: Path = DEFAULT_UPLOAD_DIR) -> None:
+    """Record that ``track_id`` (analysed from ``audio_path`` inside ``upload_dir``) satisfies ``key``."""
+    audio_file = Path(audio_path).resolve().relative_to(upload_dir.resolve())
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    entry = {"track_id": track_id, "audio_file": audio_file.as_posix()}
+    path = _entry_path(key)
+    tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        json.dump(entry, handle)
+    os.replace(tmp_path, path)
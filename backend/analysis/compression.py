@@ -0,0 +1,140 @@
+"""
+Precompressed sidecars for analysis files served under ``/data``.
+
+A profile never changes once written (except when a progressive preview is
+replaced by its refinement, see progressive.py), so each one is compressed once
+(``TR123.json`` -> ``TR123.json.br`` / ``TR123.json.gz``) on a background
+thread and the web route just picks the best existing sidecar for the
+client's ``Accept-Encoding``. Brotli is used when the optional ``brotli``
+package is installed; gzip is always available.
+
+Sidecars older than their source are treated as missing, so a rewritten
+profile is recompressed instead of serving stale bytes. A file moved into
+place keeps its older mtime, so whoever moves it calls ``discard_sidecars``.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # optional; fall back to gzip only
+    brotli = None
+
+
+def _gzip(data: bytes) -> bytes:
+    # mtime=0 keeps the output (and so its ETag) deterministic
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=11)
+
+
+# Content-Encoding token, file suffix, compressor; best first
+ENCODINGS: List[Tuple[str, str, Callable[[bytes], bytes]]] = [
+    *([("br", ".br", _brotli)] if brotli is not None else []),
+    ("gzip", ".gz", _gzip),
+]
+
+_pending: set = set()
+_pending_lock = threading.Lock()
+_etags: Dict[Tuple[str, int, int], str] = {}
+ETAG_MEMO_SIZE = 4096
+
+
+def sidecar_path(path: Path, suffix: str) -> Path:
+    return path.with_name(path.name + suffix)
+
+
+def _is_fresh(sidecar: Path, source: Path) -> bool:
+    try:
+        return sidecar.stat().st_mtime_ns >= source.stat().st_mtime_ns
+    except OSError:
+        return False
+
+
+def write_sidecars(path: Path) -> List[Path]:
+    """Compress ``path`` into every supported encoding that is missing or stale."""
+    path = Path(path)
+    data: Optional[bytes] = None
+    written = []
+    for _, suffix, compress in ENCODINGS:
+        target = sidecar_path(path, suffix)
+        if _is_fresh(target, path):
+            continue
+        if data is None:
+            data = path.read_bytes()
+        tmp_path = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(compress(data))
+        os.replace(tmp_path, target)
+        written.append(target)
+    return written
+
+
+def discard_sidecars(path: Path) -> None:
+    """Drop every sidecar of ``path``, e.g. after a newer file was moved over it."""
+    for _, suffix, _ in ENCODINGS:
+        sidecar_path(Path(path), suffix).unlink(missing_ok=True)
+
+
+def schedule_sidecars(paths: Iterable[Path]) -> None:
+    """Write sidecars for ``paths`` on a daemon thread; repeated calls are coalesced."""
+    with _pending_lock:
+        todo = [Path(p) for p in paths if str(p) not in _pending]
+        _pending.update(str(p) for p in todo)
+    if not todo:
+        return
+
+    def worker() -> None:
+        for path in todo:
+            try:
+                if path.is_file():
+                    write_sidecars(path)
+            except OSError as exc:
+                print(f"[compression] Could not compress {path}: {exc}", flush=True)
+            finally:
+                with _pending_lock:
+                    _pending.discard(str(path))
+
+    threading.Thread(target=worker, name="sidecar-compress", daemon=True).start()
+
+
+def select_encoding(path: Path, accepted: Callable[[str], float]) -> Tuple[Path, Optional[str]]:
+    """Return the file to send and its Content-Encoding (``None`` for identity).
+
+    ``accepted`` maps an encoding token to the client's quality for it, e.g.
+    ``request.accept_encodings.quality``. When no fresh sidecar is on disk yet,
+    the source is returned and compression is scheduled for next time.
+    """
+    missing = False
+    for token, suffix, _ in ENCODINGS:
+        if accepted(token) <= 0:
+            continue
+        sidecar = sidecar_path(path, suffix)
+        if _is_fresh(sidecar, path):
+            return sidecar, token
+        missing = True
+    if missing:
+        schedule_sidecars([path])
+    return path, None
+
+
+def strong_etag(path: Path, encoding: Optional[str] = None) -> str:
+    """Content hash of the *source* file, tagged with the encoding of the variant sent."""
+    stat = path.stat()
+    memo_key = (str(path), stat.st_mtime_ns, stat.st_size)
+    digest = _etags.get(memo_key)
+    if digest is None:
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()[:32]
+        if len(_etags) >= ETAG_MEMO_SIZE:
+            _etags.clear()
+        _etags[memo_key] = digest
+    return f"{digest}-{encoding}" if encoding else digest
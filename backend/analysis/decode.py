@@ -0,0 +1,363 @@
+"""
+Decode each audio file once and share the PCM between every consumer.
+
+Analysis, autoharmonizer re-analysis and RL snippet rendering all need the
+same samples. ``decode`` turns a file into PCM and keeps it in the (unserved)
+state directory under ``pcm/`` (``$ANALYSIS_PCM_CACHE_DIR`` moves it) as a
+``.npy`` file that later calls memory-map, so reading a slice costs neither a
+decode nor a copy.
+
+Files libsndfile can read (wav, flac, ogg, mp3, ...) are decoded with
+soundfile block by block (MP3 in one read, see ``_soundfile_source``).
+Anything else (m4a, aac, ...) is streamed out of a
+single ``ffmpeg`` process as 32-bit float WAV. By default channels are
+averaged as ``librosa.load`` does. Other sample rates are resampled from the
+cached native-rate PCM with soxr's HQ quality (librosa's ``soxr_hq``), so the
+samples equal ``librosa.load(path, sr=..., mono=True, res_type="soxr_hq")``
+for every format soundfile reads. ``channels=2`` keeps stereo instead (as
+``ffmpeg -ac 2`` would: mono is duplicated, only the front pair of surround
+sources is kept), which is what the RL snippets are rendered from.
+
+Entries are keyed by the source path, size and mtime plus the sample rate,
+channel count and sample type. The cache is an LRU under ``$ANALYSIS_PCM_CACHE_BYTES`` (default
+2 GiB): a hit refreshes the entry's mtime, and every new entry evicts the
+least recently used ones beyond the quota. A quota of 0 disables the cache
+and decodes into memory.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import struct
+import subprocess
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+# analyze_track.DEFAULT_STATE_DIR; not imported from there since analyze_track imports this module
+STATE_DIR = Path(os.environ.get("ANALYSIS_STATE_DIR") or Path(__file__).resolve().parent.parent / "var")
+PCM_CACHE_DIR_ENV = "ANALYSIS_PCM_CACHE_DIR"
+PCM_CACHE_DIR = Path(os.environ.get(PCM_CACHE_DIR_ENV) or STATE_DIR / "pcm")
+PCM_CACHE_QUOTA_ENV = "ANALYSIS_PCM_CACHE_BYTES"
+DEFAULT_PCM_CACHE_QUOTA = 2 * 1024 ** 3
+DECODE_BLOCK_FRAMES = 1 << 18
+RESAMPLE_QUALITY = "HQ"
+PCM_DTYPES = ("float32", "int16")
+
+# WAVE_FORMAT_IEEE_FLOAT / WAVE_FORMAT_EXTENSIBLE
+_WAV_FLOAT_TAGS = (3, 0xFFFE)
+
+
+class DecodeError(RuntimeError):
+    """Neither soundfile nor ffmpeg could decode the file."""
+
+
+@dataclass(frozen=True)
+class DecodedAudio:
+    """PCM of one file; ``samples`` is backed by the cache file when cached.
+
+    Mono samples are 1-D, others ``(frames, channels)``.
+    """
+
+    samples: np.ndarray
+    sr: int
+    source: Path
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / float(self.sr)
+
+    @property
+    def channels(self) -> int:
+        return 1 if self.samples.ndim == 1 else self.samples.shape[1]
+
+    def slice(self, start: float, stop: float) -> np.ndarray:
+        """Samples from ``start`` to ``stop`` seconds, clipped to the file (a view)."""
+        lo = min(max(0, int(round(start * self.sr))), len(self.samples))
+        hi = min(max(lo, int(round(stop * self.sr))), len(self.samples))
+        return self.samples[lo:hi]
+
+    def as_float(self) -> np.ndarray:
+        """float32 samples in [-1, 1]; copies only when the cache stores int16."""
+        return _to_float(self.samples)
+
+
+def cache_quota() -> int:
+    value = os.environ.get(PCM_CACHE_QUOTA_ENV, "").strip()
+    try:
+        return max(0, int(value)) if value else DEFAULT_PCM_CACHE_QUOTA
+    except ValueError:
+        return DEFAULT_PCM_CACHE_QUOTA
+
+
+def _to_float(samples: np.ndarray) -> np.ndarray:
+    if samples.dtype == np.int16:
+        return samples.astype(np.float32) / 32768.0
+    return samples
+
+
+def _mix(block: np.ndarray, channels: int) -> np.ndarray:
+    """``(frames, source channels)`` -> ``channels`` (1: averaged, 1-D)."""
+    if channels == 1:
+        return block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+    if block.shape[1] == 1:
+        return np.repeat(block, channels, axis=1)
+    if block.shape[1] < channels:
+        raise DecodeError(f"cannot make {channels} channels out of {block.shape[1]}")
+    return block[:, :channels]
+
+
+def _soundfile_source(path: Path, channels: int) -> Tuple[int, Iterator[np.ndarray]]:
+    info = sf.info(str(path))  # raises for formats libsndfile cannot read
+    sr = info.samplerate
+
+    def blocks() -> Iterator[np.ndarray]:
+        if info.format == "MP3":
+            # every SoundFile.read() seeks to its own position, which resyncs
+            # libsndfile's MPEG decoder and garbles the samples after each
+            # block boundary; decode in one call instead
+            samples = _mix(sf.read(str(path), dtype="float32", always_2d=True)[0], channels)
+            for start in range(0, len(samples), DECODE_BLOCK_FRAMES):
+                yield samples[start : start + DECODE_BLOCK_FRAMES]
+            return
+        with sf.SoundFile(str(path)) as source:
+            for block in source.blocks(blocksize=DECODE_BLOCK_FRAMES, dtype="float32", always_2d=True):
+                yield _mix(block, channels)
+
+    return sr, blocks()
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _read_wav_header(stream: BinaryIO) -> Tuple[int, int]:
+    """``(sample_rate, channels)`` of a float WAV stream, leaving it at the sample data.
+
+    Chunk sizes are ignored: ffmpeg cannot fill them in when writing to a pipe.
+    """
+    riff = _read_exact(stream, 12)
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+        raise DecodeError("ffmpeg did not produce a WAV stream")
+    fmt: Optional[Tuple[int, ...]] = None
+    while True:
+        header = _read_exact(stream, 8)
+        if len(header) < 8:
+            raise DecodeError("WAV stream ended before its data chunk")
+        chunk_id, size = header[:4], struct.unpack("<I", header[4:])[0]
+        if chunk_id == b"data":
+            break
+        body = _read_exact(stream, size + (size & 1))
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", body[:16])
+    if fmt is None:
+        raise DecodeError("WAV stream has no fmt chunk")
+    tag, channels, sr, _, _, bits = fmt
+    if tag not in _WAV_FLOAT_TAGS or bits != 32:
+        raise DecodeError(f"unexpected WAV sample format {tag}/{bits}")
+    return sr, channels
+
+
+def _ffmpeg_source(path: Path, channels: int) -> Tuple[int, Iterator[np.ndarray]]:
+    binary = shutil.which("ffmpeg")
+    if binary is None:
+        raise DecodeError(f"{path.name}: not readable by soundfile and ffmpeg is not installed")
+    process = subprocess.Popen(
+        [binary, "-v", "error", "-nostdin", "-i", str(path), "-vn", "-acodec", "pcm_f32le", "-f", "wav", "-"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        sr, source_channels = _read_wav_header(process.stdout)
+    except DecodeError:
+        process.kill()
+        _, stderr = process.communicate()
+        raise DecodeError(f"ffmpeg could not decode {path.name}: {stderr.decode(errors='replace').strip()}")
+
+    def blocks() -> Iterator[np.ndarray]:
+        frame_bytes = 4 * source_channels
+        try:
+            while True:
+                data = _read_exact(process.stdout, DECODE_BLOCK_FRAMES * frame_bytes)
+                usable = len(data) - len(data) % frame_bytes
+                if not usable:
+                    break
+                yield _mix(np.frombuffer(data[:usable], dtype="<f4").reshape(-1, source_channels), channels)
+        finally:
+            process.stdout.close()
+            stderr = process.stderr.read()
+            if process.wait() != 0:
+                raise DecodeError(f"ffmpeg failed on {path.name}: {stderr.decode(errors='replace').strip()}")
+
+    return sr, blocks()
+
+
+def _open_source(path: Path, channels: int) -> Tuple[int, Iterator[np.ndarray]]:
+    """Native sample rate and float32 blocks of ``path`` with ``channels`` channels."""
+    try:
+        return _soundfile_source(path, channels)
+    except (RuntimeError, sf.LibsndfileError):
+        return _ffmpeg_source(path, channels)
+
+
+def _resampled_blocks(
+    blocks: Iterator[np.ndarray], sr: int, target_sr: int, channels: int = 1
+) -> Iterator[np.ndarray]:
+    stream = soxr.ResampleStream(sr, target_sr, channels, dtype="float32", quality=RESAMPLE_QUALITY)
+    for block in blocks:
+        yield stream.resample_chunk(np.ascontiguousarray(block, dtype=np.float32))
+    yield stream.resample_chunk(np.zeros((0, channels) if channels > 1 else 0, dtype=np.float32), last=True)
+
+
+def _convert(block: np.ndarray, dtype: str) -> np.ndarray:
+    if dtype == "int16":
+        return np.clip(np.round(block * 32768.0), -32768, 32767).astype(np.int16)
+    return block.astype(np.float32, copy=False)
+
+
+def _entry_key(path: Path, sample_rate: Optional[int], channels: int, dtype: str) -> str:
+    stat = path.stat()
+    payload = f"{path}|{stat.st_size}|{stat.st_mtime_ns}|{sample_rate or 'native'}|{channels}|{dtype}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _find_entry(cache_dir: Path, key: str) -> Optional[Path]:
+    # entries are named <key>.<sample rate>.npy
+    return next(iter(cache_dir.glob(f"{key}.*.npy")), None)
+
+
+def _open_entry(path: Path, source: Path) -> DecodedAudio:
+    samples = np.asarray(np.load(path, mmap_mode="r"))
+    return DecodedAudio(samples, int(path.suffixes[-2][1:]), source)
+
+
+def _write_entry(
+    cache_dir: Path, key: str, sr: int, channels: int, blocks: Iterator[np.ndarray], dtype: str
+) -> Path:
+    """Stream ``blocks`` into ``<key>.<sr>.npy`` without holding the signal in memory."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_dir / f".{key}.{uuid.uuid4().hex}.tmp"
+    # the length is only known at the end: reserve a header for the largest
+    # plausible shape, then rewrite it (both pad to the same size)
+    descr = np.lib.format.dtype_to_descr(np.dtype(dtype))
+    frame_shape = (channels,) if channels > 1 else ()
+    header = {"descr": descr, "fortran_order": False, "shape": (10 ** 15, *frame_shape)}
+    try:
+        with tmp_path.open("wb") as sink:
+            np.lib.format.write_array_header_1_0(sink, header)
+            data_offset = sink.tell()
+            count = 0
+            for block in blocks:
+                sink.write(_convert(block, dtype).tobytes())
+                count += len(block)
+            sink.seek(0)
+            np.lib.format.write_array_header_1_0(sink, dict(header, shape=(count, *frame_shape)))
+            if sink.tell() != data_offset:
+                raise RuntimeError("npy header size changed")
+        path = cache_dir / f"{key}.{sr}.npy"
+        os.replace(tmp_path, path)
+        return path
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def evict(cache_dir: Path = PCM_CACHE_DIR, quota: Optional[int] = None, keep: Optional[Path] = None) -> int:
+    """Delete least recently used entries until the cache fits ``quota``; returns bytes freed."""
+    quota = cache_quota() if quota is None else quota
+    entries = []
+    for path in cache_dir.glob("*.npy"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total - freed <= quota:
+            break
+        if path == keep:
+            continue
+        path.unlink(missing_ok=True)
+        freed += size
+    return freed
+
+
+def _cached(
+    source: Path,
+    sample_rate: Optional[int],
+    channels: int,
+    dtype: str,
+    cache_dir: Path,
+    quota: int,
+    produce: Callable[[], Tuple[int, Iterator[np.ndarray]]],
+) -> DecodedAudio:
+    key = _entry_key(source, sample_rate, channels, dtype)
+    path = _find_entry(cache_dir, key)
+    if path is not None:
+        try:
+            os.utime(path)  # LRU: mtime is the last use
+            return _open_entry(path, source)
+        except (OSError, ValueError):
+            pass  # evicted meanwhile or truncated; decode again
+    sr, blocks = produce()
+    path = _write_entry(cache_dir, key, sr, channels, blocks, dtype)
+    evict(cache_dir, quota, keep=path)
+    return _open_entry(path, source)
+
+
+def decode(
+    audio_path: Path,
+    sample_rate: Optional[int] = None,
+    dtype: str = "float32",
+    cache_dir: Path = PCM_CACHE_DIR,
+    quota: Optional[int] = None,
+    channels: int = 1,
+) -> DecodedAudio:
+    """PCM of ``audio_path`` at ``sample_rate`` (``None``: the file's own rate).
+
+    ``channels=1`` averages the channels into mono, ``2`` gives stereo.
+    ``dtype`` is the cached sample type: ``float32`` (exact, zero-copy for
+    analysis) or ``int16`` (half the disk). Raises ``DecodeError`` when the
+    file cannot be decoded.
+    """
+    if dtype not in PCM_DTYPES:
+        raise ValueError(f"dtype must be one of {', '.join(PCM_DTYPES)}")
+    if channels not in (1, 2):
+        raise ValueError("channels must be 1 or 2")
+    source = Path(audio_path).resolve()
+    quota = cache_quota() if quota is None else quota
+    if quota <= 0:
+        sr, blocks = _open_source(source, channels)
+        if sample_rate is not None and sample_rate != sr:
+            blocks, sr = _resampled_blocks(blocks, sr, sample_rate, channels), sample_rate
+        empty = np.zeros((0, channels) if channels > 1 else 0, dtype=dtype)
+        samples = np.concatenate([_convert(block, dtype) for block in blocks] or [empty])
+        return DecodedAudio(samples, sr, source)
+
+    native = _cached(source, None, channels, dtype, cache_dir, quota, lambda: _open_source(source, channels))
+    if sample_rate is None or sample_rate == native.sr:
+        return native
+
+    def resample() -> Tuple[int, Iterator[np.ndarray]]:
+        float_blocks = (
+            _to_float(native.samples[start:start + DECODE_BLOCK_FRAMES])
+            for start in range(0, len(native.samples), DECODE_BLOCK_FRAMES)
+        )
+        return sample_rate, _resampled_blocks(float_blocks, native.sr, sample_rate, channels)
+
+    return _cached(source, sample_rate, channels, dtype, cache_dir, quota, resample)
@@ -0,0 +1,301 @@
+"""
+Perceptual (chroma) fingerprints for spotting the same song from different sources.
+
+A YouTube rip, a spotdl download and a FLAC upload of one song share no bytes,
+so the content-addressed cache misses them. Their chroma, however, is nearly
+identical. A fingerprint is the track's chroma (taken from the shared
+``FeatureBank``) pooled into one-second windows and quantized to uint8, plus a
+coarse summary vector used to shortlist candidates.
+
+Fingerprints live in a small SQLite index in the (unserved) state directory.
+A query prefilters by duration and summary similarity, then verifies the
+shortlist by aligning the window sequences over a range of time offsets.
+Fingerprints only match between presets that extract chroma the same way;
+changes to the rest of the analysis leave the index valid. A track can be
+indexed under several such signatures: progressively analysed tracks keep
+their ``fast`` preview fingerprint next to the one of their final preset, so
+a new upload can be matched from its preview features alone.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+from .analyze_track import DEFAULT_DATA_DIR, DEFAULT_STATE_DIR, FeatureBank, get_preset
+
+DB_PATH = DEFAULT_STATE_DIR / "fingerprints.sqlite3"
+
+FINGERPRINT_WINDOW_SECONDS = 1.0
+FINGERPRINT_SUMMARY_SLICES = 16
+FINGERPRINT_MATCH_THRESHOLD = 0.90
+FINGERPRINT_MAX_LAG_SECONDS = 20
+FINGERPRINT_MIN_OVERLAP = 0.8
+FINGERPRINT_DURATION_TOLERANCE = 0.1  # fraction of duration (at least 10 s)
+FINGERPRINT_SHORTLIST = 8
+FINGERPRINT_VERSION = 1  # bump when compute_fingerprint changes
+
+
+@dataclass
+class Fingerprint:
+    duration: float
+    summary: np.ndarray  # float32, unit length
+    windows: np.ndarray  # uint8 (n_windows, 12)
+
+
+def _centered_unit_rows(matrix: np.ndarray) -> np.ndarray:
+    """Remove each row's mean and scale to unit length so cosine acts as correlation."""
+    centered = matrix - matrix.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centered, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return centered / norms
+
+
+def compute_fingerprint(features: FeatureBank) -> Fingerprint:
+    """Pool the bank's chroma into fixed-length windows (independent of sample rate)."""
+    chroma = np.asarray(features.chroma, dtype=np.float64)
+    n_frames = chroma.shape[1]
+    frame_seconds = features.hop_length / float(features.sr)
+    window_ids = np.floor(
+        np.arange(n_frames) * frame_seconds / FINGERPRINT_WINDOW_SECONDS
+    ).astype(np.int64)
+    n_windows = int(window_ids[-1]) + 1 if n_frames else 0
+
+    sums = np.zeros((n_windows, chroma.shape[0]), dtype=np.float64)
+    np.add.at(sums, window_ids, chroma.T)
+    peaks = sums.max(axis=1, keepdims=True)
+    peaks[peaks == 0] = 1.0
+    windows = np.round(sums / peaks * 255.0).astype(np.uint8)
+
+    slice_ids = np.arange(n_windows) * FINGERPRINT_SUMMARY_SLICES // max(n_windows, 1)
+    slices = np.zeros((FINGERPRINT_SUMMARY_SLICES, chroma.shape[0]), dtype=np.float64)
+    np.add.at(slices, slice_ids, windows.astype(np.float64))
+    summary = _centered_unit_rows(slices).ravel()
+    norm = np.linalg.norm(summary)
+    if norm > 0:
+        summary /= norm
+    return Fingerprint(
+        duration=float(features.duration),
+        summary=summary.astype(np.float32),
+        windows=windows,
+    )
+
+
+def sequence_similarity(
+    windows_a: np.ndarray,
+    windows_b: np.ndarray,
+    max_lag: int = FINGERPRINT_MAX_LAG_SECONDS,
+    min_overlap: float = FINGERPRINT_MIN_OVERLAP,
+) -> float:
+    """Best mean window correlation over time offsets up to ``max_lag`` windows."""
+    if not len(windows_a) or not len(windows_b):
+        return 0.0
+    a = _centered_unit_rows(windows_a.astype(np.float64))
+    b = _centered_unit_rows(windows_b.astype(np.float64))
+    needed = max(1, int(min_overlap * min(len(a), len(b))))
+    best = 0.0
+    for lag in range(-max_lag, max_lag + 1):
+        # the lag-th diagonal of a @ b.T, without building the full cross matrix
+        start_a, start_b = max(0, -lag), max(0, lag)
+        count = min(len(a) - start_a, len(b) - start_b)
+        if count >= needed:
+            dots = np.einsum("ij,ij->i", a[start_a:start_a + count], b[start_b:start_b + count])
+            best = max(best, float(dots.mean()))
+    return best
+
+
+def _analysis_signature(preset: Optional[str] = None) -> str:
+    """Hash of what shapes a fingerprint: chroma extraction and window pooling."""
+    settings = get_preset(preset)
+    payload = json.dumps(
+        {
+            "version": FINGERPRINT_VERSION,
+            "chroma": settings.chroma,
+            "sample_rate": settings.sample_rate,
+            "hop_length": settings.hop_length,
+            "window_seconds": FINGERPRINT_WINDOW_SECONDS,
+            "summary_slices": FINGERPRINT_SUMMARY_SLICES,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+@contextmanager
+def db_cursor() -> Iterator[sqlite3.Cursor]:
+    conn = _connect()
+    try:
+        yield conn.cursor()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS fingerprints (
+        track_id TEXT NOT NULL,
+        signature TEXT NOT NULL,
+        duration REAL NOT NULL,
+        summary BLOB NOT NULL,
+        windows BLOB NOT NULL,
+        audio_path TEXT NOT NULL,
+        source TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (track_id, signature)
+    )
+"""
+
+
+def _migrate(cur: sqlite3.Cursor) -> None:
+    # indexes created before tracks could carry several signatures were keyed on track_id alone
+    key = {row["name"] for row in cur.execute("PRAGMA table_info(fingerprints)") if row["pk"]}
+    if key != {"track_id"}:
+        return
+    cur.execute("DROP INDEX IF EXISTS idx_fingerprints_duration")
+    cur.execute("DROP INDEX IF EXISTS idx_fingerprints_source")
+    cur.execute("ALTER TABLE fingerprints RENAME TO fingerprints_old")
+    cur.execute(_TABLE_SQL)
+    cur.execute("INSERT INTO fingerprints SELECT * FROM fingerprints_old")
+    cur.execute("DROP TABLE fingerprints_old")
+
+
+def init_db() -> None:
+    with db_cursor() as cur:
+        _migrate(cur)
+        cur.execute(_TABLE_SQL)
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_fingerprints_duration
+            ON fingerprints (signature, duration)
+            """
+        )
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_fingerprints_source
+            ON fingerprints (signature, source)
+            """
+        )
+
+
+def register(
+    track_id: str,
+    fingerprint: Fingerprint,
+    audio_path: Path,
+    source: Optional[str] = None,
+    preset: Optional[str] = None,
+) -> None:
+    """Add (or replace) the fingerprint of an analysed track under ``preset``'s signature."""
+    init_db()
+    with db_cursor() as cur:
+        cur.execute(
+            """
+            INSERT OR REPLACE INTO fingerprints (
+                track_id, signature, duration, summary, windows, audio_path, source
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                track_id,
+                _analysis_signature(preset),
+                fingerprint.duration,
+                fingerprint.summary.astype(np.float32).tobytes(),
+                fingerprint.windows.astype(np.uint8).tobytes(),
+                str(Path(audio_path).resolve()),
+                source,
+            ),
+        )
+
+
+def _is_available(row: sqlite3.Row, data_dir: Path) -> bool:
+    return (data_dir / f"{row['track_id']}.json").is_file() and Path(row["audio_path"]).is_file()
+
+
+def find_by_source(
+    source: str,
+    data_dir: Path = DEFAULT_DATA_DIR,
+    preset: Optional[str] = None,
+) -> Optional[Dict[str, object]]:
+    """Return an analysed track previously fetched from exactly ``source``."""
+    if not source:
+        return None
+    init_db()
+    with db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT track_id, audio_path FROM fingerprints
+            WHERE signature = ? AND source = ?
+            ORDER BY created_at DESC
+            """,
+            (_analysis_signature(preset), source),
+        )
+        rows = cur.fetchall()
+    for row in rows:
+        if _is_available(row, data_dir):
+            return {"track_id": row["track_id"], "audio_path": row["audio_path"], "confidence": 1.0}
+    return None
+
+
+def find_match(
+    fingerprint: Fingerprint,
+    threshold: float = FINGERPRINT_MATCH_THRESHOLD,
+    data_dir: Path = DEFAULT_DATA_DIR,
+    preset: Optional[str] = None,
+    indexed_for: Optional[str] = None,
+) -> Optional[Dict[str, object]]:
+    """Return the best indexed track whose fingerprint matches above ``threshold``.
+
+    ``fingerprint`` was computed with ``preset``. ``indexed_for`` additionally
+    requires the track to be indexed under that preset's signature, e.g. to
+    match a preview fingerprint only against tracks refined with a compatible
+    preset.
+    """
+    tolerance = max(10.0, FINGERPRINT_DURATION_TOLERANCE * fingerprint.duration)
+    init_db()
+    with db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT track_id, summary, windows, audio_path FROM fingerprints
+            WHERE signature = ? AND duration BETWEEN ? AND ?
+            AND track_id IN (SELECT track_id FROM fingerprints WHERE signature = ?)
+            """,
+            (
+                _analysis_signature(preset),
+                fingerprint.duration - tolerance,
+                fingerprint.duration + tolerance,
+                _analysis_signature(indexed_for if indexed_for is not None else preset),
+            ),
+        )
+        rows = cur.fetchall()
+    if not rows:
+        return None
+
+    summaries = np.vstack([np.frombuffer(row["summary"], dtype=np.float32) for row in rows])
+    shortlist = np.argsort(summaries @ fingerprint.summary)[::-1][:FINGERPRINT_SHORTLIST]
+    best: Optional[Dict[str, object]] = None
+    for idx in shortlist:
+        row = rows[int(idx)]
+        if not _is_available(row, data_dir):
+            continue
+        windows = np.frombuffer(row["windows"], dtype=np.uint8).reshape(-1, fingerprint.windows.shape[1])
+        confidence = sequence_similarity(fingerprint.windows, windows)
+        if confidence >= threshold and (best is None or confidence > best["confidence"]):
+            best = {
+                "track_id": row["track_id"],
+                "audio_path": row["audio_path"],
+                "confidence": confidence,
+            }
+    return best
@@ -0,0 +1,303 @@
+"""
+Compact binary profile format ("v2") and the shim back to the legacy JSON.
+
+The legacy profile is Echo Nest shaped: every quantum and segment is an object
+with repeated keys, and every loop-graph edge repeats ``direction``,
+``abs_span`` and ``section_match``. v2 stores the same data column-wise in a
+single file the browser can decode with typed arrays and no extra library::
+
+    b"PWP2" | uint32 manifest length | manifest JSON (utf-8) | pad | column data
+
+The manifest holds everything small (track metadata, canon summary, counts)
+plus a ``columns`` table of ``{dtype, offset, shape}`` entries. Offsets are
+relative to the start of the column data and aligned to 8 bytes, and all
+numbers are little-endian. Times are float64; similarities, confidences,
+loudness and segment features are float32. Fields derivable from others
+(``abs_span``, ``direction``, the per-edge source index) are not stored.
+
+The JSON profile is additionally split for lazy loading: ``<id>/core.json``
+carries everything needed to start playback (quanta, segments, summary) plus
+relative links to ``<id>/canon.json`` and ``<id>/eternal.json``, which hold
+the mode-specific jump data. Each split document has a v2 twin
+(``<id>/core.v2.bin`` ...) holding only the columns of its own keys; a
+sub-resource's manifest is marked ``resource`` and decodes to its bare
+analysis keys.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"PWP2"
+MEDIA_TYPE = "application/vnd.playwrite.profile.v2"
+SUFFIX = ".v2.bin"
+ALIGNMENT = 8
+
+# sub-resource name -> analysis keys moved out of the core document
+SPLIT_RESOURCES = {
+    "canon": ("canon_alignment", "loop_candidates"),
+    "eternal": ("eternal_loop_candidates",),
+}
+
+QUANTUM_GROUPS = ("sections", "bars", "beats", "tatums")
+SEGMENT_COLUMNS = (
+    ("start", "<f8"),
+    ("duration", "<f8"),
+    ("confidence", "<f4"),
+    ("loudness_start", "<f4"),
+    ("loudness_max", "<f4"),
+    ("loudness_max_time", "<f4"),
+    ("pitches", "<f4"),
+    ("timbre", "<f4"),
+)
+
+
+@contextmanager
+def atomic_output(path: Path, mode: str = "w") -> Iterator[IO]:
+    """Open a temporary sibling of ``path`` that replaces it once the block completes.
+
+    Readers see the old file or the whole new one, never a partial write.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with tmp_path.open(mode, encoding=None if "b" in mode else "utf-8") as sink:
+            yield sink
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def v2_path(json_path: Path) -> Path:
+    """``data/TR123.json`` -> ``data/TR123.v2.bin``."""
+    return json_path.with_suffix(SUFFIX)
+
+
+def split_paths(json_path: Path) -> List[Path]:
+    """``data/TR123.json`` -> ``data/TR123/core.json`` and its sub-resources."""
+    directory = json_path.with_suffix("")
+    return [directory / "core.json"] + [directory / f"{name}.json" for name in SPLIT_RESOURCES]
+
+
+class _ColumnWriter:
+    def __init__(self) -> None:
+        self.columns: Dict[str, Dict[str, object]] = {}
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def add(self, name: str, values, dtype: str, width: Optional[int] = None) -> None:
+        array = np.asarray(values, dtype=dtype)
+        if width is not None:
+            array = array.reshape(-1, width)
+        self.columns[name] = {"dtype": dtype, "offset": self.size, "shape": list(array.shape)}
+        data = np.ascontiguousarray(array).tobytes()
+        padding = -len(data) % ALIGNMENT
+        self.chunks.append(data + b"\0" * padding)
+        self.size += len(data) + padding
+
+
+def _pairs_columns(writer: _ColumnWriter, prefix: str, rows: List[Dict], keys: Tuple[str, str]) -> None:
+    for key in keys:
+        writer.add(f"{prefix}.{key}", [row[key] for row in rows], "<i4")
+    writer.add(f"{prefix}.similarity", [row["similarity"] for row in rows], "<f4")
+
+
+def _encode(analysis: Dict[str, object], header: Dict[str, object]) -> bytes:
+    """Pack the column-friendly parts of ``analysis`` (those present) after a manifest."""
+    keys = list(analysis.keys())
+    analysis = dict(analysis)
+    writer = _ColumnWriter()
+
+    for group in QUANTUM_GROUPS:
+        if group not in analysis:
+            continue
+        quanta = analysis.pop(group)
+        writer.add(f"{group}.start", [q["start"] for q in quanta], "<f8")
+        writer.add(f"{group}.duration", [q["duration"] for q in quanta], "<f8")
+        writer.add(f"{group}.confidence", [q["confidence"] for q in quanta], "<f4")
+
+    if "segments" in analysis:
+        segments = analysis.pop("segments")
+        for name, dtype in SEGMENT_COLUMNS:
+            width = 12 if name in ("pitches", "timbre") else None
+            writer.add(f"segments.{name}", [seg[name] for seg in segments], dtype, width)
+
+    if "loop_candidates" in analysis:
+        _pairs_columns(writer, "loop_candidates", analysis.pop("loop_candidates"), ("source", "target"))
+
+    if "eternal_loop_candidates" in analysis:
+        eternal = analysis.pop("eternal_loop_candidates")
+        edges = [edge for key in eternal for edge in eternal[key]]
+        writer.add("eternal.keys", [int(key) for key in eternal], "<i4")
+        writer.add("eternal.counts", [len(eternal[key]) for key in eternal], "<i4")
+        writer.add("eternal.target", [edge["target"] for edge in edges], "<i4")
+        writer.add("eternal.similarity", [edge["similarity"] for edge in edges], "<f4")
+        writer.add("eternal.span", [edge["span"] for edge in edges], "<i4")
+        writer.add("eternal.section_match", [edge["section_match"] for edge in edges], "<u1")
+
+    canon = analysis.get("canon_alignment")
+    canon_keys = list(canon.keys()) if canon else None
+    if canon:
+        canon = dict(canon)
+        writer.add("canon.pairs", canon.pop("pairs"), "<i4")
+        writer.add("canon.pair_similarity", canon.pop("pair_similarity"), "<f4")
+        _pairs_columns(writer, "canon.transitions", canon.pop("transitions"), ("source", "target"))
+        analysis["canon_alignment"] = canon
+
+    manifest = {
+        "format": "playwrite-profile",
+        "version": 2,
+        **header,
+        "analysis": analysis,
+        "analysis_keys": keys,
+        "canon_keys": canon_keys,
+        "columns": writer.columns,
+    }
+    encoded = json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(encoded)) + encoded
+    prefix += b"\0" * (-len(prefix) % ALIGNMENT)
+    return prefix + b"".join(writer.chunks)
+
+
+def encode_profile(profile: Dict[str, object]) -> bytes:
+    """Pack a legacy single-track profile (full or split core) into the v2 container."""
+    response = profile["response"]
+    track = dict(response["track"])
+    analysis = track.pop("analysis")
+    return _encode(analysis, {"status": response["status"], "track": track})
+
+
+def encode_resource(resource: Dict[str, object]) -> bytes:
+    """Pack a split sub-resource (the analysis keys of ``canon.json`` or ``eternal.json``)."""
+    return _encode(resource, {"resource": True})
+
+
+def _read_columns(blob: bytes) -> Tuple[Dict[str, object], Dict[str, np.ndarray]]:
+    if blob[:4] != MAGIC:
+        raise ValueError("not a v2 profile")
+    (length,) = struct.unpack_from("<I", blob, 4)
+    manifest = json.loads(blob[8 : 8 + length].decode("utf-8"))
+    base = 8 + length + (-(8 + length) % ALIGNMENT)
+    columns = {}
+    for name, spec in manifest["columns"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"])) if spec["shape"] else 1
+        columns[name] = np.frombuffer(
+            blob, dtype=dtype, count=count, offset=base + spec["offset"]
+        ).reshape(spec["shape"])
+    return manifest, columns
+
+
+def _rows(columns: Dict[str, np.ndarray], prefix: str, names: Tuple[str, ...]) -> List[Dict[str, object]]:
+    lists = [columns[f"{prefix}.{name}"].tolist() for name in names]
+    return [dict(zip(names, values)) for values in zip(*lists)]
+
+
+def decode_profile(blob: bytes) -> Dict[str, object]:
+    """Rebuild the legacy Echo-Nest-shaped profile from a v2 container.
+
+    A container written by ``encode_resource`` decodes to the sub-resource's
+    analysis keys instead, exactly as its JSON counterpart reads.
+    """
+    manifest, columns = _read_columns(blob)
+    analysis = dict(manifest["analysis"])
+
+    for group in QUANTUM_GROUPS:
+        if f"{group}.start" in columns:
+            analysis[group] = _rows(columns, group, ("start", "duration", "confidence"))
+    if "segments.start" in columns:
+        analysis["segments"] = _rows(columns, "segments", tuple(name for name, _ in SEGMENT_COLUMNS))
+    if "loop_candidates.source" in columns:
+        analysis["loop_candidates"] = _rows(columns, "loop_candidates", ("source", "target", "similarity"))
+
+    if "eternal.keys" in columns:
+        keys = columns["eternal.keys"].tolist()
+        counts = columns["eternal.counts"].tolist()
+        targets = columns["eternal.target"].tolist()
+        similarities = columns["eternal.similarity"].tolist()
+        spans = columns["eternal.span"].tolist()
+        matches = columns["eternal.section_match"].tolist()
+        eternal: Dict[str, List[Dict[str, object]]] = {}
+        cursor = 0
+        for key, count in zip(keys, counts):
+            eternal[str(key)] = [
+                {
+                    "target": targets[i],
+                    "similarity": similarities[i],
+                    "span": spans[i],
+                    "abs_span": abs(spans[i]),
+                    "direction": "forward" if spans[i] > 0 else "backward",
+                    "section_match": bool(matches[i]),
+                }
+                for i in range(cursor, cursor + count)
+            ]
+            cursor += count
+        analysis["eternal_loop_candidates"] = eternal
+
+    canon = analysis.get("canon_alignment")
+    if canon:
+        canon = dict(canon)
+        canon["pairs"] = columns["canon.pairs"].tolist()
+        canon["pair_similarity"] = columns["canon.pair_similarity"].tolist()
+        canon["transitions"] = _rows(columns, "canon.transitions", ("source", "target", "similarity"))
+        analysis["canon_alignment"] = {key: canon[key] for key in manifest["canon_keys"]}
+
+    analysis = {key: analysis[key] for key in manifest["analysis_keys"]}
+    if manifest.get("resource"):
+        return analysis
+    track = dict(manifest["track"])
+    track["analysis"] = analysis
+    return {"response": {"status": manifest["status"], "track": track}}
+
+
+def write_profile(profile: Dict[str, object], json_path: Path) -> Path:
+    """Write the v2 companion of ``json_path`` and return its path."""
+    path = v2_path(json_path)
+    with atomic_output(path, "wb") as sink:
+        sink.write(encode_profile(profile))
+    return path
+
+
+def read_profile(path: Path) -> Dict[str, object]:
+    return decode_profile(Path(path).read_bytes())
+
+
+def split_profile(profile: Dict[str, object]) -> Tuple[Dict[str, object], Dict[str, Dict[str, object]]]:
+    """Return the core document and the lazily fetched sub-resources of ``profile``."""
+    response = profile["response"]
+    analysis = dict(response["track"]["analysis"])
+    resources = {
+        name: {key: analysis.pop(key) for key in keys if key in analysis}
+        for name, keys in SPLIT_RESOURCES.items()
+    }
+    # links are relative to core.json
+    analysis["resources"] = {name: f"{name}.json" for name in resources}
+    track = dict(response["track"], analysis=analysis)
+    return {"response": dict(response, track=track)}, resources
+
+
+def write_split_profile(profile: Dict[str, object], json_path: Path) -> List[Path]:
+    """Write ``<id>/core.json`` plus one file per sub-resource, each with its v2 twin.
+
+    Returns the JSON paths written.
+    """
+    core, resources = split_profile(profile)
+    paths = split_paths(json_path)
+    paths[0].parent.mkdir(parents=True, exist_ok=True)
+    documents = [core] + [resources[name] for name in SPLIT_RESOURCES]
+    encoded = [encode_profile(core)] + [encode_resource(resources[name]) for name in SPLIT_RESOURCES]
+    # sub-resources first, so core.json never links to a missing file
+    for path, document, blob in reversed(list(zip(paths, documents, encoded))):
+        with atomic_output(v2_path(path), "wb") as sink:
+            sink.write(blob)
+        with atomic_output(path) as sink:
+            json.dump(document, sink, separators=(",", ":"))
+    return paths
@@ -0,0 +1,311 @@
+"""
+Progressive (two-pass) analysis: start playback from a preview profile.
+
+``build_preview`` runs the ``fast`` preset with ``preview=True``. The result
+holds beats, bars, tatums, sections, segments and a sparse loop graph but no
+canon alignment, which is enough for the player to start (canon modes fold by
+section until the alignment arrives). ``schedule_refinement`` then runs the
+requested preset on a background thread into a scratch directory and moves
+the finished files over the preview with ``os.replace``. Sub-resources go
+first and the legacy JSON last, so every file a client can fetch is complete.
+The two passes use different presets and so share no stages; neither keeps
+a ``<output>.stages/`` directory.
+
+Profiles written this way carry ``analysis.revision``; the preview is
+revision 1 and each refinement bumps it. The current revision and state of a
+track (``refining`` -> ``final`` or ``failed``) live in ``<id>.revision.json``
+next to the profile. ``/api/process/status/<id>`` reports it, and the
+``/data`` route serves a track without its long-lived ``immutable`` caching
+until its state is ``final``. Clients poll the status and refetch the profile
+with ``?rev=<revision>``, so a cached preview is never mistaken for the
+refined profile.
+
+A ``refining`` record also stores the pid of the process running the
+refinement, when it started and the job itself. Refinement threads die with
+their process, so ``resume_stale`` marks a record whose process is gone (or
+that has been refining for longer than ``refine_deadline()``) as failed and
+schedules the job again.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from . import compression, profile_format
+from .analyze_track import FeatureBank, build_profile, load_features
+
+PREVIEW_PRESET = "fast"
+REVISION_SUFFIX = ".revision.json"
+REFINE_DEADLINE_ENV = "ANALYSIS_REFINE_DEADLINE_SECONDS"
+DEFAULT_REFINE_DEADLINE_SECONDS = 3600.0
+# fields of a revision record that clients may see
+PUBLIC_FIELDS = ("revision", "state", "error")
+
+_pending: set = set()
+_pending_lock = threading.Lock()
+
+
+def revision_path(json_path: Path) -> Path:
+    """``data/TR123.json`` -> ``data/TR123.revision.json``."""
+    return json_path.with_suffix(REVISION_SUFFIX)
+
+
+def read_revision(json_path: Path) -> Optional[Dict[str, object]]:
+    """The ``{"revision", "state"}`` record of a progressively analysed track, if any."""
+    try:
+        return json.loads(revision_path(json_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def public_record(record: Dict[str, object]) -> Dict[str, object]:
+    """The part of a revision record reported to clients (no pids or server paths)."""
+    return {field: record[field] for field in PUBLIC_FIELDS if field in record}
+
+
+def write_revision(
+    json_path: Path,
+    revision: int,
+    state: str,
+    error: Optional[str] = None,
+    job: Optional[Dict[str, object]] = None,
+) -> Dict[str, object]:
+    """Atomically write the revision record; ``refining`` ones are stamped with this process."""
+    record: Dict[str, object] = {"revision": revision, "state": state}
+    if error:
+        record["error"] = error
+    if state == "refining":
+        record.update(pid=os.getpid(), started_at=time.time())
+        if job:
+            record["job"] = job
+    path = revision_path(json_path)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp_path.write_text(json.dumps(record), encoding="utf-8")
+    os.replace(tmp_path, path)
+    return record
+
+
+def is_preview(json_path: Path) -> bool:
+    """True while the profile at ``json_path`` has not been replaced by its refinement."""
+    record = read_revision(json_path)
+    return record is not None and record.get("state") != "final"
+
+
+def refine_deadline() -> float:
+    value = os.environ.get(REFINE_DEADLINE_ENV, "").strip()
+    try:
+        return float(value) if value else DEFAULT_REFINE_DEADLINE_SECONDS
+    except ValueError:
+        return DEFAULT_REFINE_DEADLINE_SECONDS
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # alive, but owned by another user
+        return True
+    return True
+
+
+def is_stale(json_path: Path, record: Dict[str, object]) -> bool:
+    """True if ``record`` says ``refining`` but no worker will ever finish it.
+
+    In this process that is known exactly from the pending set. Another
+    process's record is stale once that pid has exited or the refinement has
+    outlived ``refine_deadline()`` (pids are reused after restarts). Records
+    without a pid or start time are stale.
+    """
+    if record.get("state") != "refining":
+        return False
+    pid, started_at = record.get("pid"), record.get("started_at")
+    if not isinstance(pid, int) or not isinstance(started_at, (int, float)):
+        return True
+    if pid == os.getpid():
+        with _pending_lock:
+            return str(json_path) not in _pending
+    return time.time() - started_at > refine_deadline() or not _pid_alive(pid)
+
+
+def build_preview(
+    audio_path: Path,
+    track_id: str,
+    title: str,
+    artist: str,
+    audio_url: str,
+    output_path: Path,
+    features: Optional[FeatureBank] = None,
+) -> Dict[str, object]:
+    """Write the revision-1 preview profile of ``audio_path`` and mark it as refining.
+
+    ``features`` must come from ``load_features(audio_path, preset=PREVIEW_PRESET)``.
+    """
+    profile = build_profile(
+        audio_path=audio_path,
+        track_id=track_id,
+        title=title,
+        artist=artist,
+        audio_url=audio_url,
+        output_path=output_path,
+        features=features,
+        persist_stages=False,
+        preset=PREVIEW_PRESET,
+        preview=True,
+        revision=1,
+    )
+    write_revision(output_path, 1, "refining")
+    return profile
+
+
+def _profile_files(json_path: Path) -> List[Path]:
+    # replacement order: sub-resources before the core and full documents linking to them
+    core, *resources = profile_format.split_paths(json_path)
+    documents = [*resources, core, json_path]
+    return [path for document in documents for path in (profile_format.v2_path(document), document)]
+
+
+def refine(
+    audio_path: Path,
+    track_id: str,
+    title: str,
+    artist: str,
+    audio_url: str,
+    output_path: Path,
+    preset: Optional[str] = None,
+    features: Optional[FeatureBank] = None,
+) -> Dict[str, object]:
+    """Build the full profile in a scratch directory and swap it in over the preview at ``output_path``."""
+    record = read_revision(output_path) or {"revision": 1}
+    revision = int(record["revision"]) + 1
+    scratch = Path(tempfile.mkdtemp(prefix=f".refine-{track_id}-", dir=output_path.parent))
+    try:
+        staged_path = scratch / output_path.name
+        profile = build_profile(
+            audio_path=audio_path,
+            track_id=track_id,
+            title=title,
+            artist=artist,
+            audio_url=audio_url,
+            output_path=staged_path,
+            features=features,
+            preset=preset,
+            revision=revision,
+            persist_stages=False,
+        )
+        for source, target in zip(_profile_files(staged_path), _profile_files(output_path)):
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(source, target)
+            # sidecars of the preview may be newer than the staged file
+            compression.discard_sidecars(target)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    write_revision(output_path, revision, "final")
+    return profile
+
+
+def schedule_refinement(
+    audio_path: Path,
+    track_id: str,
+    title: str,
+    artist: str,
+    audio_url: str,
+    output_path: Path,
+    preset: Optional[str] = None,
+    on_done: Optional[Callable[[Dict[str, object], FeatureBank], None]] = None,
+    context: Optional[Dict[str, object]] = None,
+) -> None:
+    """Run ``refine`` on a daemon thread; ``on_done(profile, features)`` follows a success.
+
+    A track that is already being refined is not queued twice. The job is
+    kept in the revision record, together with the JSON-serialisable
+    ``context`` the caller needs to rebuild ``on_done`` in ``resume_stale``.
+    """
+    key = str(output_path)
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    job = {
+        "track_id": track_id,
+        "audio_path": str(audio_path),
+        "title": title,
+        "artist": artist,
+        "audio_url": audio_url,
+        "preset": preset,
+        "context": dict(context or {}),
+    }
+    record = read_revision(output_path) or {"revision": 1}
+    write_revision(output_path, int(record["revision"]), "refining", job=job)
+
+    def worker() -> None:
+        try:
+            features = load_features(audio_path, preset=preset)
+            profile = refine(audio_path, track_id, title, artist, audio_url, output_path, preset, features)
+            if on_done is not None:
+                on_done(profile, features)
+            print(f"[progressive] Refined {track_id}", flush=True)
+        except Exception as exc:  # the preview stays playable
+            traceback.print_exc()
+            record = read_revision(output_path) or {"revision": 1}
+            write_revision(output_path, int(record["revision"]), "failed", f"{exc.__class__.__name__}: {exc}")
+        finally:
+            with _pending_lock:
+                _pending.discard(key)
+
+    threading.Thread(target=worker, name=f"refine-{track_id}", daemon=True).start()
+
+
+def resume_stale(
+    json_path: Path,
+    on_done_for: Optional[Callable[[Dict[str, object]], Callable[[Dict[str, object], FeatureBank], None]]] = None,
+) -> bool:
+    """Mark a stale ``refining`` record (see ``is_stale``) failed and schedule its job again.
+
+    ``on_done_for(job)`` builds the ``on_done`` of the resumed refinement from
+    the stored job. The preview stays up as it is when the audio is gone.
+    Returns True if the record was stale.
+    """
+    record = read_revision(json_path)
+    if record is None or not is_stale(json_path, record):
+        return False
+    write_revision(json_path, int(record["revision"]), "failed", "refinement was interrupted")
+    job = record.get("job")
+    if not isinstance(job, dict) or not Path(job["audio_path"]).is_file():
+        print(f"[progressive] Cannot resume the refinement of {json_path.stem}", flush=True)
+        return True
+    print(f"[progressive] Resuming the interrupted refinement of {job['track_id']}", flush=True)
+    schedule_refinement(
+        Path(job["audio_path"]),
+        job["track_id"],
+        job["title"],
+        job["artist"],
+        job["audio_url"],
+        json_path,
+        preset=job.get("preset"),
+        on_done=on_done_for(job) if on_done_for is not None else None,
+        context=job.get("context"),
+    )
+    return True
+
+
+def resume_all_stale(
+    data_dir: Path,
+    on_done_for: Optional[Callable[[Dict[str, object]], Callable[[Dict[str, object], FeatureBank], None]]] = None,
+) -> List[str]:
+    """``resume_stale`` every progressively analysed track in ``data_dir``; returns the stale track ids."""
+    stale = []
+    for path in sorted(data_dir.glob(f"*{REVISION_SUFFIX}")):
+        json_path = path.with_name(path.name[: -len(REVISION_SUFFIX)] + ".json")
+        if resume_stale(json_path, on_done_for):
+            stale.append(json_path.stem)
+    return stale
@@ -0,0 +1,329 @@
+"""
+Per-stage timing and memory of ``build_profile``.
+
+``StageProfiler.stage(name)`` wraps one analysis stage and records:
+
+- ``wall_s``: its wall time;
+- ``thread_cpu_s``: the CPU time of the thread that ran it
+  (``time.thread_time``), so stages running side by side with
+  ``stage_workers > 1`` are not charged each other's work. Work the stage
+  hands to other threads (BLAS, FFT or resampler pools) is not included;
+- ``process_max_rss_bytes``: the process's resident set size high-water mark
+  when the stage ended (``getrusage``). It never decreases and covers every
+  thread, so it only tells in which stage the process peak was reached.
+
+A per-stage memory figure needs ``tracemalloc``, which more than doubles
+analysis time, so ``peak_traced_bytes`` is only recorded when
+``$ANALYSIS_TRACE_MEMORY`` is set. Tracing then runs while any stage is open,
+and a stage's traced peak is the highest traced total (of the whole process)
+seen while it was open.
+
+Each build writes its timings into ``analysis.timings``, prints them as one
+JSON log line and appends one row per stage to ``analysis_metrics.sqlite3``
+in the (unserved) state directory (``$ANALYSIS_METRICS_DB`` moves it; an
+empty value disables it). ``summary`` aggregates those rows per version,
+preset and stage.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_DB_ENV = "ANALYSIS_METRICS_DB"
+# in analyze_track.DEFAULT_STATE_DIR; not imported from there since analyze_track imports this module
+DEFAULT_METRICS_DB = (
+    Path(os.environ.get("ANALYSIS_STATE_DIR") or Path(__file__).resolve().parent.parent / "var")
+    / "analysis_metrics.sqlite3"
+)
+TRACE_MEMORY_ENV = "ANALYSIS_TRACE_MEMORY"
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+_trace_lock = threading.Lock()
+_trace_users = 0
+_trace_started = False  # whether tracemalloc was started here (and so is ours to stop)
+_open_peaks: Dict[int, int] = {}  # traced peak seen so far by every open stage
+
+
+@dataclass
+class StageTiming:
+    stage: str
+    wall_s: float = 0.0
+    thread_cpu_s: float = 0.0
+    process_max_rss_bytes: Optional[int] = None
+    peak_traced_bytes: Optional[int] = None
+    cached: bool = False
+
+    def as_dict(self) -> Dict[str, object]:
+        record: Dict[str, object] = {
+            "wall_s": round(self.wall_s, 4),
+            "thread_cpu_s": round(self.thread_cpu_s, 4),
+            "cached": self.cached,
+        }
+        if self.process_max_rss_bytes is not None:
+            record["process_max_rss_bytes"] = self.process_max_rss_bytes
+        if self.peak_traced_bytes is not None:
+            record["peak_traced_bytes"] = self.peak_traced_bytes
+        return record
+
+
+def trace_memory_enabled() -> bool:
+    return os.environ.get(TRACE_MEMORY_ENV, "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _process_max_rss() -> Optional[int]:
+    if resource is None:
+        return None
+    return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * _RSS_UNIT
+
+
+def _fold_peak() -> None:
+    # hand the peak since the last reset to every open stage, then reset it, so
+    # overlapping stages (of any build) each see the highest point of their lifetime
+    peak = tracemalloc.get_traced_memory()[1]
+    for token in _open_peaks:
+        _open_peaks[token] = max(_open_peaks[token], peak)
+    tracemalloc.reset_peak()
+
+
+def _start_tracing() -> None:
+    global _trace_users, _trace_started
+    with _trace_lock:
+        if _trace_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _trace_started = True
+        _trace_users += 1
+
+
+def _stop_tracing() -> None:
+    global _trace_users, _trace_started
+    with _trace_lock:
+        _trace_users -= 1
+        if _trace_users == 0 and _trace_started:
+            tracemalloc.stop()
+            _trace_started = False
+
+
+class StageProfiler:
+    """Collects a ``StageTiming`` per stage; safe to use from several threads."""
+
+    def __init__(self, trace_memory: Optional[bool] = None) -> None:
+        self.trace_memory = trace_memory_enabled() if trace_memory is None else trace_memory
+        self.stages: List[StageTiming] = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageTiming]:
+        timing = StageTiming(name)
+        token = id(timing)
+        if self.trace_memory:
+            _start_tracing()
+            with _trace_lock:
+                _fold_peak()
+                _open_peaks[token] = 0
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield timing
+        finally:
+            timing.wall_s = time.perf_counter() - wall
+            timing.thread_cpu_s = time.thread_time() - cpu
+            timing.process_max_rss_bytes = _process_max_rss()
+            if self.trace_memory:
+                with _trace_lock:
+                    _fold_peak()
+                    timing.peak_traced_bytes = _open_peaks.pop(token)
+                _stop_tracing()
+            with self._lock:
+                self.stages.append(timing)
+
+    def timings(self) -> List[StageTiming]:
+        with self._lock:
+            return list(self.stages)
+
+    @property
+    def total_s(self) -> float:
+        return time.perf_counter() - self._started
+
+    def as_dict(self) -> Dict[str, object]:
+        """The ``analysis.timings`` block: total wall time plus one entry per stage."""
+        stages = {timing.stage: timing.as_dict() for timing in self.timings()}
+        return {"total_s": round(self.total_s, 4), "stages": stages}
+
+
+def log(profiler: StageProfiler, **context: object) -> None:
+    """Print the timings as a single JSON line for log collection."""
+    print(json.dumps({"event": "analysis_timings", **context, **profiler.as_dict()}), flush=True)
+
+
+def metrics_db_path() -> Optional[Path]:
+    value = os.environ.get(METRICS_DB_ENV)
+    if value is None:
+        return DEFAULT_METRICS_DB
+    return Path(value) if value.strip() else None
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(stage_timings)")}
+    if columns and "thread_cpu_s" not in columns:
+        # rows from before per-thread CPU measured something else; keep them apart
+        with conn:
+            conn.execute("DROP INDEX IF EXISTS idx_stage_timings_version")
+            conn.execute("ALTER TABLE stage_timings RENAME TO stage_timings_process_cpu")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stage_timings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            track_id TEXT NOT NULL,
+            version TEXT NOT NULL,
+            preset TEXT NOT NULL,
+            preview INTEGER NOT NULL DEFAULT 0,
+            audio_duration REAL NOT NULL,
+            stage TEXT NOT NULL,
+            wall_s REAL NOT NULL,
+            thread_cpu_s REAL NOT NULL,
+            process_max_rss_bytes INTEGER,
+            peak_traced_bytes INTEGER,
+            cached INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_stage_timings_version
+        ON stage_timings (version, preset, stage)
+        """
+    )
+    return conn
+
+
+def record(
+    profiler: StageProfiler,
+    track_id: str,
+    version: str,
+    preset: str,
+    audio_duration: float,
+    preview: bool = False,
+    db_path: Optional[Path] = None,
+) -> None:
+    """Append one row per stage; metrics never fail an analysis."""
+    db_path = db_path or metrics_db_path()
+    if db_path is None:
+        return
+    stages = profiler.timings()
+    try:
+        conn = _connect(db_path)
+        try:
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT INTO stage_timings (
+                        track_id, version, preset, preview, audio_duration, stage,
+                        wall_s, thread_cpu_s, process_max_rss_bytes, peak_traced_bytes, cached
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (
+                            track_id,
+                            version,
+                            preset,
+                            int(preview),
+                            float(audio_duration),
+                            timing.stage,
+                            timing.wall_s,
+                            timing.thread_cpu_s,
+                            timing.process_max_rss_bytes,
+                            timing.peak_traced_bytes,
+                            int(timing.cached),
+                        )
+                        for timing in stages
+                    ],
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error as exc:
+        print(f"[Analysis] Could not record stage timings: {exc}", flush=True)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summary(
+    version: Optional[str] = None,
+    preset: Optional[str] = None,
+    db_path: Optional[Path] = None,
+) -> List[Dict[str, object]]:
+    """Per (version, preset, stage) statistics over computed (non-cached) runs.
+
+    ``wall_per_audio_minute_s`` normalises for track length, so long and short
+    tracks can be compared. ``process_max_rss_bytes`` is the highest process
+    high-water mark seen at the end of the stage, not memory the stage used.
+    """
+    db_path = db_path or metrics_db_path()
+    if db_path is None or not db_path.is_file():
+        return []
+    clauses, params = ["cached = 0", "preview = 0"], []
+    if version:
+        clauses.append("version = ?")
+        params.append(version)
+    if preset:
+        clauses.append("preset = ?")
+        params.append(preset)
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT version, preset, stage, audio_duration, wall_s, thread_cpu_s, process_max_rss_bytes
+            FROM stage_timings WHERE {' AND '.join(clauses)}
+            ORDER BY version, preset, stage
+            """,
+            params,
+        ).fetchall()
+    finally:
+        conn.close()
+
+    groups: Dict[tuple, List[sqlite3.Row]] = {}
+    for row in rows:
+        groups.setdefault((row["version"], row["preset"], row["stage"]), []).append(row)
+    report = []
+    for (group_version, group_preset, stage), members in groups.items():
+        walls = [row["wall_s"] for row in members]
+        minutes = sum(row["audio_duration"] for row in members) / 60.0
+        rss = [row["process_max_rss_bytes"] for row in members if row["process_max_rss_bytes"] is not None]
+        report.append({
+            "version": group_version,
+            "preset": group_preset,
+            "stage": stage,
+            "runs": len(members),
+            "wall_mean_s": round(sum(walls) / len(walls), 4),
+            "wall_p50_s": round(_percentile(walls, 0.5), 4),
+            "wall_p95_s": round(_percentile(walls, 0.95), 4),
+            "wall_per_audio_minute_s": round(sum(walls) / minutes, 4) if minutes > 0 else None,
+            "thread_cpu_mean_s": round(sum(row["thread_cpu_s"] for row in members) / len(members), 4),
+            "process_max_rss_bytes": max(rss) if rss else None,
+        })
+    return report
@@ -7,8 +7,9 @@ import os
 import mimetypes
 import re
 import uuid
+from dataclasses import asdict
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 
 # Ensure PyTorch doesn't attempt to initialize NNPACK on hardware that doesn't support it.
 os.environ.setdefault("PYTORCH_JIT_USE_NNPACK", "0")
@@ -26,6 +27,7 @@ from flask import (
     url_for,
 )
 # from flask_session import Session  # Not needed for OurSpace functionality
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
@@ -214,12 +216,44 @@ except ImportError:  # pragma: no cover
 BASE_DIR = Path(__file__).parent.resolve()
 
 try:
-    from .analysis.analyze_track import build_profile
+    from .analysis.analyze_track import (
+        ANALYSIS_PRESETS,
+        AUTOHARMONIZER_MAX_TRACKS,
+        DEFAULT_PRESET,
+        DEFAULT_STATE_DIR,
+        analysis_parameters,
+        build_profile,
+        build_set_profile,
+        load_features,
+    )
+    from .analysis import cache as analysis_cache
+    from .analysis import fingerprint as fingerprint_index
+    from .analysis import profile_format
+    from .analysis import compression as analysis_compression
+    from .analysis import beat_index
+    from .analysis import progressive as progressive_analysis
+    from .analysis import timings as analysis_timings
 except ImportError:  # pragma: no cover - support running as script
     import sys
 
     sys.path.append(str(BASE_DIR))
-    from analysis.analyze_track import build_profile  # type: ignore
+    from analysis.analyze_track import (  # type: ignore
+        ANALYSIS_PRESETS,
+        AUTOHARMONIZER_MAX_TRACKS,
+        DEFAULT_PRESET,
+        DEFAULT_STATE_DIR,
+        analysis_parameters,
+        build_profile,
+        build_set_profile,
+        load_features,
+    )
+    from analysis import cache as analysis_cache  # type: ignore
+    from analysis import fingerprint as fingerprint_index  # type: ignore
+    from analysis import profile_format  # type: ignore
+    from analysis import compression as analysis_compression  # type: ignore
+    from analysis import beat_index  # type: ignore
+    from analysis import progressive as progressive_analysis  # type: ignore
+    from analysis import timings as analysis_timings  # type: ignore
 
 try:
     from .eldrichify import EldrichifyPipeline
@@ -236,6 +270,7 @@ STUDY_DIR = BASE_DIR.parent / "Study"
 
 UPLOAD_FOLDER = BASE_DIR / "uploads"
 DATA_FOLDER = BASE_DIR / "data"
+BEAT_INDEX_FOLDER = DEFAULT_STATE_DIR / "beat_index"
 ALLOWED_EXTENSIONS = {".mp3", ".wav", ".flac", ".ogg", ".m4a", ".aac"}
 
 UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
@@ -515,10 +550,186 @@ def _image_to_data_url(image) -> str:
     return f"data:image/png;base64,{encoded}"
 
 
+TRACK_ID_PATTERN = re.compile(r"TR[0-9A-F]{10}")
+
+
 def generate_track_id() -> str:
     return "TR" + uuid.uuid4().hex[:10].upper()
 
 
+def _analyze_or_reuse(
+    audio_path: Path,
+    audio_digest: str,
+    track_id: str,
+    title: str,
+    artist: str,
+    source: Optional[str] = None,
+    reuse: bool = True,
+    preset: str = DEFAULT_PRESET,
+    progressive: bool = False,
+) -> Tuple[str, Optional[Dict]]:
+    """Return a track id whose profile covers ``audio_path``, analysing only on a cache miss.
+
+    Byte-identical audio is caught by the content hash; the same song from a
+    different source (re-encoded, resampled) is caught by its chroma fingerprint
+    after decoding. ``reuse=False`` forces a fresh analysis. The profile is
+    returned too when it was just built (``None`` when reused from disk).
+    Profiles are only reused within the same analysis ``preset``.
+
+    ``progressive=True`` returns as soon as a preview profile is written and
+    refines it in the background (see ``analysis/progressive.py``). Its
+    fingerprint is matched from the preview features, against tracks that were
+    indexed under the preview preset and also refined with a preset compatible
+    with ``preset``. Such a track is only added to the cache and fingerprint
+    index (under both presets) once it is refined. Refinements interrupted by a
+    restart are resumed here too.
+    """
+    key = analysis_cache.cache_key(audio_digest, analysis_parameters(preset))
+    if reuse:
+        cached = analysis_cache.lookup(key, data_dir=DATA_FOLDER, upload_dir=UPLOAD_FOLDER)
+        if cached:
+            if (UPLOAD_FOLDER / cached["audio_file"]).resolve() != audio_path.resolve():
+                # identical bytes are already stored under the cached track
+                audio_path.unlink(missing_ok=True)
+            print(f"[API] Analysis cache hit: reusing {cached['track_id']}", flush=True)
+            return cached["track_id"], None
+
+    audio_url = url_for("media", filename=audio_path.name)
+    output_path = DATA_FOLDER / f"{track_id}.json"
+    if progressive:
+        progressive_analysis.resume_all_stale(DATA_FOLDER, _resumed_refinement_done)
+        preview_preset = progressive_analysis.PREVIEW_PRESET
+        preview_features = load_features(audio_path, preset=preview_preset)
+        preview_fingerprint = fingerprint_index.compute_fingerprint(preview_features)
+        if reuse:
+            match = fingerprint_index.find_match(
+                preview_fingerprint, data_dir=DATA_FOLDER, preset=preview_preset, indexed_for=preset
+            )
+            if match:
+                return _reuse_match(match, key, audio_path), None
+        profile = progressive_analysis.build_preview(
+            audio_path, track_id, title, artist, audio_url, output_path, features=preview_features
+        )
+        progressive_analysis.schedule_refinement(
+            audio_path,
+            track_id,
+            title,
+            artist,
+            audio_url,
+            output_path,
+            preset=preset,
+            on_done=_refinement_done(track_id, audio_path, key, source, preset, preview_fingerprint),
+            context={"key": key, "source": source},
+        )
+        return track_id, profile
+
+    features = load_features(audio_path, preset=preset)
+    fingerprint = fingerprint_index.compute_fingerprint(features)
+    if reuse:
+        match = fingerprint_index.find_match(fingerprint, data_dir=DATA_FOLDER, preset=preset)
+        if match:
+            return _reuse_match(match, key, audio_path), None
+
+    profile = build_profile(
+        audio_path=audio_path,
+        track_id=track_id,
+        title=title,
+        artist=artist,
+        audio_url=audio_url,
+        output_path=output_path,
+        features=features,
+        preset=preset,
+    )
+    _publish_analysis(track_id, audio_path, key, fingerprint, source, preset)
+    return track_id, profile
+
+
+def _reuse_match(match: Dict[str, object], key: str, audio_path: Path) -> str:
+    """Drop the new upload in favour of an already analysed fingerprint match."""
+    audio_path.unlink(missing_ok=True)
+    analysis_cache.remember(key, match["track_id"], Path(match["audio_path"]), upload_dir=UPLOAD_FOLDER)
+    print(
+        f"[API] Fingerprint match ({match['confidence']:.3f}): reusing {match['track_id']}",
+        flush=True,
+    )
+    return match["track_id"]
+
+
+def _publish_analysis(
+    track_id: str,
+    audio_path: Path,
+    key: str,
+    fingerprint: "fingerprint_index.Fingerprint",
+    source: Optional[str],
+    preset: str,
+    preview_fingerprint: Optional["fingerprint_index.Fingerprint"] = None,
+) -> None:
+    """Make a finished profile reusable and schedule its compression and indexing.
+
+    ``preview_fingerprint`` (from a progressive build) is indexed under the
+    preview preset, so later progressive uploads can match the track early.
+    """
+    analysis_cache.remember(key, track_id, audio_path, upload_dir=UPLOAD_FOLDER)
+    fingerprint_index.register(track_id, fingerprint, audio_path, source=source, preset=preset)
+    if preview_fingerprint is not None:
+        fingerprint_index.register(
+            track_id, preview_fingerprint, audio_path, source=source, preset=progressive_analysis.PREVIEW_PRESET
+        )
+    output_path = DATA_FOLDER / f"{track_id}.json"
+    profile_paths = [output_path, *profile_format.split_paths(output_path)]
+    analysis_compression.schedule_sidecars(
+        [*profile_paths, *(profile_format.v2_path(path) for path in profile_paths)]
+    )
+    beat_index.schedule_update(DATA_FOLDER, BEAT_INDEX_FOLDER)
+
+
+def _refinement_done(
+    track_id: str,
+    audio_path: Path,
+    key: str,
+    source: Optional[str],
+    preset: str,
+    preview_fingerprint: Optional["fingerprint_index.Fingerprint"] = None,
+):
+    """``on_done`` of a progressive refinement: publish the refined profile."""
+
+    def on_done(_, refined) -> None:
+        fingerprint = preview_fingerprint
+        if fingerprint is None:  # resumed after a restart, the preview features are gone
+            fingerprint = fingerprint_index.compute_fingerprint(
+                load_features(audio_path, preset=progressive_analysis.PREVIEW_PRESET)
+            )
+        _publish_analysis(
+            track_id,
+            audio_path,
+            key,
+            fingerprint_index.compute_fingerprint(refined),
+            source,
+            preset,
+            preview_fingerprint=fingerprint,
+        )
+
+    return on_done
+
+
+def _resumed_refinement_done(job: Dict[str, object]):
+    """Rebuild ``_refinement_done`` for a refinement resumed by ``progressive.resume_stale``."""
+    context = job["context"]
+    return _refinement_done(
+        job["track_id"], Path(job["audio_path"]), context["key"], context.get("source"), job["preset"]
+    )
+
+
+# refinement threads do not survive a restart; pick up what they left behind
+progressive_analysis.resume_all_stale(DATA_FOLDER, _resumed_refinement_done)
+
+
+def _mode_for_algorithm(algorithm: str) -> str:
+    if algorithm in {"canon", "jukebox", "sculptor"}:
+        return algorithm
+    return "eternal"
+
+
 def get_user_oauth_cookies(user_id: Optional[str]) -> Optional[Path]:
     """Create a temporary cookies file from user's OAuth credentials"""
     if not user_id or user_id not in user_credentials:
@@ -763,14 +974,70 @@ def media(filename: str):
     return response
 
 
+# The only files under DATA_FOLDER served over HTTP: a profile, or its split
+# core and sub-resource documents, as legacy JSON or v2 binary. Sidecars are
+# reached through content negotiation on these names
+PROFILE_FILE_PATTERN = re.compile(
+    r"[A-Za-z0-9_+-]+(?:/(?:%s))?(?:\.json|%s)"
+    % ("|".join(["core", *profile_format.SPLIT_RESOURCES]), re.escape(profile_format.SUFFIX))
+)
+
+
+def _wants_profile_v2() -> bool:
+    # only clients that name the v2 type get it; "*/*" keeps the legacy JSON
+    return any(
+        value == profile_format.MEDIA_TYPE and quality > 0
+        for value, quality in request.accept_mimetypes
+    )
+
+
 @app.route("/data/<path:filename>")
 def analysis_file(filename: str):
-    response = send_from_directory(
-        DATA_FOLDER,
-        filename,
-        mimetype="application/json",
+    # indexes, caches and stage files live here too and must never leak
+    if not PROFILE_FILE_PATTERN.fullmatch(filename):
+        abort(404)
+    v2_name = filename[: -len(".json")] + profile_format.SUFFIX if filename.endswith(".json") else None
+    v2_file = safe_join(str(DATA_FOLDER), v2_name) if v2_name else None
+    has_v2 = bool(v2_file) and os.path.isfile(v2_file)
+    json_file = safe_join(str(DATA_FOLDER), filename)
+    if has_v2 and _wants_profile_v2():
+        source, mimetype = Path(v2_file), profile_format.MEDIA_TYPE
+    elif has_v2 and not (json_file and os.path.isfile(json_file)):
+        # legacy shim: rebuild the Echo Nest JSON for clients that cannot read v2
+        legacy = profile_format.read_profile(Path(v2_file))
+        response = app.response_class(json.dumps(legacy), mimetype="application/json")
+        response.vary.add("Accept")
+        response.headers.setdefault("Access-Control-Allow-Origin", "*")
+        return response
+    elif json_file and os.path.isfile(json_file):
+        source, mimetype = Path(json_file), "application/json"
+    else:
+        abort(404)
+
+    # analysis files never change under a given name: send a precompressed
+    # sidecar when one exists and let clients cache it forever. The exception
+    # is a progressive preview, which is revalidated until it has been refined
+    track_json = DATA_FOLDER / f"{Path(filename).parts[0].split('.')[0]}.json"
+    preview = progressive_analysis.is_preview(track_json)
+    send_path, encoding = analysis_compression.select_encoding(
+        source, request.accept_encodings.quality
+    )
+    response = send_file(
+        send_path,
+        mimetype=mimetype,
         conditional=True,
+        etag=analysis_compression.strong_etag(source, encoding),
+        max_age=0 if preview else STATIC_CACHE_SECONDS,
     )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    if v2_name:
+        response.vary.add("Accept")
+    if preview:
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.immutable = True
     response.headers.setdefault("Access-Control-Allow-Origin", "*")
     return response
 
@@ -1762,6 +2029,9 @@ def api_process():
     algorithm = request.form.get("algorithm", "canon").lower()
     if algorithm not in {"canon", "jukebox", "eternal", "autoharmonizer", "sculptor"}:
         return jsonify({"error": "Unsupported algorithm selection."}), 400
+    preset = request.form.get("preset", DEFAULT_PRESET).lower()
+    if preset not in ANALYSIS_PRESETS:
+        return jsonify({"error": "Unsupported analysis preset."}), 400
 
     source = request.form.get("source", "upload").lower()
     title = request.form.get("title") or None
@@ -1777,9 +2047,32 @@ def api_process():
     info: Optional[dict] = None
 
     try:
-        # For autoharmonizer, we need two tracks
-        audio_path2: Optional[Path] = None
-        track_id2: Optional[str] = None
+        # For autoharmonizer, the other tracks of the set: new uploads and/or
+        # already analysed track ids (so a set can grow without re-uploading)
+        set_uploads: List[Tuple[Path, str, str, str]] = []
+        set_track_ids = [tid for tid in re.split(r"[\s,+]+", request.form.get("set_tracks", "")) if tid]
+        for tid in set_track_ids:
+            if not TRACK_ID_PATTERN.fullmatch(tid) or not (DATA_FOLDER / f"{tid}.json").is_file():
+                return jsonify({"error": f"Unknown track in set: {tid}"}), 400
+        audio_digest: Optional[str] = None
+        reuse = request.form.get("reanalyze", "").lower() not in {"1", "true", "yes", "on"}
+        # sets need every member's full profile up front
+        progressive = (
+            request.form.get("progressive", "").lower() in {"1", "true", "yes", "on"}
+            and algorithm != "autoharmonizer"
+        )
+        source_url: Optional[str] = None
+
+        if source in {"youtube", "spotify", "drive"}:
+            source_url = request.form.get(f"{source}_url", "").strip() or None
+            # the same link was fetched before; skip the download entirely
+            known = (
+                fingerprint_index.find_by_source(source_url, data_dir=DATA_FOLDER, preset=preset) if reuse else None
+            )
+            if known and algorithm != "autoharmonizer":
+                print(f"[API] Source already analysed: reusing {known['track_id']}", flush=True)
+                redirect_url = url_for("index", trid=known["track_id"], mode=_mode_for_algorithm(algorithm))
+                return jsonify({"redirect": redirect_url, "trackId": known["track_id"]})
 
         if source == "upload":
             uploaded = request.files.get("audio")
@@ -1790,22 +2083,25 @@ def api_process():
             ext = Path(uploaded.filename).suffix.lower()
             filename = secure_filename(f"{track_id}{ext}")
             audio_path = UPLOAD_FOLDER / filename
-            uploaded.save(audio_path)
+            audio_digest = analysis_cache.save_and_hash(uploaded.stream, audio_path)
             if not title:
                 title = Path(uploaded.filename).stem
 
-            # Handle second audio file for autoharmonizer
+            # Handle the other tracks of an autoharmonizer set (audio2 ... audioN)
             if algorithm == "autoharmonizer":
-                uploaded2 = request.files.get("audio2")
-                if not uploaded2 or uploaded2.filename == "":
+                for number in range(2, AUTOHARMONIZER_MAX_TRACKS + 1):
+                    uploaded_n = request.files.get(f"audio{number}")
+                    if not uploaded_n or uploaded_n.filename == "":
+                        continue
+                    if not allowed_file(uploaded_n.filename):
+                        return jsonify({"error": f"File {number} has unsupported type."}), 400
+                    track_id_n = generate_track_id()
+                    ext_n = Path(uploaded_n.filename).suffix.lower()
+                    path_n = UPLOAD_FOLDER / secure_filename(f"{track_id_n}{ext_n}")
+                    digest_n = analysis_cache.save_and_hash(uploaded_n.stream, path_n)
+                    set_uploads.append((path_n, digest_n, track_id_n, Path(uploaded_n.filename).stem))
+                if not set_uploads and not set_track_ids:
                     return jsonify({"error": "Autoharmonizer requires two audio files."}), 400
-                if not allowed_file(uploaded2.filename):
-                    return jsonify({"error": "Second file has unsupported type."}), 400
-                track_id2 = generate_track_id()
-                ext2 = Path(uploaded2.filename).suffix.lower()
-                filename2 = secure_filename(f"{track_id2}{ext2}")
-                audio_path2 = UPLOAD_FOLDER / filename2
-                uploaded2.save(audio_path2)
         elif source == "youtube":
             url = request.form.get("youtube_url", "").strip()
             if not url:
@@ -1842,71 +2138,119 @@ def api_process():
 
         if title is None:
             title = audio_path.stem if audio_path else "Untitled"
-
-        # Process first track
-        media_url = url_for("media", filename=audio_path.name)
-        output_path = DATA_FOLDER / f"{track_id}.json"
-        build_profile(
-            audio_path=audio_path,
-            track_id=track_id,
-            title=title,
-            artist=artist,
-            audio_url=media_url,
-            output_path=output_path,
+        if audio_digest is None:
+            # downloaders write the file themselves, so hash it once afterwards
+            audio_digest = analysis_cache.hash_file(audio_path)
+
+        # Process first track (re-uploads of identical audio reuse the cached profile)
+        track_id, profile = _analyze_or_reuse(
+            audio_path,
+            audio_digest,
+            track_id,
+            title,
+            artist,
+            source=source_url,
+            reuse=reuse,
+            preset=preset,
+            progressive=progressive,
         )
+        output_path = DATA_FOLDER / f"{track_id}.json"
 
-        # For autoharmonizer, process second track and compute cross-track similarity
+        # For autoharmonizer, process the other tracks and compute cross-track similarity
         if algorithm == "autoharmonizer":
-            if not audio_path2 or not track_id2:
+            members: List[Tuple[str, Optional[Dict]]] = [(track_id, profile)]
+            for path_n, digest_n, track_id_n, title_n in set_uploads:
+                members.append(
+                    _analyze_or_reuse(
+                        path_n, digest_n, track_id_n, title_n or "Untitled Track", artist, reuse=reuse, preset=preset
+                    )
+                )
+            members.extend((tid, None) for tid in set_track_ids)
+            if len(members) < 2:
                 return jsonify({"error": "Autoharmonizer requires two tracks."}), 400
+            if len(members) > AUTOHARMONIZER_MAX_TRACKS:
+                return jsonify({"error": f"A set holds at most {AUTOHARMONIZER_MAX_TRACKS} tracks."}), 400
 
-            # Process second track
-            title2 = Path(audio_path2.stem).stem if audio_path2 else "Untitled Track 2"
-            media_url2 = url_for("media", filename=audio_path2.name)
-            output_path2 = DATA_FOLDER / f"{track_id2}.json"
-            build_profile(
-                audio_path=audio_path2,
-                track_id=track_id2,
-                title=title2,
-                artist=artist,
-                audio_url=media_url2,
-                output_path=output_path2,
-            )
-
-            # Compute cross-track similarity and create combined profile
-            try:
-                from .analysis.analyze_track import build_autoharmonizer_profile
-            except ImportError:
-                from analysis.analyze_track import build_autoharmonizer_profile
-            combined_track_id = f"{track_id}+{track_id2}"
+            # Only the track pairs not seen before are computed; the rest come
+            # from the cross-track block cache
+            combined_track_id = "+".join(tid for tid, _ in members)
             combined_output_path = DATA_FOLDER / f"{combined_track_id}.json"
-            build_autoharmonizer_profile(
-                track1_path=output_path,
-                track2_path=output_path2,
+            build_set_profile(
+                track_paths=[DATA_FOLDER / f"{tid}.json" for tid, _ in members],
                 combined_track_id=combined_track_id,
                 output_path=combined_output_path,
+                profiles=[member_profile for _, member_profile in members],
             )
+            analysis_compression.schedule_sidecars([combined_output_path])
 
             mode = "autoharmonizer"
             redirect_url = url_for("index", trid=combined_track_id, mode=mode)
             return jsonify({"redirect": redirect_url, "trackId": combined_track_id})
 
-        if algorithm == "canon":
-            mode = "canon"
-        elif algorithm == "jukebox":
-            mode = "jukebox"
-        elif algorithm == "sculptor":
-            mode = "sculptor"
-        else:
-            mode = "eternal"
-        redirect_url = url_for("index", trid=track_id, mode=mode)
-        return jsonify({"redirect": redirect_url, "trackId": track_id})
+        redirect_url = url_for("index", trid=track_id, mode=_mode_for_algorithm(algorithm))
+        payload = {"redirect": redirect_url, "trackId": track_id}
+        revision = progressive_analysis.read_revision(output_path)
+        if revision:
+            payload.update(progressive_analysis.public_record(revision))
+        return jsonify(payload)
     except RuntimeError as exc:
         return jsonify({"error": str(exc)}), 500
     except Exception as exc:  # pragma: no cover
         return jsonify({"error": f"Unexpected error: {exc}"}), 500
 
 
+@app.route("/api/process/status/<track_id>", methods=["GET"])
+def api_process_status(track_id: str):
+    """Revision of a track's profile; a progressive preview moves to ``final`` once refined."""
+    output_path = DATA_FOLDER / f"{track_id}.json"
+    if not TRACK_ID_PATTERN.fullmatch(track_id) or not output_path.is_file():
+        return jsonify({"error": "Unknown track."}), 404
+    progressive_analysis.resume_stale(output_path, _resumed_refinement_done)
+    record = progressive_analysis.read_revision(output_path) or {"revision": 1, "state": "final"}
+    return jsonify({"trackId": track_id, **progressive_analysis.public_record(record)})
+
+
+@app.route("/api/similar-beats", methods=["GET"])
+def api_similar_beats():
+    """Beats across the library that sound like ``beat`` of ``track``."""
+    track = request.args.get("track", "").strip()
+    mode = request.args.get("mode", "exact").lower()
+    if mode not in {"exact", "ivf"}:
+        return jsonify({"error": "mode must be 'exact' or 'ivf'."}), 400
+    try:
+        beat = int(request.args.get("beat", ""))
+        k = max(1, min(int(request.args.get("k", 10)), 100))
+        nprobe = max(1, int(request.args.get("nprobe", beat_index.IVF_DEFAULT_NPROBE)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "beat, k and nprobe must be integers."}), 400
+    same_track = request.args.get("same_track", "").lower() in {"1", "true", "yes", "on"}
+
+    index = beat_index.open_index(BEAT_INDEX_FOLDER)
+    if index is None or track not in index:
+        if (DATA_FOLDER / f"{track}.json").is_file():
+            beat_index.schedule_update(DATA_FOLDER, BEAT_INDEX_FOLDER)
+            return jsonify({"error": "Track is not indexed yet; try again shortly."}), 503
+        return jsonify({"error": "Unknown track."}), 404
+    try:
+        matches = index.neighbors(track, beat, k=k, mode=mode, nprobe=nprobe, same_track=same_track)
+    except IndexError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({
+        "track": track,
+        "beat": beat,
+        "mode": mode if mode != "ivf" or index.centroids is not None else "exact",
+        "matches": [asdict(match) for match in matches],
+    })
+
+
+@app.route("/api/analysis/timings", methods=["GET"])
+def api_analysis_timings():
+    """Per-stage analysis cost, aggregated by analysis version, preset and stage."""
+    version = request.args.get("version", "").strip() or None
+    preset = request.args.get("preset", "").strip() or None
+    return jsonify({"stages": analysis_timings.summary(version=version, preset=preset)})
+
+
 @app.route("/api/playlist-info", methods=["POST", "OPTIONS"])
 def api_playlist_info():
     """Check if URL is a playlist and return track list."""
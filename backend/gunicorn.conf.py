@@ -8,6 +8,9 @@ bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
 workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
 threads = int(os.environ.get("GUNICORN_THREADS", "4"))
 
+# Run independent analysis stages of a single upload concurrently (sized to the CPU quota)
+os.environ.setdefault("ANALYSIS_STAGE_WORKERS", "auto")
+
 timeout = 180
 keepalive = 5
 loglevel = "info"
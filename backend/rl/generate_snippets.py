@@ -8,14 +8,18 @@ Usage:
 from __future__ import annotations
 
 import argparse
-import subprocess
 from pathlib import Path
 from typing import Optional
 
+import soundfile as sf
+
 from . import db
+from ..analysis import decode as audio_decode
 
 BACKEND_DIR = Path(__file__).resolve().parent.parent
 UPLOAD_FOLDER = BACKEND_DIR / "uploads"
+SNIPPET_SAMPLE_RATE = 44100
+SNIPPET_CHANNELS = 2
 
 
 def _find_audio_file(track_id: str) -> Optional[Path]:
@@ -51,33 +55,21 @@ def render_snippet(
     snippet_filename = f"{track_id}_{event['id']}.wav"
     snippet_path = db.SNIPPET_DIR / snippet_filename
 
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-ss",
-        f"{start_time:.2f}",
-        "-i",
-        str(audio_file),
-        "-t",
-        f"{duration:.2f}",
-        "-acodec",
-        "pcm_s16le",
-        "-ar",
-        "44100",
-        "-ac",
-        "2",
-        str(snippet_path),
-    ]
     if dry_run:
-        print("DRY RUN:", " ".join(cmd))
+        print(
+            f"DRY RUN: {audio_file} [{start_time:.2f}s +{duration:.2f}s] -> {snippet_path}"
+        )
         return True
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        db.mark_snippet_generated(event["id"], snippet_path=str(snippet_path))
-        return True
-    except subprocess.CalledProcessError as exc:
-        db.mark_snippet_failed(event["id"], f"ffmpeg error: {exc}")
+        # cut from the shared PCM cache instead of decoding the file again
+        audio = audio_decode.decode(audio_file, sample_rate=SNIPPET_SAMPLE_RATE, channels=SNIPPET_CHANNELS)
+    except audio_decode.DecodeError as exc:
+        db.mark_snippet_failed(event["id"], f"decode error: {exc}")
         return False
+    clip = audio.slice(start_time, start_time + duration)
+    sf.write(str(snippet_path), clip, audio.sr, subtype="PCM_16")
+    db.mark_snippet_generated(event["id"], snippet_path=str(snippet_path))
+    return True
 
 
 def process_pending(limit: int, pre: float, post: float, dry_run: bool = False) -> int:
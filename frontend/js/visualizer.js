@@ -2528,14 +2528,13 @@ function foldBySection(qlist) {
 }
 
 function allReady() {
-    var autohData = curTrack && curTrack.analysis && curTrack.analysis.autoharmonizer;
+    var autohTrack = autoharmonizerTracks(curTrack && curTrack.analysis && curTrack.analysis.autoharmonizer)[0];
     var usingAutoharmonizer = (mode === "autoharmonizer");
     if (usingAutoharmonizer &&
-        autohData &&
-        autohData.track1 &&
-        autohData.track1.beats &&
-        autohData.track1.beats.length) {
-        masterQs = autohData.track1.beats.slice();
+        autohTrack &&
+        autohTrack.beats &&
+        autohTrack.beats.length) {
+        masterQs = autohTrack.beats.slice();
     } else {
         masterQs = curTrack.analysis.beats || [];
     }
@@ -2689,7 +2688,10 @@ function gotTheAnalysis(profile) {
         remixer.remixTrack(profile.response.track, function(state, t, percent) {
             if (state == 1) {
                 info("Here we go ...");
-                setTimeout( function() { readyToPlay(t); }, 10);
+                // jump data may still be streaming in after the core profile
+                setTimeout( function() {
+                    pendingAnalysisResources.then(function() { readyToPlay(t); });
+                }, 10);
             } else if (state == 0) {
                 if (percent >= 99) {
                     info("Here we go ...");
@@ -2708,17 +2710,229 @@ function gotTheAnalysis(profile) {
 }
 
 
-function fetchAnalysis(trid) {
+var PROFILE_V2_MEDIA_TYPE = 'application/vnd.playwrite.profile.v2';
+
+// Rebuild the Echo Nest shaped profile from the columnar v2 container
+// (see backend/analysis/profile_format.py for the layout). Split documents
+// carry only their own columns; a sub-resource decodes to its analysis keys.
+function decodeProfileV2(buffer) {
+    var view = new DataView(buffer);
+    var magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+    if (magic !== 'PWP2') {
+        throw new Error('Not a v2 profile');
+    }
+    var length = view.getUint32(4, true);
+    var manifest = JSON.parse(new TextDecoder('utf-8').decode(new Uint8Array(buffer, 8, length)));
+    var base = 8 + length;
+    base += (8 - base % 8) % 8;
+    var ctors = { '<f8': Float64Array, '<f4': Float32Array, '<i4': Int32Array, '<u1': Uint8Array };
+
+    function column(name) {
+        var spec = manifest.columns[name];
+        var count = spec.shape.reduce(function(a, b) { return a * b; }, 1);
+        return new ctors[spec.dtype](buffer, base + spec.offset, count);
+    }
+
+    function rows(prefix, names, widths) {
+        var cols = names.map(function(name) { return column(prefix + '.' + name); });
+        var n = manifest.columns[prefix + '.' + names[0]].shape[0];
+        var out = new Array(n);
+        for (var i = 0; i < n; i++) {
+            var row = {};
+            for (var c = 0; c < names.length; c++) {
+                var width = widths && widths[names[c]];
+                row[names[c]] = width ? Array.prototype.slice.call(cols[c], i * width, (i + 1) * width) : cols[c][i];
+            }
+            out[i] = row;
+        }
+        return out;
+    }
+
+    function has(name) {
+        return Object.prototype.hasOwnProperty.call(manifest.columns, name);
+    }
+
+    var analysis = Object.assign({}, manifest.analysis);
+    ['sections', 'bars', 'beats', 'tatums'].forEach(function(group) {
+        if (has(group + '.start')) {
+            analysis[group] = rows(group, ['start', 'duration', 'confidence']);
+        }
+    });
+    if (has('segments.start')) {
+        analysis.segments = rows(
+            'segments',
+            ['start', 'duration', 'confidence', 'loudness_start', 'loudness_max', 'loudness_max_time', 'pitches', 'timbre'],
+            { pitches: 12, timbre: 12 }
+        );
+    }
+    if (has('loop_candidates.source')) {
+        analysis.loop_candidates = rows('loop_candidates', ['source', 'target', 'similarity']);
+    }
+
+    if (has('eternal.keys')) {
+        var keys = column('eternal.keys'), counts = column('eternal.counts');
+        var targets = column('eternal.target'), sims = column('eternal.similarity');
+        var spans = column('eternal.span'), matches = column('eternal.section_match');
+        var eternal = {};
+        var cursor = 0;
+        for (var k = 0; k < keys.length; k++) {
+            var edges = new Array(counts[k]);
+            for (var e = 0; e < counts[k]; e++, cursor++) {
+                edges[e] = {
+                    target: targets[cursor],
+                    similarity: sims[cursor],
+                    span: spans[cursor],
+                    abs_span: Math.abs(spans[cursor]),
+                    direction: spans[cursor] > 0 ? 'forward' : 'backward',
+                    section_match: matches[cursor] === 1
+                };
+            }
+            eternal[String(keys[k])] = edges;
+        }
+        analysis.eternal_loop_candidates = eternal;
+    }
+
+    if (analysis.canon_alignment) {
+        var canon = Object.assign({}, analysis.canon_alignment);
+        canon.pairs = Array.from(column('canon.pairs'));
+        canon.pair_similarity = Array.from(column('canon.pair_similarity'));
+        canon.transitions = rows('canon.transitions', ['source', 'target', 'similarity']);
+        analysis.canon_alignment = canon;
+    }
+
+    if (manifest.resource) {
+        return analysis;
+    }
+    var track = Object.assign({}, manifest.track, { analysis: analysis });
+    return { response: { status: manifest.status, track: track } };
+}
+
+// Ask for the compact v2 profile (or split document); servers without it answer
+// with the legacy JSON.
+function loadProfile(url) {
+    return fetch(url, { headers: { 'Accept': PROFILE_V2_MEDIA_TYPE + ', application/json;q=0.9' } })
+        .then(function(response) {
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            var type = response.headers.get('Content-Type') || '';
+            if (type.indexOf(PROFILE_V2_MEDIA_TYPE) === 0) {
+                return response.arrayBuffer().then(decodeProfileV2);
+            }
+            return response.json();
+        });
+}
+
+var pendingAnalysisResources = Promise.resolve();
+
+// Split profiles keep mode-specific jump data out of core.json
+function analysisResourcesForMode(currentMode) {
+    if (currentMode === "canon" || currentMode === "eternal") {
+        return ['canon', 'eternal'];
+    }
+    if (currentMode === "autoharmonizer") {
+        return [];
+    }
+    return ['eternal'];
+}
+
+function loadAnalysisResources(coreUrl, analysis) {
+    var links = analysis.resources || {};
+    var base = new URL(coreUrl, window.location.href);
+    var wanted = analysisResourcesForMode(mode).filter(function(name) { return !!links[name]; });
+    return Promise.all(wanted.map(function(name) {
+        var url = new URL(links[name], base);
+        url.search = base.search;  // keep the ?rev= of the core document
+        return loadProfile(url.toString()).then(function(resource) {
+            Object.assign(analysis, resource);
+        });
+    })).catch(function(err) {
+        console.warn('[fetchAnalysis] Could not load analysis resources:', err);
+    });
+}
+
+var REVISION_POLL_MS = 3000;
+var revisionPollTimer = null;
+
+function stopWatchingRevision() {
+    if (revisionPollTimer) {
+        clearTimeout(revisionPollTimer);
+        revisionPollTimer = null;
+    }
+}
+
+// A progressive preview (analysis.preview) is replaced by the full profile in
+// the background: poll for the new revision and reload it once playback stops.
+function watchForRefinedAnalysis(trid, analysis) {
+    stopWatchingRevision();
+    if (!analysis || !analysis.preview) {
+        return;
+    }
+    var current = analysis.revision || 1;
+
+    function reloadWhenIdle(revision) {
+        if (driver && driver.isRunning && driver.isRunning()) {
+            revisionPollTimer = setTimeout(function() { reloadWhenIdle(revision); }, REVISION_POLL_MS);
+            return;
+        }
+        revisionPollTimer = null;
+        fetchAnalysis(trid, revision);
+    }
+
+    function poll() {
+        revisionPollTimer = setTimeout(function() {
+            fetch(resolveApiUrl('api/process/status/' + encodeURIComponent(trid)), { cache: 'no-store' })
+                .then(function(response) { return response.ok ? response.json() : null; })
+                .then(function(status) {
+                    if (!status || status.state === 'failed') {
+                        return;
+                    }
+                    if (status.state === 'final' && status.revision > current) {
+                        reloadWhenIdle(status.revision);
+                    } else {
+                        poll();
+                    }
+                }, poll);
+        }, REVISION_POLL_MS);
+    }
+    poll();
+}
+
+function revisionQuery(revision) {
+    return revision ? '?rev=' + encodeURIComponent(revision) : '';
+}
+
+function fetchAnalysis(trid, revision) {
     isTrackReady = false;
+    stopWatchingRevision();
     if (driver && driver.isRunning && driver.isRunning()) {
         driver.stop();
     }
     $("#play").prop("disabled", true).text("Loading...");
-    var localUrl = resolveApiUrl('data/' + trid + '.json');
-    var remoteUrl = 'http://static.echonest.com/infinite_jukebox_data/' + encodeURIComponent(trid) + '.json';
+    // a refined profile gets a new URL so no cached preview can answer for it
+    var coreUrl = resolveApiUrl('data/' + trid + '/core.json' + revisionQuery(revision));
     info('Fetching the analysis');
-    $.getJSON(localUrl, function(data) { gotTheAnalysis(data); })
-        .fail(function() {
+    pendingAnalysisResources = Promise.resolve();
+    // start decoding audio from the small core document while the jump data loads
+    loadProfile(coreUrl).then(
+        function(core) {
+            pendingAnalysisResources = loadAnalysisResources(coreUrl, core.response.track.analysis);
+            watchForRefinedAnalysis(trid, core.response.track.analysis);
+            gotTheAnalysis(core);
+        },
+        function() { fetchFullAnalysis(trid, revision); }
+    );
+}
+
+function fetchFullAnalysis(trid, revision) {
+    var localUrl = resolveApiUrl('data/' + trid + '.json' + revisionQuery(revision));
+    var remoteUrl = 'http://static.echonest.com/infinite_jukebox_data/' + encodeURIComponent(trid) + '.json';
+    loadProfile(localUrl).then(
+        function(data) {
+            watchForRefinedAnalysis(trid, data.response && data.response.track && data.response.track.analysis);
+            gotTheAnalysis(data);
+        },
+        function() {
             $.getJSON(remoteUrl, function(data) { gotTheAnalysis(data); })
                 .fail(function() {
                     var missingCombo = (mode === "autoharmonizer" && trid.indexOf('+') !== -1);
@@ -2728,7 +2942,8 @@ function fetchAnalysis(trid) {
                         info("Sorry, can't find info for that track");
                     }
                 });
-        });
+        }
+    );
 }
 
 function get_status(data) {
@@ -4509,8 +4724,60 @@ function createCircularTiles(qlist) {
     return tiles;
 }
 
+// The member tracks of an autoharmonizer set. Profiles list them in `tracks`
+// and keep `track1`/`track2` as indices into it; older two-track profiles
+// only have `track1`/`track2`, as inline objects.
+function autoharmonizerTracks(data) {
+    if (!data) {
+        return [];
+    }
+    if (data.tracks && data.tracks.length) {
+        return data.tracks;
+    }
+    return [data.track1, data.track2].filter(function(track) {
+        return track && typeof track === "object";
+    });
+}
+
+// Jump edges per track number (1-based) and beat index, best first. Profiles
+// written before `jump_graph` get one rebuilt from their loop candidates and
+// two-track `cross_similarity`.
+function autoharmonizerJumpGraph(data) {
+    if (!data) {
+        return {};
+    }
+    if (data.jump_graph) {
+        return data.jump_graph;
+    }
+    var cross = data.cross_similarity || {};
+    var graph = {};
+    _.each(autoharmonizerTracks(data), function(track, index) {
+        var number = index + 1;
+        var edges = {};
+        var loops = track.eternal_loop_candidates || {};
+        Object.keys(loops).forEach(function(beatIdx) {
+            edges[beatIdx] = loops[beatIdx].map(function(cand) {
+                return { target_track: number, target_index: cand.target, similarity: cand.similarity };
+            });
+        });
+        var other = cross["track" + number + "_to_track" + (3 - number)] || {};
+        Object.keys(other).forEach(function(beatIdx) {
+            edges[beatIdx] = (edges[beatIdx] || []).concat(other[beatIdx]).sort(function(a, b) {
+                return b.similarity - a.similarity;
+            });
+        });
+        graph[String(number)] = edges;
+    });
+    return graph;
+}
+
+var AUTOHARMONIZER_TRACK_COLORS = [
+    "#4A90E2", "#9B59B6", "#2ECC71", "#F39C12", "#1ABC9C",
+    "#E67E22", "#F1C40F", "#34495E", "#FF6F91", "#95A5A6"
+];
+
 function createAutoharmonizerTiles(qlist) {
-    // Create dual-loop visualization: two interlocking circles for autoharmonizer mode
+    // One circle of beats per track of the set, with the strongest cross-track jumps between them
     tiles = [];
     normalizeColor();
     clearLoopPaths();
@@ -4524,136 +4791,107 @@ function createAutoharmonizerTiles(qlist) {
         return createCircularTiles(qlist);
     }
 
-    var track1Beats = autoharmonizerData.track1 && autoharmonizerData.track1.beats ? autoharmonizerData.track1.beats : [];
-    var track2Beats = autoharmonizerData.track2 && autoharmonizerData.track2.beats ? autoharmonizerData.track2.beats : [];
-    if (!track1Beats.length || !track2Beats.length) {
+    var tracks = autoharmonizerTracks(autoharmonizerData);
+    var trackBeats = tracks.map(function(track) {
+        return track.beats || [];
+    });
+    if (trackBeats.length < 2 || _.some(trackBeats, function(beats) { return !beats.length; })) {
         console.warn("[Viz] Autoharmonizer beats missing – reverting to circular view", {
-            track1Beats: track1Beats.length,
-            track2Beats: track2Beats.length
+            trackBeats: trackBeats.map(function(beats) { return beats.length; })
         });
         return createCircularTiles(qlist || []);
     }
 
-    // Calculate positions for two circles side-by-side
-    var baseRadius = getCircularRadius() * 0.55; // Slightly smaller for dual view
+    // Circle centres sit evenly on a ring, track 1 on the left; two tracks end up side by side
+    var count = tracks.length;
+    var ringRadius = getCircularRadius() * 0.66;
+    var baseRadius = Math.min(getCircularRadius() * 0.55, ringRadius * Math.sin(Math.PI / count) * 0.8);
     var sizeScale = Math.min(baseRadius * 0.12, 16);
-    var centerY = H / 2;
-    var spacing = baseRadius * 0.4; // Gap between circles
-
-    // Left circle center (Track 1)
-    var center1X = W / 2 - baseRadius - spacing / 2;
-    var center1Y = centerY;
-
-    // Right circle center (Track 2)
-    var center2X = W / 2 + baseRadius + spacing / 2;
-    var center2Y = centerY;
-
-    // Draw track 1 beats (left circle) in blue
-    _.each(track1Beats, function(beat, idx) {
-        var angle = (idx / track1Beats.length) * Math.PI * 2 - Math.PI / 2;
-        var x = center1X + Math.cos(angle) * baseRadius;
-        var y = center1Y + Math.sin(angle) * baseRadius;
-
-        var volume = beat.confidence || 0.5;
-        var durationRatio = beat.duration / 0.5; // Normalize
-        var size = Math.max(3, Math.min(10, volume * sizeScale + durationRatio * sizeScale * 0.4));
-
-        var tile = Object.create(tilePrototype);
-        tile.which = idx;
-        tile.track = 1;
-        tile.width = size * 2;
-        tile.height = size * 2;
-        tile.normalColor = "#4A90E2"; // Blue for track 1
-        tile.rect = paper.circle(x, y, size);
-        tile.rect.tile = tile;
-        tile.normal();
-        tile.q = beat;
-        tile.init();
-        beat.tile = tile;
-        tiles.push(tile);
+    var centers = tracks.map(function(track, index) {
+        var angle = Math.PI + (index / count) * Math.PI * 2;
+        return { x: W / 2 + Math.cos(angle) * ringRadius, y: H / 2 + Math.sin(angle) * ringRadius };
     });
 
-    // Draw track 2 beats (right circle) in purple
-    _.each(track2Beats, function(beat, idx) {
-        var angle = (idx / track2Beats.length) * Math.PI * 2 - Math.PI / 2;
-        var x = center2X + Math.cos(angle) * baseRadius;
-        var y = center2Y + Math.sin(angle) * baseRadius;
-
-        var volume = beat.confidence || 0.5;
-        var durationRatio = beat.duration / 0.5;
-        var size = Math.max(3, Math.min(10, volume * sizeScale + durationRatio * sizeScale * 0.4));
+    function beatPosition(trackIndex, beatIdx) {
+        var angle = (beatIdx / trackBeats[trackIndex].length) * Math.PI * 2 - Math.PI / 2;
+        return {
+            x: centers[trackIndex].x + Math.cos(angle) * baseRadius,
+            y: centers[trackIndex].y + Math.sin(angle) * baseRadius
+        };
+    }
 
-        var tile = Object.create(tilePrototype);
-        tile.which = idx + track1Beats.length; // Offset index for track 2
-        tile.track = 2;
-        tile.width = size * 2;
-        tile.height = size * 2;
-        tile.normalColor = "#9B59B6"; // Purple for track 2
-        tile.rect = paper.circle(x, y, size);
-        tile.rect.tile = tile;
-        tile.normal();
-        tile.q = beat;
-        tile.init();
-        beat.tile = tile;
-        tiles.push(tile);
+    var offset = 0;
+    _.each(trackBeats, function(beats, trackIndex) {
+        var color = AUTOHARMONIZER_TRACK_COLORS[trackIndex % AUTOHARMONIZER_TRACK_COLORS.length];
+        _.each(beats, function(beat, idx) {
+            var position = beatPosition(trackIndex, idx);
+            var volume = beat.confidence || 0.5;
+            var durationRatio = beat.duration / 0.5; // Normalize
+            var size = Math.max(3, Math.min(10, volume * sizeScale + durationRatio * sizeScale * 0.4));
+
+            var tile = Object.create(tilePrototype);
+            tile.which = idx + offset; // Offset index for later tracks
+            tile.track = trackIndex + 1;
+            tile.width = size * 2;
+            tile.height = size * 2;
+            tile.normalColor = color;
+            tile.rect = paper.circle(position.x, position.y, size);
+            tile.rect.tile = tile;
+            tile.normal();
+            tile.q = beat;
+            tile.init();
+            beat.tile = tile;
+            tiles.push(tile);
+        });
+        offset += beats.length;
     });
 
-    // Draw cross-track connections (the "fusion" effect)
-    var crossSim = autoharmonizerData.cross_similarity;
-    if (crossSim && crossSim.track1_to_track2) {
+    // Draw cross-track connections (the "fusion" effect), about 30 in all to limit clutter
+    var jumpGraph = autoharmonizerJumpGraph(autoharmonizerData);
+    var maxConnections = Math.ceil(30 * (count - 1) / count);
+    _.each(trackBeats, function(beats, trackIndex) {
         var connectionCount = 0;
-        var maxConnections = 30; // Limit visual clutter
-
-        _.each(crossSim.track1_to_track2, function(candidates, beatIdx) {
+        var edgesByBeat = jumpGraph[String(trackIndex + 1)] || {};
+        _.each(edgesByBeat, function(edges, beatIdx) {
             if (connectionCount >= maxConnections) return;
 
-            var idx = parseInt(beatIdx);
-            if (!candidates || !candidates.length || idx >= track1Beats.length) return;
-
-            // Draw connection to best match
-            var bestMatch = candidates[0];
-            if (bestMatch.similarity > 0.65 && bestMatch.target_index < track2Beats.length) {
-                var angle1 = (idx / track1Beats.length) * Math.PI * 2 - Math.PI / 2;
-                var x1 = center1X + Math.cos(angle1) * baseRadius;
-                var y1 = center1Y + Math.sin(angle1) * baseRadius;
-
-                var angle2 = (bestMatch.target_index / track2Beats.length) * Math.PI * 2 - Math.PI / 2;
-                var x2 = center2X + Math.cos(angle2) * baseRadius;
-                var y2 = center2Y + Math.sin(angle2) * baseRadius;
-
-                var opacity = Math.min(0.4, bestMatch.similarity * 0.5);
-                var path = paper.path("M" + x1 + "," + y1 + "L" + x2 + "," + y2);
-                path.attr({
-                    "stroke": "#E74C3C",
-                    "stroke-width": 1,
-                    "opacity": opacity,
-                    "stroke-dasharray": "3,3"
-                });
-                connectionCount++;
-            }
-        });
-    }
+            var idx = parseInt(beatIdx, 10);
+            if (!edges || idx >= beats.length) return;
 
-    // Add labels
-    var label1 = paper.text(center1X, centerY, "Track 1");
-    label1.attr({
-        "font-size": 14,
-        "fill": "#4A90E2",
-        "opacity": 0.6,
-        "font-weight": "bold"
+            // Draw connection to the best match on another track
+            var bestMatch = _.find(edges, function(edge) {
+                return edge.target_track !== trackIndex + 1;
+            });
+            if (!bestMatch || bestMatch.similarity <= 0.65) return;
+            var targetIndex = bestMatch.target_track - 1;
+            if (!trackBeats[targetIndex] || bestMatch.target_index >= trackBeats[targetIndex].length) return;
+
+            var from = beatPosition(trackIndex, idx);
+            var to = beatPosition(targetIndex, bestMatch.target_index);
+            var opacity = Math.min(0.4, bestMatch.similarity * 0.5);
+            var path = paper.path("M" + from.x + "," + from.y + "L" + to.x + "," + to.y);
+            path.attr({
+                "stroke": "#E74C3C",
+                "stroke-width": 1,
+                "opacity": opacity,
+                "stroke-dasharray": "3,3"
+            });
+            connectionCount++;
+        });
     });
 
-    var label2 = paper.text(center2X, centerY, "Track 2");
-    label2.attr({
-        "font-size": 14,
-        "fill": "#9B59B6",
-        "opacity": 0.6,
-        "font-weight": "bold"
+    // Add labels
+    _.each(centers, function(center, trackIndex) {
+        var label = paper.text(center.x, center.y, "Track " + (trackIndex + 1));
+        label.attr({
+            "font-size": 14,
+            "fill": AUTOHARMONIZER_TRACK_COLORS[trackIndex % AUTOHARMONIZER_TRACK_COLORS.length],
+            "opacity": 0.6,
+            "font-weight": "bold"
+        });
     });
 
-    if (track1Beats.length) {
-        updateCursors(track1Beats[0]);
-    }
+    updateCursors(trackBeats[0][0]);
 
     return tiles;
 }
@@ -6687,7 +6925,7 @@ function createJukeboxDriver(player, options) {
 }
 
 function createAutoharmonizerDriver(player) {
-    // Autoharmonizer: dual-track fusion with cross-track jumping and sculpted transitions
+    // Autoharmonizer: multi-track fusion with cross-track jumping and sculpted transitions
     var curQ = 0;
     var currentTrack = 1;
     var running = false;
@@ -6703,88 +6941,61 @@ function createAutoharmonizerDriver(player) {
         return createCanonDriver(player);
     }
 
-    var track1Data = autoharmonizerData.track1 || {};
-    var track2Data = autoharmonizerData.track2 || {};
-    var crossSimilarity = autoharmonizerData.cross_similarity || {};
+    // Track numbers are 1-based, as in `jump_graph`
+    var tracksData = autoharmonizerTracks(autoharmonizerData);
+    var jumpGraph = autoharmonizerJumpGraph(autoharmonizerData);
 
-    if (!track1Data.beats || !track1Data.beats.length || !track2Data.beats || !track2Data.beats.length) {
-        console.error("[Autoharmonizer] Missing beat data for one or both tracks");
+    if (tracksData.length < 2 || _.some(tracksData, function(track) { return !track.beats || !track.beats.length; })) {
+        console.error("[Autoharmonizer] Missing beat data for one or more tracks");
         error("trouble loading audio");
         return createCanonDriver(player);
     }
 
-    var track1Source =
-        track1Data.audio_url ||
-        (track1Data.info && track1Data.info.url) ||
-        (curTrack && curTrack.info && curTrack.info.url) ||
-        curTrack.audio_url ||
-        "";
-    var track2Source =
-        track2Data.audio_url ||
-        (track2Data.info && track2Data.info.url) ||
-        "";
+    var trackSources = tracksData.map(function(track, index) {
+        return track.audio_url ||
+            (track.info && track.info.url) ||
+            (index === 0 && curTrack && curTrack.info && curTrack.info.url) ||
+            (index === 0 && curTrack.audio_url) ||
+            "";
+    });
 
-    if (!track1Source || !track2Source) {
+    if (!_.every(trackSources)) {
         console.error("[Autoharmonizer] Unable to resolve audio sources", {
-            track1Source: track1Source,
-            track2Source: track2Source,
-            track1Data: track1Data,
-            track2Data: track2Data
+            trackSources: trackSources,
+            tracksData: tracksData
         });
         error("trouble loading audio");
         return createCanonDriver(player);
     }
 
-    console.log("[Autoharmonizer] Initializing dual-track playback", {
-        track1Source: track1Source,
-        track2Source: track2Source,
-        track1Beats: track1Data.beats.length,
-        track2Beats: track2Data.beats.length
+    console.log("[Autoharmonizer] Initializing " + tracksData.length + "-track playback", {
+        trackSources: trackSources,
+        trackBeats: tracksData.map(function(track) { return track.beats.length; })
     });
 
-    var track1Controller = createHtmlAudioController(track1Source, { volume: 0.0 });
-    var track2Controller = createHtmlAudioController(track2Source, { volume: 0.0 });
-    if (!track1Controller || !track2Controller) {
+    var controllers = trackSources.map(function(source) {
+        return createHtmlAudioController(source, { volume: 0.0 });
+    });
+    if (!_.every(controllers)) {
         console.error("[Autoharmonizer] Failed to initialize HTML audio controllers");
         error("trouble loading audio");
         return createCanonDriver(player);
     }
-    if (track1Controller.ensureLoaded) {
-        track1Controller.ensureLoaded();
-    }
-    if (track2Controller.ensureLoaded) {
-        track2Controller.ensureLoaded();
-    }
+    _.each(controllers, function(controller) {
+        if (controller.ensureLoaded) {
+            controller.ensureLoaded();
+        }
+    });
 
     console.log("[Autoharmonizer] Controllers initialized successfully");
 
-    // Build jump graph for track1 (combining intra-track and cross-track options)
-    var jumpCandidates = {};
-    var eternal1 = track1Data.eternal_loop_candidates || {};
-    Object.keys(eternal1).forEach(function(beatIdx) {
-        var intra = eternal1[beatIdx].map(function(cand) {
-            return {
-                source_track: 1,
-                target_track: 1,
-                source_index: parseInt(beatIdx, 10),
-                target_index: cand.target,
-                similarity: cand.similarity,
-                reason: "intra-track"
-            };
-        });
-        jumpCandidates[beatIdx] = (jumpCandidates[beatIdx] || []).concat(intra);
-    });
-    var cross1to2 = crossSimilarity.track1_to_track2 || {};
-    Object.keys(cross1to2).forEach(function(beatIdx) {
-        jumpCandidates[beatIdx] = (jumpCandidates[beatIdx] || []).concat(cross1to2[beatIdx]);
-    });
-
     function getBeatsForTrack(trackNum) {
-        return trackNum === 1 ? track1Data.beats : track2Data.beats;
+        var track = tracksData[trackNum - 1];
+        return track ? track.beats : null;
     }
 
     function getControllerForTrack(trackNum) {
-        return trackNum === 1 ? track1Controller : track2Controller;
+        return controllers[trackNum - 1] || null;
     }
 
     function clearProcessTimer() {
@@ -6820,7 +7031,7 @@ function createAutoharmonizerDriver(player) {
     function crossfadeToTrack(targetTrack, beatIndex, crossfadeMs) {
         var targetBeats = getBeatsForTrack(targetTrack);
         var targetController = getControllerForTrack(targetTrack);
-        var sourceTrack = targetTrack === 1 ? 2 : 1;
+        var sourceTrack = currentTrack;
         var sourceController = getControllerForTrack(sourceTrack);
         var beat = targetBeats[beatIndex];
 
@@ -6863,28 +7074,16 @@ function createAutoharmonizerDriver(player) {
 
     function selectNextBeat(currentBeatIdx, trackNum, options) {
         options = options || {};
-        var candidates = [];
-        var indexKey = String(currentBeatIdx);
-        if (trackNum === 1) {
-            candidates = jumpCandidates[currentBeatIdx] || jumpCandidates[indexKey] || [];
-        } else {
-            var cross2to1 = crossSimilarity.track2_to_track1 || {};
-            var eternal2 = track2Data.eternal_loop_candidates || {};
-            var crossEdges = cross2to1[currentBeatIdx] || cross2to1[indexKey] || [];
-            var intraEdges = eternal2[currentBeatIdx] || eternal2[indexKey] || [];
-            candidates = crossEdges.concat(
-                intraEdges.map(function(cand) {
-                    return {
-                        source_track: 2,
-                        target_track: 2,
-                        source_index: currentBeatIdx,
-                        target_index: cand.target,
-                        similarity: cand.similarity,
-                        reason: "intra-track"
-                    };
-                })
-            );
-        }
+        var edgesByBeat = jumpGraph[String(trackNum)] || {};
+        var candidates = (edgesByBeat[String(currentBeatIdx)] || []).map(function(edge) {
+            return {
+                source_track: trackNum,
+                target_track: edge.target_track,
+                source_index: currentBeatIdx,
+                target_index: edge.target_index,
+                similarity: edge.similarity
+            };
+        });
 
         var threshold = 0.4;  // Lowered from 0.5 to allow more cross-track jumps
         var beforeFilter = candidates.length;
@@ -6972,14 +7171,10 @@ function updateHudForBeat(beat) {
         clearProcessTimer();
         running = false;
         beatsSinceCross = 0;
-        if (track1Controller) {
-            track1Controller.fadeTo(0, 200);
-            track1Controller.stop();
-        }
-        if (track2Controller) {
-            track2Controller.fadeTo(0, 200);
-            track2Controller.stop();
-        }
+        _.each(controllers, function(controller) {
+            controller.fadeTo(0, 200);
+            controller.stop();
+        });
         if (player && typeof player.stop === "function") {
             try {
                 player.stop();
@@ -7078,17 +7273,20 @@ function updateHudForBeat(beat) {
             currentTrack = 1;
             beatsSinceCross = 0;
 
-            // Start track1 audibly
-            track1Controller.setVolume(0.72);
-            track1Controller.playFrom(track1Data.beats[0] ? track1Data.beats[0].start : 0);
-
-            // Keep track2 paused and ready for crossfading
-            track2Controller.setVolume(0);
-            if (track2Controller.audio) {
-                track2Controller.audio.pause();
-            }
+            // Start track 1 audibly and keep the others paused and ready for crossfading
+            _.each(controllers, function(controller, index) {
+                if (index === 0) {
+                    controller.setVolume(0.72);
+                    controller.playFrom(tracksData[0].beats[0].start);
+                } else {
+                    controller.setVolume(0);
+                    if (controller.audio) {
+                        controller.audio.pause();
+                    }
+                }
+            });
 
-            console.log("[Autoharmonizer] Track 1 started audibly, Track 2 ready for crossfade");
+            console.log("[Autoharmonizer] Track 1 started audibly, other tracks ready for crossfade");
 
             $("#play").text("Pause");
             setPlayingClass(mode);
@@ -7105,8 +7303,9 @@ function updateHudForBeat(beat) {
             }
             running = false;
             clearProcessTimer();
-            track1Controller.pause();
-            track2Controller.pause();
+            _.each(controllers, function(controller) {
+                controller.pause();
+            });
             $("#play").text("Play");
             setPlayingClass(null);
             pulseNotes(baseNoteStrength);
@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+# Keep caches, indexes and metrics written during the run out of backend/var
+os.environ.setdefault("ANALYSIS_STATE_DIR", tempfile.mkdtemp(prefix="analysis-state-"))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def chords(seed, seconds=60.0, sr=44100, chord_seconds=1.5):
+    """A random progression of triads: tonal enough for chroma, beats and sections."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(chord_seconds * sr)) / sr
+    blocks = []
+    for _ in range(int(seconds / chord_seconds)):
+        root = rng.integers(0, 12)
+        freqs = 220.0 * 2.0 ** ((root + np.array([0, 4, 7])) / 12.0)
+        chord = sum(np.sin(2 * np.pi * f * t) for f in freqs) / 3.0
+        click = np.exp(-t * 40.0) * np.sin(2 * np.pi * 1000.0 * t)
+        blocks.append(chord * np.hanning(len(t)) ** 0.25 + 0.5 * click)
+    return (0.4 * np.concatenate(blocks)).astype(np.float32)
+
+
+@pytest.fixture
+def write_song(tmp_path):
+    def write(name="song.wav", seed=1, seconds=60.0, sr=44100):
+        path = tmp_path / name
+        sf.write(path, chords(seed, seconds=seconds, sr=sr), sr)
+        return path
+
+    return write
+
+
+@pytest.fixture
+def no_metrics(monkeypatch):
+    monkeypatch.setenv("ANALYSIS_METRICS_DB", "")
+    monkeypatch.setenv("ANALYSIS_PCM_CACHE_BYTES", "0")
+
+
+@pytest.fixture(scope="session")
+def built_profile(tmp_path_factory):
+    """A real (fast preset) profile of a short song, built once per run."""
+    from backend.analysis.analyze_track import build_profile
+
+    directory = tmp_path_factory.mktemp("profile")
+    audio = directory / "TR0000000001.wav"
+    sf.write(audio, chords(7, seconds=20.0), 44100)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("ANALYSIS_METRICS_DB", "")
+        patch.setenv("ANALYSIS_PCM_CACHE_BYTES", "0")
+        return build_profile(
+            audio_path=audio,
+            track_id="TR0000000001",
+            title="Chords",
+            artist="Tests",
+            audio_url="/media/TR0000000001.wav",
+            output_path=directory / "TR0000000001.json",
+            preset="fast",
+            persist_stages=False,
+        )
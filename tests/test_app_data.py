@@ -0,0 +1,105 @@
+import gzip
+import json
+
+import brotli
+
+import pytest
+
+from backend.analysis import compression, profile_format
+
+app_module = pytest.importorskip("backend.app")
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch, built_profile):
+    monkeypatch.setattr(app_module, "DATA_FOLDER", tmp_path)
+    output = tmp_path / "TR0000000001.json"
+    output.write_text(json.dumps(built_profile))
+    profile_format.write_profile(built_profile, output)
+    profile_format.write_split_profile(built_profile, output)
+    return tmp_path
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "fingerprints.sqlite3",
+        "analysis_metrics.sqlite3",
+        "cache/0123abcd.json",
+        "pcm/0123abcd.44100.npy",
+        "TR0000000001.stages/beats.npz",
+        "TR0000000001.revision.json",
+        "TR0000000001.json.gz",
+        "beat_index/CURRENT",
+    ],
+)
+def test_only_profile_files_are_served(data_dir, client, name):
+    path = data_dir / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"private")
+    assert client.get(f"/data/{name}").status_code == 404
+
+
+def test_profile_forms_are_immutable(data_dir, client):
+    names = [
+        "TR0000000001.json",
+        "TR0000000001.v2.bin",
+        "TR0000000001/core.json",
+        "TR0000000001/core.v2.bin",
+        "TR0000000001/eternal.json",
+    ]
+    for name in names:
+        response = client.get(f"/data/{name}", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200, name
+        assert response.cache_control.immutable
+        assert response.cache_control.max_age == app_module.STATIC_CACHE_SECONDS
+
+
+def test_v2_is_negotiated(data_dir, client):
+    response = client.get("/data/TR0000000001.json", headers={"Accept": profile_format.MEDIA_TYPE})
+    assert response.mimetype == profile_format.MEDIA_TYPE
+    assert profile_format.decode_profile(response.data)["response"]["track"]["id"] == "TR0000000001"
+    assert "Accept" in response.headers["Vary"]
+    assert client.get("/data/TR0000000001.json").mimetype == "application/json"
+
+
+def test_split_documents_negotiate_v2(data_dir, client):
+    headers = {"Accept": profile_format.MEDIA_TYPE}
+    core = client.get("/data/TR0000000001/core.json", headers=headers)
+    assert core.mimetype == profile_format.MEDIA_TYPE
+    analysis = profile_format.decode_profile(core.data)["response"]["track"]["analysis"]
+    assert analysis["resources"] == {"canon": "canon.json", "eternal": "eternal.json"}
+    eternal = client.get("/data/TR0000000001/eternal.json", headers=headers)
+    assert list(profile_format.decode_profile(eternal.data)) == ["eternal_loop_candidates"]
+
+
+@pytest.mark.parametrize("accept, encoding", [("br, gzip", "br"), ("gzip", "gzip"), ("identity", None)])
+def test_sidecar_and_etag_selection(data_dir, client, accept, encoding):
+    source = data_dir / "TR0000000001.json"
+    compression.write_sidecars(source)
+    response = client.get("/data/TR0000000001.json", headers={"Accept-Encoding": accept})
+    assert response.status_code == 200
+    assert response.headers.get("Content-Encoding") == encoding
+    assert "Accept-Encoding" in response.headers["Vary"]
+    body = {"br": brotli.decompress, "gzip": gzip.decompress, None: bytes}[encoding](response.data)
+    assert body == source.read_bytes()
+    etag = response.headers["ETag"].strip('"')
+    assert etag == compression.strong_etag(source, encoding)
+
+    cached = client.get(
+        "/data/TR0000000001.json", headers={"Accept-Encoding": accept, "If-None-Match": f'"{etag}"'}
+    )
+    assert cached.status_code == 304
+
+
+def test_missing_sidecar_falls_back_to_identity(data_dir, client, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(compression, "schedule_sidecars", lambda paths: scheduled.extend(paths))
+    response = client.get("/data/TR0000000001.json", headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("Content-Encoding") is None
+    assert scheduled == [data_dir / "TR0000000001.json"]
@@ -0,0 +1,53 @@
+import copy
+import json
+
+from backend.analysis import analyze_track
+from backend.analysis.analyze_track import build_set_profile
+
+
+def _member(profile, track_id, beats):
+    member = copy.deepcopy(profile)
+    track = member["response"]["track"]
+    track["id"] = track_id
+    track["analysis"]["beats"] = track["analysis"]["beats"][beats]
+    return member
+
+
+def test_set_profile_references_tracks_and_graphs_all_of_them(built_profile, tmp_path):
+    members = [
+        _member(built_profile, "TR1", slice(None)),
+        _member(built_profile, "TR2", slice(2, None)),
+        _member(built_profile, "TR3", slice(None, -3)),
+    ]
+    output = tmp_path / "SET.json"
+    build_set_profile(
+        [tmp_path / f"TR{n}.json" for n in (1, 2, 3)],
+        "SET",
+        output,
+        profiles=members,
+        cache_dir=tmp_path / "cross",
+    )
+    with output.open(encoding="utf-8") as f:
+        data = json.load(f)["response"]["track"]["analysis"]["autoharmonizer"]
+
+    assert [track["id"] for track in data["tracks"]] == ["TR1", "TR2", "TR3"]
+    assert (data["track1"], data["track2"]) == (0, 1)
+
+    graph = data["jump_graph"]
+    assert set(graph) == {"1", "2", "3"}
+    targets = set()
+    for number, edges_by_beat in graph.items():
+        n_beats = len(data["tracks"][int(number) - 1]["beats"])
+        assert all(int(beat) < n_beats for beat in edges_by_beat)
+        for edges in edges_by_beat.values():
+            similarities = [edge["similarity"] for edge in edges]
+            assert similarities == sorted(similarities, reverse=True)
+            for edge in edges:
+                targets.add((int(number), edge["target_track"]))
+                assert edge["target_index"] < len(data["tracks"][edge["target_track"] - 1]["beats"])
+    # every track can reach every other one
+    assert {(a, b) for a in (1, 2, 3) for b in (1, 2, 3) if a != b} <= targets
+
+
+def test_cross_track_cache_is_not_served():
+    assert analyze_track.CROSS_TRACK_CACHE_DIR.parent == analyze_track.DEFAULT_STATE_DIR
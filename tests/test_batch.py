@@ -0,0 +1,40 @@
+import json
+
+from backend.analysis import batch
+
+
+def _jobs(tmp_path, *audio):
+    return batch.collect_jobs([str(path) for path in audio], None, tmp_path / "data", "artist", "/media/")
+
+
+def test_run_skip_and_report(tmp_path, write_song, no_metrics):
+    jobs = _jobs(tmp_path, write_song("TR0000000001.wav", seconds=12.0))
+    (result,) = batch.run_batch(jobs, workers=1, preset="fast")
+    assert result.status == "ok", result.error
+    assert "beats" in result.stages
+    output = tmp_path / "data" / "TR0000000001.json"
+    assert batch.is_current(output, "fast")
+    assert not batch.is_current(output, "standard")
+    assert not list(output.parent.glob(".*.tmp"))
+
+    (again,) = batch.run_batch(jobs, workers=1, preset="fast")
+    assert again.status == "skipped"
+    report = batch.summarize([result, again], 1.0, "fast")
+    assert report["counts"] == {"ok": 1, "skipped": 1}
+    json.dumps(report)
+
+
+def test_timeout_terminates_the_worker(tmp_path, write_song, no_metrics):
+    slow = write_song("TR0000000001.wav", seconds=240.0)
+    quick = write_song("TR0000000002.wav", seed=2, seconds=3.0)
+    results = batch.run_batch(_jobs(tmp_path, slow, quick), workers=1, timeout=3.0, preset="standard")
+    status = {result.track_id: result.status for result in results}
+    assert status == {"TR0000000001": "timeout", "TR0000000002": "ok"}
+    assert not (tmp_path / "data" / "TR0000000001.json").exists()
+    assert not list((tmp_path / "data").glob(".TR0000000001*.tmp"))
+
+
+def test_truncated_profile_is_not_current(tmp_path):
+    output = tmp_path / "TR0000000001.json"
+    output.write_text('{"response": {"track": {"analysis": {"version"')
+    assert not batch.is_current(output, "fast")
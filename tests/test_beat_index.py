@@ -0,0 +1,128 @@
+import copy
+import json
+
+import numpy as np
+import pytest
+
+from backend.analysis import analyze_track, beat_index
+from backend.analysis.analyze_track import BeatFeatures
+
+
+def _write(data_dir, track_id, profile, beats=slice(None), preview=False):
+    profile = copy.deepcopy(profile)
+    track = profile["response"]["track"]
+    track["id"] = track_id
+    track["analysis"]["beats"] = track["analysis"]["beats"][beats]
+    if preview:
+        track["analysis"].update(preview=True, revision=1)
+    (data_dir / f"{track_id}.json").write_text(json.dumps(profile))
+    return profile
+
+
+@pytest.fixture
+def library(tmp_path, built_profile):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    profiles = {
+        "TR1": _write(data_dir, "TR1", built_profile),
+        "TR2": _write(data_dir, "TR2", built_profile, slice(2, None)),
+    }
+    # autoharmonizer sets only repeat their members
+    _write(data_dir, "TR1+TR2", built_profile)
+    return data_dir, tmp_path / "index", profiles
+
+
+def test_index_is_not_served():
+    assert beat_index.INDEX_DIR.parent == analyze_track.DEFAULT_STATE_DIR
+
+
+def test_previews_wait_for_their_refinement(library, built_profile):
+    data_dir, index_dir, _ = library
+    _write(data_dir, "TR3", built_profile, preview=True)
+    beat_index.build_index(data_dir, index_dir)
+    assert "TR3" not in beat_index.open_index(index_dir)
+
+    _write(data_dir, "TR3", built_profile)
+    beat_index.build_index(data_dir, index_dir)
+    assert "TR3" in beat_index.open_index(index_dir)
+
+
+def _brute_force(profiles, query, k, exclude):
+    rows = []
+    for track_id, profile in profiles.items():
+        if track_id == exclude:
+            continue
+        vectors = BeatFeatures.from_profile(profile).vectors
+        rows += [(float(score), track_id, beat) for beat, score in enumerate(vectors @ query)]
+    return sorted(rows, key=lambda row: -row[0])[:k]
+
+
+def test_build_and_query_match_brute_force(library):
+    data_dir, index_dir, profiles = library
+    beat_index.build_index(data_dir, index_dir)
+    index = beat_index.open_index(index_dir)
+    assert [track["id"] for track in index.tracks] == ["TR1", "TR2"]
+    assert len(index) == sum(len(BeatFeatures.from_profile(p).starts) for p in profiles.values())
+
+    matches = index.neighbors("TR1", 5, k=5)
+    # TR2 holds the same beats shifted by two
+    assert (matches[0].track_id, matches[0].beat) == ("TR2", 3)
+    assert matches[0].similarity > 0.99
+    assert [m.similarity for m in matches] == sorted((m.similarity for m in matches), reverse=True)
+
+    query = BeatFeatures.from_profile(profiles["TR1"]).vectors[5]
+    expected = _brute_force(profiles, query, 5, exclude="TR1")
+    np.testing.assert_allclose([m.similarity for m in matches], [row[0] for row in expected], atol=0.02)
+
+    own = index.neighbors("TR1", 5, k=3, same_track=True)
+    assert all((m.track_id, m.beat) != ("TR1", 5) for m in own)
+    with pytest.raises(IndexError):
+        index.vector("TR1", 10_000)
+
+
+@pytest.mark.parametrize("dtype", beat_index.INDEX_DTYPES)
+def test_ivf_probing_every_list_is_exact(library, dtype):
+    data_dir, index_dir, _ = library
+    beat_index.build_index(data_dir, index_dir, dtype=dtype, ivf_lists=4)
+    index = beat_index.open_index(index_dir)
+    assert index.centroids is not None and index.vectors.dtype == np.dtype(dtype)
+    exact = index.neighbors("TR2", 7, k=8)
+    ivf = index.neighbors("TR2", 7, k=8, mode="ivf", nprobe=4)
+    assert [(m.track_id, m.beat) for m in ivf] == [(m.track_id, m.beat) for m in exact]
+
+
+def test_update_reuses_unchanged_tracks_and_keeps_old_generations_readable(library, built_profile, capsys):
+    data_dir, index_dir, _ = library
+    first = beat_index.build_index(data_dir, index_dir, ivf_lists=4)
+    old = beat_index.open_index(index_dir)
+    _write(data_dir, "TR3", built_profile, slice(None, -4))
+    capsys.readouterr()
+
+    second = beat_index.build_index(data_dir, index_dir)
+    assert "(1 read, 2 reused)" in capsys.readouterr().out
+    index = beat_index.open_index(index_dir)
+    assert index.generation == second.name != first.name
+    assert "TR3" in index and "TR3" not in old
+    assert index.centroids is not None  # the live IVF is kept
+    np.testing.assert_array_equal(index.vector("TR1", 3), old.vector("TR1", 3))
+    assert old.neighbors("TR1", 3, k=1)
+
+    beat_index.build_index(data_dir, index_dir)
+    generations = [path for path in index_dir.iterdir() if path.is_dir()]
+    assert len(generations) == beat_index.KEEP_GENERATIONS
+
+
+def test_similar_beats_endpoint(library, monkeypatch):
+    app_module = pytest.importorskip("backend.app")
+    data_dir, index_dir, _ = library
+    monkeypatch.setattr(app_module, "DATA_FOLDER", data_dir)
+    monkeypatch.setattr(app_module, "BEAT_INDEX_FOLDER", index_dir)
+    beat_index.build_index(data_dir, index_dir)
+    client = app_module.app.test_client()
+
+    response = client.get("/api/similar-beats?track=TR1&beat=5&k=3")
+    assert response.status_code == 200
+    assert response.get_json()["matches"][0]["track_id"] == "TR2"
+    assert client.get("/api/similar-beats?track=TR9&beat=0").status_code == 404
+    assert client.get("/api/similar-beats?track=TR1&beat=x").status_code == 400
+    assert client.get("/api/similar-beats?track=TR1&beat=10000").status_code == 400
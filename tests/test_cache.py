@@ -0,0 +1,84 @@
+import io
+import json
+
+import pytest
+
+from backend.analysis import cache
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", tmp_path / "cache")
+    data_dir = tmp_path / "data"
+    upload_dir = tmp_path / "uploads"
+    data_dir.mkdir()
+    upload_dir.mkdir()
+    return data_dir, upload_dir
+
+
+def _upload(upload_dir, name="TR0000000001.wav", payload=b"RIFF fake audio"):
+    path = upload_dir / name
+    digest = cache.save_and_hash(io.BytesIO(payload), path, chunk_size=4)
+    return path, digest
+
+
+def test_save_and_hash_matches_hash_file(dirs):
+    _, upload_dir = dirs
+    path, digest = _upload(upload_dir)
+    assert path.read_bytes() == b"RIFF fake audio"
+    assert cache.hash_file(path) == digest
+
+
+def test_key_depends_on_audio_and_parameters():
+    key = cache.cache_key("abc", {"version": "1"})
+    assert key == cache.cache_key("abc", {"version": "1"})
+    assert key != cache.cache_key("abd", {"version": "1"})
+    assert key != cache.cache_key("abc", {"version": "2"})
+
+
+def test_miss_then_hit(dirs):
+    data_dir, upload_dir = dirs
+    path, digest = _upload(upload_dir)
+    key = cache.cache_key(digest, {"version": "1"})
+    assert cache.lookup(key, data_dir=data_dir, upload_dir=upload_dir) is None
+
+    (data_dir / "TR0000000001.json").write_text("{}")
+    cache.remember(key, "TR0000000001", path, upload_dir=upload_dir)
+    entry = cache.lookup(key, data_dir=data_dir, upload_dir=upload_dir)
+    assert entry == {"track_id": "TR0000000001", "audio_file": "TR0000000001.wav"}
+
+
+def test_entry_has_no_absolute_path(dirs):
+    data_dir, upload_dir = dirs
+    path, digest = _upload(upload_dir)
+    key = cache.cache_key(digest, {"version": "1"})
+    cache.remember(key, "TR0000000001", path, upload_dir=upload_dir)
+    raw = (cache.CACHE_DIR / f"{key}.json").read_text()
+    assert str(upload_dir) not in raw
+    assert not cache.CACHE_DIR.is_relative_to(data_dir)
+
+
+@pytest.mark.parametrize("removed", ["profile", "audio"])
+def test_stale_entry_is_a_miss_and_dropped(dirs, removed):
+    data_dir, upload_dir = dirs
+    path, digest = _upload(upload_dir)
+    profile = data_dir / "TR0000000001.json"
+    profile.write_text("{}")
+    key = cache.cache_key(digest, {"version": "1"})
+    cache.remember(key, "TR0000000001", path, upload_dir=upload_dir)
+
+    stages = data_dir / "TR0000000001.stages"
+    stages.mkdir()
+    (profile if removed == "profile" else path).unlink()
+    assert cache.lookup(key, data_dir=data_dir, upload_dir=upload_dir) is None
+    assert not (cache.CACHE_DIR / f"{key}.json").exists()
+    assert not stages.exists()
+
+
+def test_corrupt_entry_is_a_miss(dirs):
+    data_dir, upload_dir = dirs
+    cache.CACHE_DIR.mkdir()
+    (cache.CACHE_DIR / "deadbeef.json").write_text("{not json")
+    assert cache.lookup("deadbeef", data_dir=data_dir, upload_dir=upload_dir) is None
+    (cache.CACHE_DIR / "deadbeef.json").write_text(json.dumps({"track_id": "TR1"}))
+    assert cache.lookup("deadbeef", data_dir=data_dir, upload_dir=upload_dir) is None
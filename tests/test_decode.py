@@ -0,0 +1,58 @@
+import librosa
+import numpy as np
+import pytest
+import soundfile as sf
+
+from backend.analysis import analyze_track, decode
+
+from conftest import chords as _chords
+
+SR = 44100
+
+
+@pytest.fixture
+def stereo_song(tmp_path):
+    left, right = _chords(1, seconds=8.0), _chords(2, seconds=8.0)
+    path = tmp_path / "stereo.flac"
+    sf.write(path, np.stack([left, right], axis=1), SR)
+    return path
+
+
+def test_cache_lives_outside_the_served_data_dir():
+    assert decode.PCM_CACHE_DIR.parent == analyze_track.DEFAULT_STATE_DIR
+    assert analyze_track.DEFAULT_DATA_DIR not in decode.PCM_CACHE_DIR.parents
+
+
+@pytest.mark.parametrize("quota", [0, 1 << 30])
+@pytest.mark.parametrize("sample_rate", [None, 22050])
+def test_mono_matches_librosa(stereo_song, tmp_path, quota, sample_rate):
+    expected, expected_sr = librosa.load(stereo_song, sr=sample_rate, mono=True, res_type="soxr_hq")
+    cache_dir = tmp_path / "pcm"
+    for _ in range(2):  # decode, then (when cached) the memory-mapped entry
+        audio = decode.decode(stereo_song, sample_rate=sample_rate, cache_dir=cache_dir, quota=quota)
+        assert (audio.sr, audio.channels) == (expected_sr, 1)
+        np.testing.assert_allclose(audio.samples, expected, atol=1e-6)
+    assert len(list(cache_dir.glob("*.npy"))) == (0 if quota == 0 else 1 + (sample_rate is not None))
+
+
+def test_stereo_matches_librosa(stereo_song, tmp_path):
+    expected, _ = librosa.load(stereo_song, sr=32000, mono=False, res_type="soxr_hq")
+    for _ in range(2):
+        audio = decode.decode(stereo_song, sample_rate=32000, cache_dir=tmp_path / "pcm", quota=1 << 30, channels=2)
+        assert audio.samples.shape == expected.T.shape
+        np.testing.assert_allclose(audio.samples, expected.T, atol=1e-6)
+    assert audio.slice(1.0, 2.0).shape == (32000, 2)
+
+
+def test_mono_source_is_duplicated_for_stereo(write_song, tmp_path):
+    path = write_song(seconds=4.0)
+    mono = decode.decode(path, cache_dir=tmp_path / "pcm", quota=1 << 30)
+    stereo = decode.decode(path, cache_dir=tmp_path / "pcm", quota=1 << 30, channels=2)
+    np.testing.assert_array_equal(stereo.samples, np.stack([mono.samples, mono.samples], axis=1))
+
+
+def test_int16_entries_round_to_the_float_samples(stereo_song, tmp_path):
+    exact = decode.decode(stereo_song, quota=0)
+    stored = decode.decode(stereo_song, dtype="int16", cache_dir=tmp_path / "pcm", quota=1 << 30)
+    assert stored.samples.dtype == np.int16
+    np.testing.assert_allclose(stored.as_float(), exact.samples, atol=1.0 / 32768)
@@ -0,0 +1,123 @@
+import sqlite3
+
+import numpy as np
+import pytest
+import soundfile as sf
+import soxr
+
+from backend.analysis import fingerprint
+from backend.analysis.analyze_track import load_features
+
+from conftest import chords as _chords
+
+SR = 44100
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch, no_metrics):
+    monkeypatch.setattr(fingerprint, "DB_PATH", tmp_path / "fingerprints.sqlite3")
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    return tmp_path, data_dir
+
+
+def _fingerprint(path):
+    return fingerprint.compute_fingerprint(load_features(path))
+
+
+def _register(tmp_path, data_dir, track_id, samples, sr):
+    path = tmp_path / f"{track_id}.wav"
+    sf.write(path, samples, sr)
+    (data_dir / f"{track_id}.json").write_text("{}")
+    fingerprint.register(track_id, _fingerprint(path), path, source=f"https://example.com/{track_id}")
+    return path
+
+
+def test_resampled_copy_matches(index):
+    tmp_path, data_dir = index
+    song = _chords(1)
+    _register(tmp_path, data_dir, "TR0000000001", song, SR)
+    _register(tmp_path, data_dir, "TR0000000002", _chords(2), SR)
+
+    copy = tmp_path / "copy.wav"
+    sf.write(copy, 0.8 * soxr.resample(song, SR, 32000), 32000)
+    match = fingerprint.find_match(_fingerprint(copy), data_dir=data_dir)
+    assert match is not None
+    assert match["track_id"] == "TR0000000001"
+    assert match["confidence"] >= fingerprint.FINGERPRINT_MATCH_THRESHOLD
+
+
+def test_different_song_does_not_match(index):
+    tmp_path, data_dir = index
+    _register(tmp_path, data_dir, "TR0000000001", _chords(1), SR)
+    other = tmp_path / "other.wav"
+    sf.write(other, _chords(3), SR)
+    assert fingerprint.find_match(_fingerprint(other), data_dir=data_dir) is None
+
+
+def test_find_by_source_skips_missing_profiles(index):
+    tmp_path, data_dir = index
+    _register(tmp_path, data_dir, "TR0000000001", _chords(1, seconds=15.0), SR)
+    assert fingerprint.find_by_source("https://example.com/TR0000000001", data_dir=data_dir)["track_id"] == "TR0000000001"
+    (data_dir / "TR0000000001.json").unlink()
+    assert fingerprint.find_by_source("https://example.com/TR0000000001", data_dir=data_dir) is None
+
+
+def test_signature_ignores_non_chroma_settings():
+    assert fingerprint._analysis_signature("standard") == fingerprint._analysis_signature("hq")
+    assert fingerprint._analysis_signature("standard") != fingerprint._analysis_signature("fast")
+
+
+def test_sequence_similarity_matches_full_cross_matrix():
+    rng = np.random.default_rng(0)
+    a = rng.integers(0, 256, (90, 12)).astype(np.uint8)
+    b = np.roll(a, 5, axis=0)[:80]
+    unit_a = fingerprint._centered_unit_rows(a.astype(np.float64))
+    unit_b = fingerprint._centered_unit_rows(b.astype(np.float64))
+    cross = unit_a @ unit_b.T
+    needed = int(fingerprint.FINGERPRINT_MIN_OVERLAP * 80)
+    expected = max(
+        np.diagonal(cross, offset=lag).mean()
+        for lag in range(-20, 21)
+        if np.diagonal(cross, offset=lag).size >= needed
+    )
+    assert fingerprint.sequence_similarity(a, b) == pytest.approx(expected, abs=1e-12)
+    assert fingerprint.sequence_similarity(a, a) == pytest.approx(1.0)
+
+
+def test_preview_fingerprint_needs_a_compatible_final_preset(index):
+    tmp_path, data_dir = index
+    path = tmp_path / "TR0000000001.wav"
+    sf.write(path, _chords(1), SR)
+    (data_dir / "TR0000000001.json").write_text("{}")
+    preview = fingerprint.compute_fingerprint(load_features(path, preset="fast"))
+    fingerprint.register("TR0000000001", preview, path, preset="fast")
+    assert fingerprint.find_match(preview, data_dir=data_dir, preset="fast")["track_id"] == "TR0000000001"
+    assert fingerprint.find_match(preview, data_dir=data_dir, preset="fast", indexed_for="standard") is None
+
+    fingerprint.register("TR0000000001", _fingerprint(path), path, preset="standard")
+    match = fingerprint.find_match(preview, data_dir=data_dir, preset="fast", indexed_for="standard")
+    assert match["track_id"] == "TR0000000001"
+
+
+def test_single_signature_index_is_migrated(index):
+    tmp_path, _ = index
+    conn = sqlite3.connect(fingerprint.DB_PATH)
+    conn.execute(
+        """
+        CREATE TABLE fingerprints (
+            track_id TEXT PRIMARY KEY, signature TEXT NOT NULL, duration REAL NOT NULL,
+            summary BLOB NOT NULL, windows BLOB NOT NULL, audio_path TEXT NOT NULL,
+            source TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute("INSERT INTO fingerprints VALUES ('TR1', 'sig', 1.0, x'00', x'00', '/a.wav', NULL, NULL)")
+    conn.commit()
+    conn.close()
+
+    fingerprint.init_db()
+    with fingerprint.db_cursor() as cur:
+        rows = cur.execute("SELECT track_id, signature FROM fingerprints").fetchall()
+        cur.execute("INSERT INTO fingerprints VALUES ('TR1', 'other', 1.0, x'00', x'00', '/a.wav', NULL, NULL)")
+    assert [tuple(row) for row in rows] == [("TR1", "sig")]
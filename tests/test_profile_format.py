@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from backend.analysis import profile_format
+
+
+def assert_close(actual, expected, path="profile"):
+    """Equal up to the float32 precision v2 stores features and similarities in."""
+    if isinstance(expected, float) or isinstance(actual, float):
+        assert actual == pytest.approx(expected, rel=1e-6, abs=1e-6), path
+    elif isinstance(expected, dict):
+        assert list(actual) == list(expected), path
+        for key in expected:
+            assert_close(actual[key], expected[key], f"{path}.{key}")
+    elif isinstance(expected, list):
+        assert len(actual) == len(expected), path
+        for index, (left, right) in enumerate(zip(actual, expected)):
+            assert_close(left, right, f"{path}[{index}]")
+    else:
+        assert actual == expected, path
+
+
+@pytest.fixture
+def profile(built_profile):
+    # what a client reads back from the legacy JSON
+    return json.loads(json.dumps(built_profile))
+
+
+def test_full_profile_round_trip(profile):
+    blob = profile_format.encode_profile(profile)
+    assert blob[:4] == profile_format.MAGIC
+    assert_close(profile_format.decode_profile(blob), profile)
+    assert len(blob) < len(json.dumps(profile))
+
+
+def test_split_documents_round_trip(profile):
+    core, resources = profile_format.split_profile(profile)
+    assert_close(profile_format.decode_profile(profile_format.encode_profile(core)), core)
+    for name, resource in resources.items():
+        assert_close(profile_format.decode_profile(profile_format.encode_resource(resource)), resource, name)
+
+
+def test_write_and_read(tmp_path, profile):
+    json_path = tmp_path / "TR0000000001.json"
+    assert profile_format.write_profile(profile, json_path) == tmp_path / "TR0000000001.v2.bin"
+    assert_close(profile_format.read_profile(tmp_path / "TR0000000001.v2.bin"), profile)
+
+    paths = profile_format.write_split_profile(profile, json_path)
+    assert [path.name for path in paths] == ["core.json", "canon.json", "eternal.json"]
+    for path in paths:
+        assert_close(
+            profile_format.read_profile(profile_format.v2_path(path)),
+            json.loads(path.read_text()),
+            path.name,
+        )
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+def test_rejects_other_data():
+    with pytest.raises(ValueError):
+        profile_format.decode_profile(b"{}" * 8)
@@ -0,0 +1,164 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+import soundfile as sf
+import soxr
+
+from backend.analysis import fingerprint, progressive
+
+from conftest import chords as _chords
+
+app_module = pytest.importorskip("backend.app")
+
+
+def _analysis(path):
+    with path.open(encoding="utf-8") as f:
+        return json.load(f)["response"]["track"]["analysis"]
+
+
+def test_preview_is_refined_in_place(write_song, tmp_path, no_metrics):
+    audio = write_song(seconds=20.0)
+    output = tmp_path / "data" / "TR1.json"
+    args = (audio, "TR1", "Song", "Tests", "/media/song.wav", output)
+
+    progressive.build_preview(*args)
+    record = progressive.read_revision(output)
+    assert progressive.public_record(record) == {"revision": 1, "state": "refining"}
+    assert record["pid"] == os.getpid()
+    assert progressive.is_preview(output)
+    preview = _analysis(output)
+    assert (preview["revision"], preview["preview"]) == (1, True)
+
+    progressive.refine(*args, preset="standard")
+    assert progressive.read_revision(output) == {"revision": 2, "state": "final"}
+    assert not progressive.is_preview(output)
+    final = _analysis(output)
+    assert (final["revision"], final["preview"]) == (2, False)
+    assert final["canon_alignment"]
+    # no stage directories and no scratch directories are left behind
+    assert sorted(path.name for path in output.parent.iterdir() if path.is_dir()) == ["TR1"]
+
+
+def test_data_is_not_immutable_while_refining(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "DATA_FOLDER", tmp_path)
+    output = tmp_path / "TR1.json"
+    output.write_text("{}")
+    client = app_module.app.test_client()
+
+    progressive.write_revision(output, 1, "refining")
+    response = client.get("/data/TR1.json")
+    assert response.cache_control.no_cache
+    assert not response.cache_control.immutable
+
+    progressive.write_revision(output, 2, "final")
+    assert client.get("/data/TR1.json").cache_control.immutable
+
+
+def test_progressive_upload_of_a_known_song_is_reused(tmp_path, monkeypatch, no_metrics):
+    data_dir, upload_dir = tmp_path / "data", tmp_path / "uploads"
+    data_dir.mkdir()
+    upload_dir.mkdir()
+    monkeypatch.setattr(app_module, "DATA_FOLDER", data_dir)
+    monkeypatch.setattr(app_module, "UPLOAD_FOLDER", upload_dir)
+    monkeypatch.setattr(fingerprint, "DB_PATH", tmp_path / "fingerprints.sqlite3")
+
+    song = _chords(5, seconds=30.0)
+    original = upload_dir / "TR1.wav"
+    sf.write(original, song, 44100)
+    copy = upload_dir / "TR2.wav"
+    sf.write(copy, 0.8 * soxr.resample(song, 44100, 32000), 32000)
+
+    with app_module.app.test_request_context():
+        track_id, profile = app_module._analyze_or_reuse(
+            original, "digest-1", "TR1", "Song", "Tests", progressive=True
+        )
+        assert (track_id, profile["response"]["track"]["analysis"]["preview"]) == ("TR1", True)
+        deadline = time.monotonic() + 120
+        while progressive._pending:  # refinement and publishing
+            assert time.monotonic() < deadline
+            time.sleep(0.2)
+        assert progressive.read_revision(data_dir / "TR1.json")["state"] == "final"
+
+        track_id, profile = app_module._analyze_or_reuse(
+            copy, "digest-2", "TR2", "Song", "Tests", progressive=True
+        )
+    assert (track_id, profile) == ("TR1", None)
+    assert not copy.exists()
+    assert not (data_dir / "TR2.json").exists()
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    return process.pid
+
+
+def _interrupted(output, audio, **stamp):
+    progressive.write_revision(output, 1, "refining")
+    record = progressive.read_revision(output)
+    record.update(
+        job={
+            "track_id": output.stem,
+            "audio_path": str(audio),
+            "title": "Song",
+            "artist": "Tests",
+            "audio_url": "/media/song.wav",
+            "preset": "standard",
+            "context": {"key": "digest"},
+        },
+        **stamp,
+    )
+    progressive.revision_path(output).write_text(json.dumps(record))
+
+
+def test_stale_refinements_are_rescheduled(tmp_path, monkeypatch):
+    audio = tmp_path / "song.wav"
+    audio.write_bytes(b"")
+    scheduled = []
+    monkeypatch.setattr(progressive, "schedule_refinement", lambda *args, **kwargs: scheduled.append(args))
+
+    live = tmp_path / "TR1.json"
+    _interrupted(live, audio, pid=os.getppid())
+    dead = tmp_path / "TR2.json"
+    _interrupted(dead, audio, pid=_dead_pid())
+    overdue = tmp_path / "TR3.json"
+    _interrupted(overdue, audio, pid=os.getppid(), started_at=time.time() - 2 * progressive.refine_deadline())
+    restarted = tmp_path / "TR4.json"  # same pid as the process that wrote it, but no worker
+    _interrupted(restarted, audio)
+
+    assert progressive.resume_all_stale(tmp_path) == ["TR2", "TR3", "TR4"]
+    assert [args[1] for args in scheduled] == ["TR2", "TR3", "TR4"]
+    assert scheduled[0][0] == audio and scheduled[0][5] == dead
+    assert progressive.read_revision(live)["state"] == "refining"
+    assert progressive.read_revision(dead)["state"] == "failed"
+
+    audio.unlink()  # nothing left to refine from
+    _interrupted(dead, audio, pid=_dead_pid())
+    assert progressive.resume_stale(dead)
+    assert len(scheduled) == 3
+    assert progressive.read_revision(dead)["error"] == "refinement was interrupted"
+
+
+def test_status_resumes_an_interrupted_refinement(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "DATA_FOLDER", tmp_path)
+    audio = tmp_path / "song.wav"
+    audio.write_bytes(b"")
+    output = tmp_path / "TR0000000001.json"
+    output.write_text("{}")
+    _interrupted(output, audio, pid=_dead_pid())
+    scheduled = []
+    monkeypatch.setattr(progressive, "schedule_refinement", lambda *args, **kwargs: scheduled.append(kwargs))
+
+    response = app_module.app.test_client().get("/api/process/status/TR0000000001")
+    assert response.get_json() == {
+        "trackId": "TR0000000001",
+        "revision": 1,
+        "state": "failed",
+        "error": "refinement was interrupted",
+    }
+    (kwargs,) = scheduled
+    assert kwargs["preset"] == "standard" and callable(kwargs["on_done"])
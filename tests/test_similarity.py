@@ -0,0 +1,44 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from backend.analysis.analyze_track import BlockedSimilarity
+
+
+def _dense_statistics(matrix, threshold):
+    unit = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    ssm = np.clip(unit @ unit.T, -1.0, 1.0)
+    np.fill_diagonal(ssm, 1.0)
+    ssm = ssm.astype(np.float32).astype(np.float64)
+    diagonals = [np.diag(ssm, k=offset) for offset in range(len(ssm))]
+    return (
+        np.array([diag.sum() for diag in diagonals]),
+        np.array([(diag * diag).sum() for diag in diagonals]),
+        np.array([np.count_nonzero(diag >= threshold) for diag in diagonals]),
+    )
+
+
+@pytest.mark.parametrize("memory_budget", [1 << 12, 1 << 16, 1 << 26])
+def test_diagonal_statistics_match_the_dense_matrix(memory_budget):
+    matrix = np.random.default_rng(0).normal(size=(150, 24))
+    similarity = BlockedSimilarity(matrix, memory_budget=memory_budget)
+    for got, expected in zip(similarity.diagonal_statistics(0.2), _dense_statistics(matrix, 0.2)):
+        np.testing.assert_allclose(got, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_diagonal_statistics_stay_within_the_memory_budget():
+    n_beats, budget = 2000, 16 << 20
+    similarity = BlockedSimilarity(np.random.default_rng(1).normal(size=(n_beats, 96)), memory_budget=budget)
+    assert similarity.block_rows < n_beats
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        similarity.diagonal_statistics(0.5)
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    # the per-offset results and numpy's fixed-size ufunc buffers come on top of the tiles
+    assert peak <= budget + 3 * n_beats * 8 + (128 << 10)
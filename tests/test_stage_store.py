@@ -0,0 +1,91 @@
+import zipfile
+
+import numpy as np
+import pytest
+
+from backend.analysis import analyze_track
+from backend.analysis.analyze_track import StageStore, build_profile
+
+
+def test_key_tracks_version_params_and_inputs(monkeypatch):
+    key = StageStore.key("canon", {"threshold": 0.5}, "beats-key")
+    assert key == StageStore.key("canon", {"threshold": 0.5}, "beats-key")
+    assert key != StageStore.key("canon", {"threshold": 0.6}, "beats-key")
+    assert key != StageStore.key("canon", {"threshold": 0.5}, "other-beats-key")
+    monkeypatch.setitem(analyze_track.STAGE_VERSIONS, "canon", analyze_track.STAGE_VERSIONS["canon"] + 1)
+    assert key != StageStore.key("canon", {"threshold": 0.5}, "beats-key")
+
+
+def test_save_load_round_trip_is_compressed(tmp_path):
+    store = StageStore(tmp_path / "TR1.stages")
+    arrays = {"start": np.zeros(4096), "label": np.asarray("beats")}
+    store.save("beats", "k1", arrays)
+    with zipfile.ZipFile(store.path("beats")) as archive:
+        assert {info.compress_type for info in archive.infolist()} == {zipfile.ZIP_DEFLATED}
+    loaded = store.load("beats", "k1")
+    assert set(loaded) == {"start", "label"}
+    np.testing.assert_array_equal(loaded["start"], arrays["start"])
+    assert store.load("beats", "k2") is None
+    assert store.load("canon", "k1") is None
+
+
+def test_run_reuses_only_matching_key(tmp_path):
+    store = StageStore(tmp_path / "TR1.stages")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 3.0
+
+    encode = lambda value: {"value": np.asarray(value)}
+    decode = lambda arrays: float(arrays["value"])
+    assert store.run("beats", "k1", compute, encode, decode) == 3.0
+    assert store.run("beats", "k1", compute, encode, decode) == 3.0
+    assert len(calls) == 1
+    store.run("beats", "k2", compute, encode, decode)
+    assert len(calls) == 2
+
+
+def test_disabled_store_persists_nothing(tmp_path):
+    store = StageStore(None)
+    store.save("beats", "k1", {"value": np.zeros(1)})
+    assert store.load("beats", "k1") is None
+    assert not any(tmp_path.iterdir())
+
+
+def test_discard_removes_stage_dir(tmp_path):
+    output = tmp_path / "TR1.json"
+    StageStore(output.with_suffix(".stages")).save("beats", "k1", {"value": np.zeros(1)})
+    StageStore.discard(output)
+    assert not output.with_suffix(".stages").exists()
+    StageStore.discard(output)  # already gone
+
+
+def _build(audio, output):
+    return build_profile(
+        audio_path=audio,
+        track_id="TR0000000001",
+        title="t",
+        artist="a",
+        audio_url="/media/song.wav",
+        output_path=output,
+        preset="fast",
+    )
+
+
+def _cached(profile):
+    stages = profile["response"]["track"]["analysis"]["timings"]["stages"]
+    return {name for name, timing in stages.items() if timing["cached"]}
+
+
+def test_rebuild_recomputes_only_invalidated_stages(tmp_path, monkeypatch, write_song, no_metrics):
+    audio = write_song(seconds=30.0)
+    output = tmp_path / "TR0000000001.json"
+    first = _build(audio, output)
+    assert _cached(first) == set()
+
+    monkeypatch.setitem(analyze_track.STAGE_VERSIONS, "canon", analyze_track.STAGE_VERSIONS["canon"] + 1)
+    second = _build(audio, output)
+    assert {"features", "beats", "sections", "segments", "loops"} <= _cached(second)
+    assert "canon" not in _cached(second)
+    assert second["response"]["track"]["analysis"]["beats"] == first["response"]["track"]["analysis"]["beats"]
@@ -0,0 +1,87 @@
+import sqlite3
+import threading
+import time
+
+from backend.analysis import analyze_track, timings
+
+
+def _spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_metrics_db_lives_outside_the_served_data_dir():
+    assert timings.DEFAULT_METRICS_DB.parent == analyze_track.DEFAULT_STATE_DIR
+
+
+def test_parallel_stages_are_charged_their_own_cpu():
+    profiler = timings.StageProfiler(trace_memory=False)
+
+    def run(name, work):
+        with profiler.stage(name):
+            work(0.3)
+
+    threads = [
+        threading.Thread(target=run, args=("busy", _spin)),
+        threading.Thread(target=run, args=("idle", time.sleep)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stages = profiler.as_dict()["stages"]
+    assert stages["busy"]["thread_cpu_s"] > 0.2
+    assert stages["idle"]["thread_cpu_s"] < 0.05
+    assert stages["idle"]["wall_s"] >= 0.29
+    assert "peak_traced_bytes" not in stages["idle"]
+    assert set(stages["busy"]) >= {"wall_s", "thread_cpu_s", "cached"}
+
+
+def test_traced_peak_is_opt_in():
+    profiler = timings.StageProfiler(trace_memory=True)
+    with profiler.stage("alloc"):
+        block = bytearray(8 << 20)
+    del block
+    assert profiler.as_dict()["stages"]["alloc"]["peak_traced_bytes"] >= 8 << 20
+
+
+def test_record_and_summary(tmp_path):
+    db_path = tmp_path / "metrics.sqlite3"
+    for duration in (60.0, 120.0):
+        profiler = timings.StageProfiler(trace_memory=False)
+        with profiler.stage("beats"):
+            _spin(0.01)
+        with profiler.stage("features") as timing:
+            timing.cached = True
+        timings.record(profiler, "TR1", "v1", "standard", duration, db_path=db_path)
+    preview = timings.StageProfiler(trace_memory=False)
+    with preview.stage("beats"):
+        pass
+    timings.record(preview, "TR1", "v1", "fast", 60.0, preview=True, db_path=db_path)
+
+    (row,) = timings.summary(db_path=db_path)
+    assert (row["version"], row["preset"], row["stage"], row["runs"]) == ("v1", "standard", "beats", 2)
+    assert row["wall_p50_s"] <= row["wall_p95_s"]
+    assert row["wall_per_audio_minute_s"] > 0
+    assert row["thread_cpu_mean_s"] > 0
+    assert timings.summary(version="v2", db_path=db_path) == []
+
+
+def test_rows_with_process_cpu_are_set_aside(tmp_path):
+    db_path = tmp_path / "metrics.sqlite3"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE stage_timings (id INTEGER PRIMARY KEY, cpu_s REAL, max_rss_bytes INTEGER)")
+    conn.execute("INSERT INTO stage_timings (cpu_s, max_rss_bytes) VALUES (1.0, 2)")
+    conn.commit()
+    conn.close()
+
+    profiler = timings.StageProfiler(trace_memory=False)
+    with profiler.stage("beats"):
+        pass
+    timings.record(profiler, "TR1", "v1", "standard", 60.0, db_path=db_path)
+    assert [row["runs"] for row in timings.summary(db_path=db_path)] == [1]
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM stage_timings_process_cpu").fetchone() == (1,)
+    conn.close()